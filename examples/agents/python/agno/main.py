@@ -4,21 +4,35 @@ import base64
 import logging
 import uuid
 import asyncio
+from contextlib import asynccontextmanager
 from io import BytesIO
 from datetime import datetime, timezone
 from typing import Optional
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 
 # --- Agno Imports ---
 from agno.media import Image as AgnoImage
-from my_agent.agent import root_agent
+from my_agent.agent import root_agent, finny_workflow
 
 # --- Utilities & Tools ---
-from utils import generate_jwt, validate_jwt, extract_text_from_attachment, save_feedback, send_email
+from utils import generate_jwt, validate_jwt, extract_text_from_attachment, save_feedback, send_email, require_admin
+from feedback import feedback_sink
+from transcripts import transcript_log
+from compression import WebSocketProtocol, deflate_stats
+from mux import serve_mux, mux_stats
+from drain import drain
+from heartbeat import reaper
+from memory import accountant
+from search import transcript_index
+from mail import mail_queue
+from cancellation import cancel_turn, current_turn, upstream
+from metrics import metrics
+from vad import VoiceActivity
+from stt import build_transcriber
 from zijus_tools import set_websocket_sender
 
 from dotenv import load_dotenv
@@ -27,7 +41,20 @@ load_dotenv()
 logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await mail_queue.start()  # Also picks up email left in the spool by the last run
+    await transcript_index.start()
+    drain.install()  # SIGTERM drains the sessions before the server shuts down
+    yield
+    await feedback_sink.close()
+    await transcript_log.close()
+    await transcript_index.close()
+    await mail_queue.close()
+    await reaper.close()
+    await drain.close()
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -49,22 +76,58 @@ async def read_root(request: Request):
         "zijus_javascript": ZIJUS_JAVASCRIPT
     })
 
+@app.get("/admin/metrics", dependencies=[Depends(require_admin)])
+async def admin_metrics():
+    return {**metrics.as_dict(), "mail": mail_queue.summary(), "transcripts": transcript_log.stats, "search": transcript_index.stats, "deflate": deflate_stats, "mux": mux_stats, "drain": drain.stats, "heartbeat": reaper.stats}
+
+@app.get("/admin/memory", dependencies=[Depends(require_admin)])
+async def admin_memory(top: int = 20, refresh: bool = False):
+    """Estimated memory retained per session and component (memory.py): totals and the `top` sessions."""
+    return await accountant.report(top, refresh)
+
+@app.post("/admin/drain", dependencies=[Depends(require_admin)])
+async def admin_drain():
+    """Graceful shutdown (drain.py) without stopping the process: no new sessions, running turns finish."""
+    drain.start("admin")
+    return drain.stats
+
+@app.get("/healthz")
+async def healthz():
+    if drain.draining: raise HTTPException(status_code=503, detail="draining")
+    return {"status": "ok"}
+
+@app.get("/admin/search", dependencies=[Depends(require_admin)])
+async def admin_search(q: str = "", user: str = "", kind: str = "", session: str = "", since: Optional[int] = None,
+                       until: Optional[int] = None, before: Optional[int] = None, limit: int = 50):
+    """Transcript search (search.py): newest first, pass next_before back as `before` for the next page."""
+    try:
+        return await transcript_index.search(q, user, kind, session, since, until, before, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
+    if drain.draining: return await drain.turn_away(websocket)  # Before any JWT or agent work
     token = websocket.query_params.get("token", "")
     session_id = websocket.query_params.get("session_id", "")
     
     payload = await validate_jwt(token) if token else None
     user_id = payload.get("user_id", "anon") if payload else "anon"
+    user_email = payload.get("email") if payload else None  # Where send_email may mail to; never taken from the client
     session_id = session_id or (payload.get("session_id") if payload else f"sess-{uuid.uuid4()}")
     
     new_token = await generate_jwt(session_id) if not payload else token
 
     await websocket.accept()
+    # QA transcript (transcripts.py): everything sent on this socket, and client messages as they arrive
+    transcript = transcript_log.session(session_id, user_id)
+    websocket.send_json = transcript.tap(websocket.send_json)  # type: ignore
     await websocket.send_json({"type": "session", "token": new_token})
 
-    # 1. Inject Zijus Tools WebSockets Sender
+    # 1. Inject Zijus Tools WebSockets Sender (the workflow watches which widget is on screen)
+    flow = finny_workflow.session()
     async def sender(msg: dict):
+        flow.observe(msg)
         await websocket.send_json(msg)
     set_websocket_sender(sender)
 
@@ -76,7 +139,7 @@ async def websocket_endpoint(websocket: WebSocket):
         nonlocal current_ai_task
         if current_ai_task and not current_ai_task.done():
             logger.info(f"Interrupting AI generation: {reason}")
-            current_ai_task.cancel()
+            teardown = asyncio.create_task(cancel_turn(current_ai_task))
             try:
                 await websocket.send_json({
                     "source": "assistant",
@@ -84,42 +147,75 @@ async def websocket_endpoint(websocket: WebSocket):
                     "ts": datetime.now(timezone.utc).isoformat()
                 })
             except Exception: pass
+            # Wait (bounded) until the old run has closed its model stream before starting a new one
+            await teardown
+
+    # Barge-in only on sustained speech (see vad.py), not on every audio frame
+    async def on_user_speech() -> bool:
+        if current_ai_task and not current_ai_task.done():
+            await cancel_running_task(reason="User started speaking")
+            return True
+        return False
+    # Voice input (stt.py): a final transcript starts a turn just like a typed message
+    async def on_transcript(text: str, m_id: str):
+        nonlocal current_ai_task
+        voice.user_followed_up()
+        await cancel_running_task(reason="User finished speaking")
+        if await flow.try_handle(text, websocket.send_json): return
+        current_ai_task = asyncio.create_task(process_agent_request(flow.agent_context(text), [], m_id))
+    voice = VoiceActivity(on_user_speech, build_transcriber(websocket.send_json, on_transcript))
 
     # 3. Background Agent Execution Task
     async def process_agent_request(prompt_text: str, images: list, m_id: str):
         response_m_id = str(uuid.uuid4())
+        turn = current_turn()
+        run_id = None
         
         try:
-            # Execute Agno Stream
-            run_response = root_agent.arun(
+            # Execute Agno Stream (closed explicitly so a cancelled run releases its model connection)
+            async with upstream(root_agent.arun(
                 prompt_text,
                 images=images if images else None,
                 stream=True,
                 session_id=session_id # Pass session ID for native Agno memory persistence
-            )
-
-            async for chunk in run_response:
-                if chunk.content:
-                    await websocket.send_json({
-                        "source": "assistant",
-                        "content": chunk.content,
-                        "m_id": response_m_id,
-                        "type": "TextMessage", 
-                        "ts": datetime.now(timezone.utc).isoformat()
-                    })
+            )) as run_response:
+                async for chunk in run_response:
+                    run_id = run_id or getattr(chunk, "run_id", None)
+                    if chunk.content and turn.forward(chunk.content):
+                        await websocket.send_json({
+                            "source": "assistant",
+                            "content": chunk.content,
+                            "m_id": response_m_id,
+                            "type": "TextMessage", 
+                            "ts": datetime.now(timezone.utc).isoformat()
+                        })
             
             # Send FinalMessage on completion
             await websocket.send_json({
                 "source": "assistant", "type": "FinalMessage", 
                 "m_id": response_m_id, "ts": datetime.now(timezone.utc).isoformat()
             })
+            turn.finish("completed")
 
         except asyncio.CancelledError:
             logger.info("Agno run cancelled by user interruption.")
+            # Mark the run cancelled in Agno too, so it is stored as cancelled rather than left running
+            if run_id:
+                try: root_agent.cancel_run(run_id)
+                except Exception as e: logger.debug(f"Agno cancel_run failed: {e}")
         except Exception as e:
+            turn.finish("failed")
             logger.error(f"Agno execution error: {e}")
             await websocket.send_json({"source": "assistant", "type": "error", "content": "Error processing request."})
 
+    # Graceful shutdown (drain.py): the running turn finishes, then the client reconnects
+    draining = drain.track(websocket, session_id, busy=lambda: bool(current_ai_task and not current_ai_task.done()),
+                           cancel=cancel_running_task)
+    # Heartbeat (heartbeat.py): pings the client, closes the session once it stops answering or sits idle
+    liveness = reaper.track(websocket, busy=lambda: bool(current_ai_task and not current_ai_task.done()))
+    # Memory accounting (memory.py): connection-scoped state, counted under this session
+    accounted = accountant.attach(session_id, voice=voice)
+
     # 4. Main Event Loop
     try:
         while True:
@@ -128,41 +224,50 @@ async def websocket_endpoint(websocket: WebSocket):
             except json.JSONDecodeError: continue
 
             msg_type = data_json.get('type')
+            if liveness.inbound(msg_type): continue  # A pong
+            transcript.inbound(data_json)
             m_id = data_json.get('m_id', str(uuid.uuid4()))
 
             # Ignore control & placeholder events
             if msg_type in ['session', None]: continue
             
             if msg_type == 'feedback':
-                await save_feedback()
+                await save_feedback(data_json, session_id)
                 continue
 
             if msg_type == 'send_email':
-                await send_email()
+                await send_email(data_json, session_id, user_email)
                 continue
 
             # Handle Audio Barge-in
             if msg_type == 'AudioMessage':
-                await cancel_running_task(reason="User started speaking")
-                # Voice processing/STT would go here in production
+                if data_json.get('partial_audio', True):
+                    voice.feed(data_json.get('data', ''), data_json.get('mimeType', 'audio/pcm;rate=16000'))
+                else:
+                    await cancel_running_task(reason="User sent a voice message")
                 continue
             
             # Handle UI Widget Events (Form Submissions, Button Clicks)
             if msg_type == "WidgetEvent":
+                voice.user_followed_up()
                 await cancel_running_task(reason="User interacted with a widget")
                 payload = data_json.get("widgetEvent", {}).get("payload", {})
+                if await flow.try_handle(payload, websocket.send_json): continue
                 text_content = "\n".join(f"{k}: {v}" for k, v in payload.items()).strip()
                 if text_content:
                     current_ai_task = asyncio.create_task(
-                        process_agent_request(f"[User Submitted Form/Widget]:\n{text_content}", [], m_id)
+                        process_agent_request(flow.agent_context(f"[User Submitted Form/Widget]:\n{text_content}"), [], m_id)
                     )
                 continue
 
             # Handle Text Messages & Multimodal Attachments
             if msg_type == 'TextMessage':
+                voice.user_followed_up()
                 await cancel_running_task(reason="User typed a message")
                 
                 prompt_text = data_json.get('content', '')
+                if 'attachment' not in data_json and await flow.try_handle(prompt_text, websocket.send_json): continue
+                prompt_text = flow.agent_context(prompt_text) if prompt_text else prompt_text
                 images = []
 
                 if 'attachment' in data_json:
@@ -188,7 +293,21 @@ async def websocket_endpoint(websocket: WebSocket):
 
     except WebSocketDisconnect:
         logger.info(f"Client disconnected: {session_id}")
+    finally:
+        # Nobody is listening any more, so don't let the model keep generating
+        drain.untrack(draining)
+        reaper.untrack(liveness)
+        accountant.detach(accounted)
+        await voice.close()
+        if current_ai_task and not current_ai_task.done():
+            await cancel_turn(current_ai_task)
+        transcript.close()
+
+@app.websocket("/ws/mux")
+async def websocket_mux(websocket: WebSocket):
+    # Several sessions on one socket (mux.py): every channel runs websocket_endpoint like its own /ws connection
+    await serve_mux(websocket, websocket_endpoint)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000, ws=WebSocketProtocol)  # Deflate policy (compression.py)
\ No newline at end of file
@@ -0,0 +1,69 @@
+"""
+In-process gateway counters, served as JSON on GET /admin/metrics (guarded by utils.require_admin).
+"""
+import math
+import time
+from collections import deque
+
+
+def _percentile(sorted_values: list, pct: float):
+    if not sorted_values: return None
+    return sorted_values[max(1, math.ceil(pct / 100 * len(sorted_values))) - 1]
+
+
+class GatewayMetrics:
+    """Counters for one worker process. Everything runs on the event loop, so plain attributes are enough."""
+    def __init__(self):
+        self.started_at = time.time()
+        self.turns_started = 0
+        self.turns_completed = 0
+        self.turns_failed = 0
+        self.turns_cancelled = 0
+        self.cancel_teardown_timeouts = 0
+        self.chunks_after_cancel = 0
+        self.tokens_after_cancel = 0  # Estimated at ~4 characters per token
+        self.teardown_s: deque = deque(maxlen=1000)
+        self.vad_triggers = 0          # Sustained speech detected
+        self.vad_barge_ins = 0         # ...that cancelled a running turn
+        self.vad_false_interrupts = 0  # ...not followed by a user message
+        self.vad_rejected = 0          # Noise bursts too short to interrupt
+        self.stt_segments = 0
+        self.stt_partials = 0
+        self.stt_empty = 0             # Segments that transcribed to nothing
+        self.stt_dispatch_s: deque = deque(maxlen=1000)  # End of speech -> final transcript handed to the agent
+
+    def record_teardown(self, seconds: float, timed_out: bool):
+        self.teardown_s.append(seconds)
+        if timed_out: self.cancel_teardown_timeouts += 1
+
+    def as_dict(self) -> dict:
+        teardown = sorted(self.teardown_s)
+        dispatch = sorted(self.stt_dispatch_s)
+        return {
+            "uptime_s": time.time() - self.started_at,
+            "turns": {"started": self.turns_started, "completed": self.turns_completed, "failed": self.turns_failed, "cancelled": self.turns_cancelled},
+            "cancellation": {
+                "teardown_timeouts": self.cancel_teardown_timeouts,
+                "chunks_after_cancel": self.chunks_after_cancel,
+                "tokens_after_cancel": self.tokens_after_cancel,
+                "teardown_ms": {
+                    "count": len(teardown),
+                    "p50": (_percentile(teardown, 50) or 0) * 1000, "p95": (_percentile(teardown, 95) or 0) * 1000,
+                    "max": (teardown[-1] if teardown else 0) * 1000,
+                },
+            },
+            "voice": {
+                "vad_triggers": self.vad_triggers, "barge_ins": self.vad_barge_ins,
+                "false_interrupts": self.vad_false_interrupts, "rejected_bursts": self.vad_rejected,
+                "stt": {
+                    "segments": self.stt_segments, "partials": self.stt_partials, "empty": self.stt_empty,
+                    "dispatch_ms": {
+                        "count": len(dispatch),
+                        "p50": (_percentile(dispatch, 50) or 0) * 1000, "p95": (_percentile(dispatch, 95) or 0) * 1000,
+                    },
+                },
+            },
+        }
+
+
+metrics = GatewayMetrics()
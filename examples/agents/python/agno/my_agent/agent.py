@@ -4,6 +4,7 @@ from agno.db.sqlite import SqliteDb
 from dotenv import load_dotenv
 
 from zijus_tools import SendSlots, SendSlider
+from workflow import Step, Workflow
 
 load_dotenv()
 
@@ -41,6 +42,30 @@ instructions = [
     "3. Keep your text responses incredibly short (1-2 sentences max). Let the UI tools do the talking."
 ]
 
+# --- DETERMINISTIC FAST PATH (opt-in: ZIJUS_WORKFLOW_FASTPATH=true) ---
+# Steps 2-4 above are fixed transitions, so the gateway can answer widget clicks without an LLM round-trip.
+TERM_SLOTS = ["12 Months", "24 Months", "36 Months"]
+OFFICER_SLOTS = ["Yes", "No"]
+APPOINTMENT_SLOTS = ["Tomorrow 10:00 AM", "Tomorrow 2:00 PM", "Next Monday 11:00 AM"]
+ESTIMATE_APR = 0.079
+
+def _estimate(values: dict) -> str:
+    amount, months = values["amount"], int(values["term"].split()[0])
+    rate = ESTIMATE_APR / 12
+    payment = amount * rate / (1 - (1 + rate) ** -months)
+    return (f"Here is your estimate:\n\n| Amount | Term | APR | Monthly payment |\n|---|---|---|---|\n"
+            f"| ${amount:,.0f} | {months} months | {ESTIMATE_APR:.1%} | **${payment:,.2f}** |\n\n"
+            "Would you like to speak to a loan officer?")
+
+finny_workflow = Workflow([
+    Step("amount", answers="slider", reply="Great, a ${amount:,.0f} loan. How long would you like to take to pay it back?", slots=TERM_SLOTS),
+    Step("term", answers=TERM_SLOTS, reply=_estimate, slots=OFFICER_SLOTS),
+    Step("officer", answers=OFFICER_SLOTS, accepts=["Yes"], reply="Pick a time that suits you.", slots=APPOINTMENT_SLOTS),
+    Step("officer", answers=OFFICER_SLOTS, accepts=["No"], reply="No problem. Thanks for chatting with Zijus Bank, have a great day!"),
+    Step("appointment", answers=APPOINTMENT_SLOTS, reply="You're booked for {appointment}. A loan officer will call you then."),
+])
+# ----------------------------------------------------------------------
+
 agent = Agent(
     name="Zijus Financial Assistant",
     model=OpenAIChat(id="gpt-5.4-mini"),
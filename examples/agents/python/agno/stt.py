@@ -0,0 +1,224 @@
+"""
+Streaming speech-to-text for AudioMessage frames in the text-mode gateway.
+
+vad.py writes every decoded mic frame into a RingBuffer and tells the Transcriber when sustained speech
+starts and ends. While the user talks, partial transcripts are sent as `is_transcription` TextMessages
+(same m_id, so the UI updates one bubble). At end of speech the final transcript goes to the agent
+through the same path as a typed message.
+
+Backends (ZIJUS_STT_BACKEND, off by default):
+  stub    deterministic and local: partials are growing prefixes of ZIJUS_STT_STUB_TEXT, the final is all of it
+  openai  OpenAI transcription API (ZIJUS_STT_MODEL, default gpt-4o-mini-transcribe)
+  gemini  Gemini generate_content with the audio attached (ZIJUS_STT_MODEL, default gemini-2.5-flash)
+"""
+import io
+import os
+import time
+import uuid
+import wave
+import asyncio
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Optional
+
+import numpy as np
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+STT_BACKEND = os.getenv("ZIJUS_STT_BACKEND", "off").lower()
+STT_MODEL = os.getenv("ZIJUS_STT_MODEL", "")
+STT_PARTIAL_MS = int(os.getenv("ZIJUS_STT_PARTIAL_MS", "1000"))  # 0 = final transcripts only
+STT_MAX_SEGMENT_S = float(os.getenv("ZIJUS_STT_MAX_SEGMENT_S", "30"))
+STT_PREROLL_MS = 200  # Audio kept from before the VAD noticed speech, so the first syllable isn't cut
+STUB_TEXT = os.getenv("ZIJUS_STT_STUB_TEXT", "I would like to borrow twenty thousand dollars")
+
+
+def to_wav(samples: np.ndarray, rate: int) -> bytes:
+    """float32 mono in [-1, 1] -> 16-bit WAV file bytes."""
+    pcm = (np.clip(samples, -1, 1) * 32767).astype("<i2")
+    out = io.BytesIO()
+    with wave.open(out, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(pcm.tobytes())
+    return out.getvalue()
+
+
+class StubBackend:
+    """No network and no model: the output depends only on the audio duration, so tests and load runs replay."""
+    async def transcribe(self, samples: np.ndarray, rate: int, final: bool) -> str:
+        if final:
+            return STUB_TEXT
+        words = STUB_TEXT.split()
+        return " ".join(words[:int(samples.size / rate * 2.5)])  # ~150 words per minute
+
+
+class OpenAIBackend:
+    def __init__(self):
+        from openai import AsyncOpenAI
+        self.client = AsyncOpenAI()
+        self.model = STT_MODEL or "gpt-4o-mini-transcribe"
+
+    async def transcribe(self, samples: np.ndarray, rate: int, final: bool) -> str:
+        response = await self.client.audio.transcriptions.create(model=self.model, file=("speech.wav", to_wav(samples, rate), "audio/wav"))
+        return response.text.strip()
+
+
+class GeminiBackend:
+    def __init__(self):
+        from google import genai
+        self.client = genai.Client()
+        self.model = STT_MODEL or "gemini-2.5-flash"
+
+    async def transcribe(self, samples: np.ndarray, rate: int, final: bool) -> str:
+        from google.genai import types
+        response = await self.client.aio.models.generate_content(model=self.model, contents=[
+            types.Part.from_bytes(data=to_wav(samples, rate), mime_type="audio/wav"),
+            "Transcribe this audio verbatim. Reply with the transcript only, or nothing if there is no speech.",
+        ])
+        return (response.text or "").strip()
+
+
+BACKENDS = {"stub": StubBackend, "openai": OpenAIBackend, "gemini": GeminiBackend}
+_backend = None  # One client per process, shared by all connections
+
+
+class RingBuffer:
+    """Fixed-size float32 sample store, addressed by absolute sample position (total samples ever written)."""
+    def __init__(self, capacity: int):
+        self.buf = np.zeros(capacity, dtype=np.float32)
+        self.written = 0
+
+    def write(self, samples: np.ndarray):
+        capacity, n = self.buf.size, samples.size
+        if n > capacity:
+            # Only the newest `capacity` samples survive anyway
+            self.written += n - capacity
+            samples, n = samples[-capacity:], capacity
+        idx = self.written % capacity
+        first = min(n, capacity - idx)
+        self.buf[idx:idx + first] = samples[:first]
+        self.buf[:n - first] = samples[first:]
+        self.written += n
+
+    def read(self, start: int, end: int) -> np.ndarray:
+        """Copy of samples [start, end), clamped to what is still in the buffer."""
+        start = max(start, self.written - self.buf.size, 0)
+        end = min(end, self.written)
+        if end <= start:
+            return np.zeros(0, dtype=np.float32)
+        a, b = start % self.buf.size, end % self.buf.size
+        if a < b:
+            return self.buf[a:b].copy()
+        return np.concatenate([self.buf[a:], self.buf[:b]])
+
+
+class Transcriber:
+    """
+    Per-connection STT stage driven by VoiceActivity.
+
+    on_transcript(text, m_id) is awaited with each final transcript and should start the agent turn.
+    The VAD worker thread writes the ring while the loop reads it, so both go through _lock.
+    """
+    def __init__(self, backend, send: Callable[[dict], Awaitable[None]], on_transcript: Callable[[str, str], Awaitable[None]]):
+        self.backend = backend
+        self.send = send
+        self.on_transcript = on_transcript
+        self.rate = 0
+        self.ring: Optional[RingBuffer] = None
+        self._lock = threading.Lock()
+        self._start = 0
+        self._m_id = ""
+        self._partial_task: Optional[asyncio.Task] = None
+        self._finals: set = set()
+
+    def reset(self, rate: int):
+        """New audio stream (format). Called from the VAD worker thread."""
+        ring = RingBuffer(int(rate * (STT_MAX_SEGMENT_S + 1)))
+        with self._lock:
+            self.rate, self.ring = rate, ring
+
+    def write(self, samples: np.ndarray):
+        """Called from the VAD worker thread with every analysed mono frame."""
+        with self._lock:
+            self.ring.write(samples)  # type: ignore
+
+    def _read(self, start: int, end: Optional[int] = None) -> np.ndarray:
+        """Samples [start, end) (end = everything written so far), read on the loop."""
+        with self._lock:
+            return self.ring.read(start, self.ring.written if end is None else end)  # type: ignore
+
+    async def begin(self, position: int):
+        """Sustained speech started at sample `position`."""
+        self._start = max(0, position - int(self.rate * STT_PREROLL_MS / 1000))
+        self._m_id = str(uuid.uuid4())
+        await self._emit("🎤 ...")
+        if STT_PARTIAL_MS > 0:
+            self._partial_task = asyncio.create_task(self._partials(self._start, self._m_id))
+
+    async def end(self, position: int, speech_ended_at: float):
+        """Speech ended at sample `position` (perf_counter time `speech_ended_at`): transcribe and dispatch."""
+        if self._partial_task is not None:
+            self._partial_task.cancel()
+            self._partial_task = None
+        samples = self._read(self._start, position)
+        task = asyncio.create_task(self._final(samples, self._m_id, speech_ended_at))
+        self._finals.add(task)
+        task.add_done_callback(self._finals.discard)
+
+    async def close(self):
+        for task in [self._partial_task, *self._finals]:
+            if task is not None: task.cancel()
+
+    async def _partials(self, start: int, m_id: str):
+        last = ""
+        while True:
+            await asyncio.sleep(STT_PARTIAL_MS / 1000)
+            samples = self._read(start)
+            try: text = await self.backend.transcribe(samples, self.rate, final=False)
+            except Exception as e:
+                logger.warning(f"Partial transcription failed: {e}")
+                continue
+            metrics.stt_partials += 1
+            if text and text != last:
+                last = text
+                await self._emit(f"🎤 {text} ...", m_id)
+
+    async def _final(self, samples: np.ndarray, m_id: str, speech_ended_at: float):
+        try:
+            text = await self.backend.transcribe(samples, self.rate, final=True)
+        except Exception as e:
+            logger.error(f"Transcription failed: {e}")
+            text = ""
+        if not text:
+            metrics.stt_empty += 1
+            await self._emit("🎤 [inaudible]", m_id)
+            return
+        metrics.stt_segments += 1
+        await self._emit(text, m_id)
+        metrics.stt_dispatch_s.append(time.perf_counter() - speech_ended_at)  # Before the previous run's cancel and the new turn
+        await self.on_transcript(text, m_id)
+
+    async def _emit(self, content: str, m_id: str = ""):
+        try: await self.send({
+            "source": "user", "type": "TextMessage", "is_transcription": True,
+            "content": content, "m_id": m_id or self._m_id, "ts": datetime.now(timezone.utc).isoformat()
+        })
+        except Exception: pass
+
+
+def build_transcriber(send: Callable[[dict], Awaitable[None]], on_transcript: Callable[[str, str], Awaitable[None]]) -> Optional[Transcriber]:
+    """A Transcriber for ZIJUS_STT_BACKEND, or None when STT is off (audio then only drives barge-in)."""
+    if STT_BACKEND in ("", "off", "none"):
+        return None
+    if STT_BACKEND not in BACKENDS:
+        logger.warning(f"Unknown ZIJUS_STT_BACKEND '{STT_BACKEND}'; speech-to-text disabled.")
+        return None
+    global _backend
+    if _backend is None:
+        _backend = BACKENDS[STT_BACKEND]()
+    return Transcriber(_backend, send, on_transcript)
@@ -0,0 +1,273 @@
+"""
+Background job queue for outgoing email.
+
+enqueue() (behind utils.send_email()) writes each message as a job file in the spool directory and
+returns without touching the network. MAIL_WORKERS workers take jobs from the spool and deliver them.
+Each worker keeps its own SMTP connection and reuses it for the next message until it has been idle for
+SMTP_IDLE_S. If the server dropped the connection in the meantime, the worker reconnects once.
+
+Transient failures (network errors, 4xx replies) are retried with exponential backoff and jitter, up to
+MAIL_MAX_ATTEMPTS. Permanent failures (5xx replies) and jobs that run out of attempts are moved to
+<spool>/failed/. The spool survives restarts: jobs still on disk at start-up are delivered then.
+
+  ZIJUS_SMTP_HOST / _PORT   SMTP server (unset = email disabled; send_email() only logs)
+  ZIJUS_SMTP_USER / _PASSWORD  login, if the server needs one. STARTTLS is used whenever the server offers it
+  ZIJUS_MAIL_FROM / _TO     sender, and the recipient when the session's JWT has no "email" claim
+  ZIJUS_MAIL_SPOOL          spool directory (default ./mail-spool)
+
+Queue latency (enqueue -> accepted by the server), SMTP time per message, connection reuse and
+throughput are available from summary() (see /admin/metrics) and are logged at shutdown. Try it locally
+with `python -m aiosmtpd -n -l localhost:8025` and ZIJUS_SMTP_HOST=localhost ZIJUS_SMTP_PORT=8025, or
+benchmark it with examples/tools/python/storage-bench --target mail.
+"""
+import os
+import json
+import time
+import uuid
+import random
+import asyncio
+import logging
+import smtplib
+from collections import deque
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+SMTP_HOST = os.getenv("ZIJUS_SMTP_HOST", "")
+SMTP_PORT = int(os.getenv("ZIJUS_SMTP_PORT", "587"))
+SMTP_USER = os.getenv("ZIJUS_SMTP_USER", "")
+SMTP_PASSWORD = os.getenv("ZIJUS_SMTP_PASSWORD", "")
+SMTP_TIMEOUT_S = float(os.getenv("ZIJUS_SMTP_TIMEOUT_S", "30"))
+SMTP_IDLE_S = float(os.getenv("ZIJUS_SMTP_IDLE_S", "30"))  # Close a worker's connection after this long unused
+MAIL_FROM = os.getenv("ZIJUS_MAIL_FROM", "assistant@localhost")
+MAIL_TO = os.getenv("ZIJUS_MAIL_TO", "")
+MAIL_SUBJECT = os.getenv("ZIJUS_MAIL_SUBJECT", "Your conversation")
+MAIL_SPOOL = os.getenv("ZIJUS_MAIL_SPOOL", "mail-spool")
+MAIL_WORKERS = int(os.getenv("ZIJUS_MAIL_WORKERS", "4"))
+MAIL_MAX_ATTEMPTS = int(os.getenv("ZIJUS_MAIL_MAX_ATTEMPTS", "6"))
+MAIL_BACKOFF_S = float(os.getenv("ZIJUS_MAIL_BACKOFF_S", "5"))  # First retry delay, doubled per attempt
+MAIL_BACKOFF_MAX_S = float(os.getenv("ZIJUS_MAIL_BACKOFF_MAX_S", "600"))
+
+
+def build_message(job: dict) -> EmailMessage:
+    msg = EmailMessage()
+    msg["From"] = job["from"]
+    msg["To"] = job["to"]
+    msg["Subject"] = job["subject"]
+    msg["Date"] = formatdate(job["created"], usegmt=True)
+    msg["Message-ID"] = job["message_id"]  # Fixed at enqueue time, so a retried duplicate is recognisable
+    msg.set_content(job["body"])
+    return msg
+
+
+def is_permanent(error: Exception) -> bool:
+    """5xx replies won't get better by retrying. Everything else (4xx, network errors) is transient."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    return isinstance(error, smtplib.SMTPResponseException) and 500 <= error.smtp_code < 600
+
+
+class MailQueue:
+    """Spool-backed job queue with a fixed pool of delivery workers. Call start() and close() from the app lifespan."""
+    def __init__(self, spool_dir: str = MAIL_SPOOL, workers: int = MAIL_WORKERS):
+        self.spool_dir = spool_dir
+        self.failed_dir = os.path.join(spool_dir, "failed")
+        self.workers = workers
+        self.queue: Optional[asyncio.Queue] = None
+        self._workers: list = []
+        self._retries: dict = {}  # job id -> TimerHandle of the scheduled retry
+        self._closing = False
+        self._smtp = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="smtp")  # smtplib blocks; one thread per worker
+        self.started = time.monotonic()
+        self.stats = {"queued": 0, "recovered": 0, "sent": 0, "retried": 0, "failed": 0, "connections": 0, "reused": 0}
+        self.queue_latency_s: deque = deque(maxlen=10000)  # Enqueue -> accepted by the server, per message
+        self.smtp_s: deque = deque(maxlen=10000)  # SMTP time for the successful attempt, per message
+
+    @property
+    def enabled(self) -> bool:
+        return bool(SMTP_HOST)
+
+    async def start(self):
+        if self.queue is not None or not self.enabled:
+            return
+        self.queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        for job in await asyncio.to_thread(self._recover):
+            self.stats["recovered"] += 1
+            self._schedule(job, job["not_before"] - time.time())
+
+    async def enqueue(self, payload: dict, session_id: str, recipient: Optional[str] = None) -> Optional[str]:
+        """
+        Spools one message and returns its job id (None if email is disabled or there is no recipient).
+        Only the body comes from the client. It goes to `recipient` (set by the server) or ZIJUS_MAIL_TO, never
+        to an address named in the message, so the gateway can't be used to mail arbitrary people.
+        """
+        to = recipient or MAIL_TO
+        if not self.enabled or not to:
+            logger.info(f"Email not sent for session {session_id}: {'no recipient' if self.enabled else 'ZIJUS_SMTP_HOST is not set'}.")
+            return None
+        if self.queue is None:
+            await self.start()
+        now = time.time()
+        job = {
+            "id": f"{time.time_ns()}-{uuid.uuid4().hex[:8]}", "created": now, "not_before": now, "attempts": 0,
+            "session_id": session_id, "from": MAIL_FROM, "to": to, "subject": MAIL_SUBJECT,
+            "body": str(payload.get("content") or payload.get("body") or ""), "message_id": make_msgid(domain="zijus.local"),
+        }
+        await asyncio.to_thread(self._spool, job)  # Durable before we return; a restart will still deliver it
+        self.stats["queued"] += 1
+        self.queue.put_nowait(job)  # type: ignore
+        return job["id"]
+
+    # --- Spool (worker threads) ---
+
+    def _path(self, job_id: str, directory: Optional[str] = None) -> str:
+        return os.path.join(directory or self.spool_dir, f"{job_id}.json")
+
+    def _spool(self, job: dict, directory: Optional[str] = None):
+        """Atomic write: a crash leaves either the old or the new file, never half of one."""
+        os.makedirs(directory or self.spool_dir, exist_ok=True)
+        path = self._path(job["id"], directory)
+        with open(path + ".tmp", "w") as f:
+            json.dump(job, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def _unspool(self, job_id: str):
+        try: os.remove(self._path(job_id))
+        except FileNotFoundError: pass
+
+    def _recover(self) -> list:
+        if not os.path.isdir(self.spool_dir):
+            return []
+        jobs = []
+        for name in sorted(os.listdir(self.spool_dir)):  # Ids start with a timestamp: oldest first
+            if not name.endswith(".json"): continue
+            try:
+                with open(os.path.join(self.spool_dir, name)) as f: jobs.append(json.load(f))
+            except Exception as e:
+                logger.error(f"Unreadable mail spool file {name}: {e}")
+        return jobs
+
+    # --- Delivery ---
+
+    def _connect(self) -> smtplib.SMTP:
+        conn = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT_S)
+        conn.ehlo()
+        if conn.has_extn("starttls"):
+            conn.starttls()
+            conn.ehlo()
+        if SMTP_USER:
+            conn.login(SMTP_USER, SMTP_PASSWORD)
+        return conn
+
+    def _deliver(self, conn: Optional[smtplib.SMTP], job: dict):
+        """Worker thread: sends one message, reusing conn when possible.
+        Returns (connection to keep or None, new connections opened, error or None)."""
+        opened = 0
+        try:
+            if conn is None:
+                conn, opened = self._connect(), 1
+            try:
+                conn.send_message(build_message(job))
+            except smtplib.SMTPServerDisconnected:
+                if opened: raise
+                conn, opened = self._connect(), 1  # The server closed our idle connection; one fresh try
+                conn.send_message(build_message(job))
+            return conn, opened, None
+        except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused) as e:
+            try:
+                conn.rset()  # type: ignore  # A refused message leaves the session usable
+                return conn, opened, e
+            except Exception:
+                self._quit(conn)
+                return None, opened, e
+        except Exception as e:
+            self._quit(conn)
+            return None, opened, e
+
+    @staticmethod
+    def _quit(conn: Optional[smtplib.SMTP]):
+        if conn is None: return
+        try: conn.quit()
+        except Exception:
+            try: conn.close()
+            except Exception: pass
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        conn: Optional[smtplib.SMTP] = None
+        while True:
+            try: job = await asyncio.wait_for(self.queue.get(), timeout=SMTP_IDLE_S if conn else None)  # type: ignore
+            except asyncio.TimeoutError:
+                await loop.run_in_executor(self._smtp, self._quit, conn)
+                conn = None
+                continue
+            if job is None or self._closing:
+                break  # Anything still queued stays in the spool for the next start
+            t_send = time.perf_counter()
+            conn, opened, error = await loop.run_in_executor(self._smtp, self._deliver, conn, job)
+            self.stats["connections"] += opened
+            if error is not None:
+                await self._attempt_failed(job, error)
+                continue
+            self.smtp_s.append(time.perf_counter() - t_send)
+            self.queue_latency_s.append(time.time() - job["created"])
+            self.stats["sent"] += 1
+            self.stats["reused"] += 1 - opened
+            await asyncio.to_thread(self._unspool, job["id"])
+        await loop.run_in_executor(self._smtp, self._quit, conn)
+
+    async def _attempt_failed(self, job: dict, error: Exception):
+        job["attempts"] += 1
+        if is_permanent(error) or job["attempts"] >= MAIL_MAX_ATTEMPTS:
+            self.stats["failed"] += 1
+            logger.error(f"Email {job['id']} to {job['to']} failed after {job['attempts']} attempt(s): {error}")
+            job["error"] = str(error)
+            await asyncio.to_thread(self._spool, job, self.failed_dir)
+            await asyncio.to_thread(self._unspool, job["id"])
+            return
+        delay = min(MAIL_BACKOFF_MAX_S, MAIL_BACKOFF_S * 2 ** (job["attempts"] - 1)) * random.uniform(0.5, 1.0)
+        self.stats["retried"] += 1
+        logger.warning(f"Email {job['id']} attempt {job['attempts']} failed ({error}), retrying in {delay:.1f}s.")
+        job["not_before"] = time.time() + delay
+        await asyncio.to_thread(self._spool, job)
+        self._schedule(job, delay)
+
+    def _schedule(self, job: dict, delay: float):
+        if delay <= 0:
+            self.queue.put_nowait(job)  # type: ignore
+            return
+        def due():
+            self._retries.pop(job["id"], None)
+            self.queue.put_nowait(job)  # type: ignore
+        self._retries[job["id"]] = asyncio.get_running_loop().call_later(delay, due)
+
+    def summary(self) -> dict:
+        def pcts(values):
+            ordered = sorted(values)
+            pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 1)
+            return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99)} if ordered else None
+        return {
+            **self.stats, "enabled": self.enabled, "pending": self.queue.qsize() if self.queue else 0, "waiting_retry": len(self._retries),
+            "queue_latency_ms": pcts(self.queue_latency_s), "smtp_ms": pcts(self.smtp_s),
+            "sent_per_s": round(self.stats["sent"] / max(time.monotonic() - self.started, 1e-9), 2),
+        }
+
+    async def close(self):
+        """App shutdown: in-flight sends finish, everything else stays spooled for the next start."""
+        if self.queue is None:
+            return
+        self._closing = True  # Sentinels rather than cancel(), so no send is cut off mid-transaction
+        for handle in self._retries.values(): handle.cancel()
+        for _ in self._workers: self.queue.put_nowait(None)
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._smtp.shutdown(wait=True)
+        logger.info(f"Mail queue closed: {self.summary()}")
+
+
+mail_queue = MailQueue()
@@ -9,6 +9,8 @@ from dotenv import load_dotenv
 
 # Import framework-agnostic UI tools
 from zijus_tools import SendSlots, SendSlider
+from workflow import Step, Workflow
+from widgets import widget_result
 
 load_dotenv()
 
@@ -55,7 +57,7 @@ async def send_slots_tool(slots: list[str]) -> str:
         slots: A list of string options for the user to choose from.
     """
     await SendSlots(slots=slots)
-    return "UI rendered successfully. Stop generating and wait for the user."
+    return await widget_result()  # The answer itself with ZIJUS_INTERACTIVE_TOOLS (widgets.py)
 
 @tool
 async def send_slider_tool(content: str, min_value: int, max_value: int, default_value: int) -> str:
@@ -68,9 +70,33 @@ async def send_slider_tool(content: str, min_value: int, max_value: int, default
         default_value: The starting value of the slider.
     """
     await SendSlider(content=content, min_value=min_value, max_value=max_value, default_value=default_value)
-    return "UI rendered successfully. Stop generating and wait for the user."
+    return await widget_result()
 # ------------------------------------
 
+# --- DETERMINISTIC FAST PATH (opt-in: ZIJUS_WORKFLOW_FASTPATH=true) ---
+# Steps 2-4 above are fixed transitions, so the gateway can answer widget clicks without an LLM round-trip.
+TERM_SLOTS = ["12 Months", "24 Months", "36 Months"]
+OFFICER_SLOTS = ["Yes", "No"]
+APPOINTMENT_SLOTS = ["Tomorrow 10:00 AM", "Tomorrow 2:00 PM", "Next Monday 11:00 AM"]
+ESTIMATE_APR = 0.079
+
+def _estimate(values: dict) -> str:
+    amount, months = values["amount"], int(values["term"].split()[0])
+    rate = ESTIMATE_APR / 12
+    payment = amount * rate / (1 - (1 + rate) ** -months)
+    return (f"Here is your estimate:\n\n| Amount | Term | APR | Monthly payment |\n|---|---|---|---|\n"
+            f"| ${amount:,.0f} | {months} months | {ESTIMATE_APR:.1%} | **${payment:,.2f}** |\n\n"
+            "Would you like to speak to a loan officer?")
+
+finny_workflow = Workflow([
+    Step("amount", answers="slider", reply="Great, a ${amount:,.0f} loan. How long would you like to take to pay it back?", slots=TERM_SLOTS),
+    Step("term", answers=TERM_SLOTS, reply=_estimate, slots=OFFICER_SLOTS),
+    Step("officer", answers=OFFICER_SLOTS, accepts=["Yes"], reply="Pick a time that suits you.", slots=APPOINTMENT_SLOTS),
+    Step("officer", answers=OFFICER_SLOTS, accepts=["No"], reply="No problem. Thanks for chatting with Zijus Bank, have a great day!"),
+    Step("appointment", answers=APPOINTMENT_SLOTS, reply="You're booked for {appointment}. A loan officer will call you then."),
+])
+# ----------------------------------------------------------------------
+
 def get_agent(session_id: str = "", user_id: str = "", http_client: httpx.AsyncClient = None) -> Agent: # type: ignore
     """
     Creates and returns an AWS Strands Agent configured with OpenAI.
@@ -106,4 +132,19 @@ def get_agent(session_id: str = "", user_id: str = "", http_client: httpx.AsyncC
         tools=[send_slots_tool, send_slider_tool] 
     )
 
-    return agent
\ No newline at end of file
+    return agent
+
+def close_dangling_tool_use(agent: Agent) -> int:
+    """
+    Answers tool calls left open by a cancelled run, so the next request doesn't fail with a
+    toolUse that has no matching toolResult. Returns the number of calls closed.
+    """
+    if not agent.messages or agent.messages[-1].get("role") != "assistant":
+        return 0
+    tool_use_ids = [block["toolUse"]["toolUseId"] for block in agent.messages[-1].get("content", []) if "toolUse" in block]
+    if tool_use_ids:
+        agent.messages.append({"role": "user", "content": [
+            {"toolResult": {"toolUseId": tool_use_id, "status": "error", "content": [{"text": "Cancelled by the user."}]}}
+            for tool_use_id in tool_use_ids
+        ]})
+    return len(tool_use_ids)
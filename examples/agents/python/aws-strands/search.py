@@ -0,0 +1,272 @@
+"""
+Full-text search over the recorded transcripts (see transcripts.py), for support and compliance.
+
+TranscriptIndex follows the transcript segments into a SQLite database (ZIJUS_SEARCH_DB). Each
+text-bearing record becomes one row in `messages`, covered by an FTS5 index over its text, user id and
+kind: user / assistant text, widget choices as "field: value" lines, widgets shown, errors. Every
+ZIJUS_SEARCH_INDEX_S a background thread reads whatever was appended since the last run and inserts it
+in transactions of up to SEARCH_BULK_ROWS rows. The per-segment read offset is committed in the same
+transaction, so nothing is indexed twice, even with several gateway processes sharing the database. A
+backfill over existing segments uses the same path.
+
+search() pages newest first with a keyset cursor (`before` = next_before of the previous page). Every
+query is a walk down the FTS index in rowid order that stops at `limit` hits. A deep page therefore costs
+about the same as the first, and user / kind filters are intersected inside the index. Time bounds are
+turned into a coarse id range first, and checked on every row. The walk goes window by window and stops
+within ZIJUS_SEARCH_BUDGET_MS: a rare match can then come back as a short (even empty) page whose
+next_before picks up where it stopped. The results are complete once next_before is null.
+
+    GET /admin/search?q="monthly payment"&user=alice&kind=widget_event&limit=50&before=<next_before>
+
+`q` is an FTS5 query on the message text: words (all must match), "exact phrase", OR, NOT, prefix*.
+"""
+import os
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from transcripts import TRANSCRIPT_DIR, read_segment
+
+logger = logging.getLogger(__name__)
+
+SEARCH_DB = os.getenv("ZIJUS_SEARCH_DB", "")  # Empty (default) = no index
+SEARCH_INDEX_S = float(os.getenv("ZIJUS_SEARCH_INDEX_S", "2"))
+SEARCH_BULK_ROWS = int(os.getenv("ZIJUS_SEARCH_BULK_ROWS", "50000"))  # Records per indexing transaction
+SEARCH_BUDGET_MS = float(os.getenv("ZIJUS_SEARCH_BUDGET_MS", "50"))  # Per page; a rare match then returns a short page
+SEARCH_MAX_LIMIT = 200
+SEARCH_WINDOW = 250000  # Ids in the first index window of a search
+SEARCH_WINDOW_CACHE = 1000
+SEARCH_OPTIMIZE_ROWS = 1000000  # Merge the FTS b-trees after a run that indexed this many (a backfill)
+SESSION_CACHE = 100000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY, ts INTEGER, session TEXT, user TEXT, kind TEXT, m TEXT, text TEXT);
+CREATE INDEX IF NOT EXISTS messages_session ON messages (session, id);
+CREATE INDEX IF NOT EXISTS messages_ts ON messages (ts);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    text, user, kind, content='messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2');
+CREATE TABLE IF NOT EXISTS sessions (session TEXT PRIMARY KEY, user TEXT);
+CREATE TABLE IF NOT EXISTS segments (name TEXT PRIMARY KEY, offset INTEGER);
+"""
+
+
+def _leaves(value) -> list:
+    if isinstance(value, dict): return [leaf for v in value.values() for leaf in _leaves(v)]
+    if isinstance(value, list): return [leaf for v in value for leaf in _leaves(v)]
+    return [] if value is None or isinstance(value, bool) else [str(value)]
+
+
+def record_text(record: dict) -> Optional[str]:
+    """The searchable text of a transcript record, or None for records that carry none (start, interrupt, ...)."""
+    kind = record.get("k")
+    if kind in ("user", "assistant", "error"):
+        return record.get("text") or None
+    if kind == "widget_event":
+        return "\n".join(f"{k}: {v}" for k, v in (record.get("payload") or {}).items()) or None
+    if kind == "widget":
+        return " ".join([record.get("type", ""), *_leaves(record.get("data"))]).strip() or None
+    return None
+
+
+def _quote(value: str) -> str:
+    return '"' + value.replace('"', '""') + '"'
+
+
+class TranscriptIndex:
+    """Incremental FTS5 index of transcript segments. Call start() and close() from the app lifespan."""
+    def __init__(self, db_path: str = SEARCH_DB, transcript_dir: str = TRANSCRIPT_DIR):
+        self.db_path = db_path
+        self.transcript_dir = transcript_dir
+        self._local = threading.local()  # One connection per thread; the indexer thread is the only writer
+        self._indexer_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search-index")
+        self._indexer: Optional[asyncio.Task] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._offsets: dict = {}  # Segment -> offset indexed so far (a cache of the segments table)
+        self._users: dict = {}  # Session -> user id, from the session's start record
+        self._windows: dict = {}  # Match -> id window for the next page of that search
+        self.stats = {"indexed": 0, "runs": 0, "last_run_ms": 0, "backlog_bytes": 0, "errors": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.db_path and self.transcript_dir)
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("PRAGMA busy_timeout=5000")
+            db.executescript(SCHEMA)
+            self._local.db = db
+        return db
+
+    # --- Indexing (indexer thread) ---
+
+    def ingest(self) -> int:
+        """Indexes everything appended to the segments since the last call. Returns records indexed."""
+        if not os.path.isdir(self.transcript_dir):
+            return 0
+        db, indexed, backlog = self._db(), 0, 0
+        for name in sorted(os.listdir(self.transcript_dir)):
+            if not name.endswith(".jsonl"): continue
+            path = os.path.join(self.transcript_dir, name)
+            while os.path.getsize(path) > self._offsets.get(name, 0):
+                done, complete = self._ingest_chunk(db, name, path)
+                indexed += done
+                if complete: break
+            backlog += max(0, os.path.getsize(path) - self._offsets.get(name, 0))
+        self.stats["backlog_bytes"] = backlog
+        if indexed >= SEARCH_OPTIMIZE_ROWS:  # Fewer FTS segments to read per query after a bulk load
+            db.execute("INSERT INTO messages_fts (messages_fts) VALUES ('optimize')")
+        return indexed
+
+    def _ingest_chunk(self, db: sqlite3.Connection, name: str, path: str) -> tuple[int, bool]:
+        """One transaction: up to SEARCH_BULK_ROWS records of one segment, plus the new offset.
+        Returns (rows indexed, whether the segment is read to its end)."""
+        db.execute("BEGIN IMMEDIATE")  # Read the offset under the write lock: another process may be indexing too
+        try:
+            row = db.execute("SELECT offset FROM segments WHERE name = ?", (name,)).fetchone()
+            start = end = row[0] if row else 0
+            rows, sessions, read = [], [], 0
+            for record, end in read_segment(path, start):
+                read += 1
+                session = record.get("s", "")
+                if record.get("k") == "start":
+                    self._users[session] = record.get("user", "")
+                    sessions.append((session, record.get("user", "")))
+                text = record_text(record)
+                if text is not None:
+                    rows.append((record.get("ts"), session, self._user(db, session), record.get("k"), record.get("m") or "", text))
+                if read >= SEARCH_BULK_ROWS: break
+            if end != start:
+                first_id = db.execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()[0]
+                db.executemany("INSERT OR REPLACE INTO sessions (session, user) VALUES (?, ?)", sessions)
+                db.executemany("INSERT INTO messages (ts, session, user, kind, m, text) VALUES (?, ?, ?, ?, ?, ?)", rows)
+                db.execute("INSERT INTO messages_fts (rowid, text, user, kind) SELECT id, text, user, kind FROM messages WHERE id > ?", (first_id,))
+                db.execute("INSERT INTO segments (name, offset) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET offset = excluded.offset", (name, end))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        self._offsets[name] = end
+        if len(self._users) > SESSION_CACHE: self._users.clear()
+        return len(rows), read < SEARCH_BULK_ROWS
+
+    def _user(self, db: sqlite3.Connection, session: str) -> str:
+        user = self._users.get(session)
+        if user is None:  # Session started in a segment indexed earlier (or by another process)
+            row = db.execute("SELECT user FROM sessions WHERE session = ?", (session,)).fetchone()
+            user = self._users[session] = row[0] if row else ""
+        return user
+
+    async def start(self):
+        if not self.enabled or self._indexer is not None:
+            return
+        self._stop = asyncio.Event()
+        self._indexer = asyncio.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while not self._stop.is_set():  # type: ignore
+            t_run = time.perf_counter()
+            try:
+                self.stats["indexed"] += await loop.run_in_executor(self._indexer_thread, self.ingest)
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Transcript indexing failed: {e}")
+            self.stats["runs"] += 1
+            self.stats["last_run_ms"] = int((time.perf_counter() - t_run) * 1000)
+            try: await asyncio.wait_for(self._stop.wait(), timeout=SEARCH_INDEX_S)  # type: ignore
+            except asyncio.TimeoutError: pass
+
+    async def close(self):
+        if self._indexer is not None:
+            self._stop.set()  # type: ignore
+            await self._indexer
+        self._indexer_thread.shutdown(wait=True)
+
+    # --- Search ---
+
+    async def search(self, q: str = "", user: str = "", kind: str = "", session: str = "", since: Optional[int] = None,
+                     until: Optional[int] = None, before: Optional[int] = None, limit: int = 50) -> dict:
+        """Newest first. since/until are epoch ms. Raises ValueError for a malformed query."""
+        if not self.enabled:
+            raise ValueError("Transcript search is disabled (ZIJUS_SEARCH_DB / ZIJUS_TRANSCRIPT_DIR are empty).")
+        return await asyncio.to_thread(self._search, q.strip(), user, kind, session, since, until, before, max(1, min(limit, SEARCH_MAX_LIMIT)))
+
+    def _search(self, q: str, user: str, kind: str, session: str, since: Optional[int], until: Optional[int], before: Optional[int], limit: int) -> dict:
+        db = self._db()
+        t_query = time.perf_counter()
+        # Time bounds -> a coarse id range, so the index walk below never leaves it. Ids only roughly follow
+        # time (segments are indexed one after another, a backfill adds old records last), so the range is
+        # the lowest / highest id in the time span, and ts itself is filtered on as well.
+        low = 1
+        high = before if before is not None else db.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM messages").fetchone()[0]
+        if since is not None:
+            row = db.execute("SELECT MIN(id) FROM messages WHERE ts >= ?", (since,)).fetchone()
+            if row[0] is None: return {"results": [], "next_before": None, "took_ms": 0.0}
+            low = row[0]
+        if until is not None:
+            row = db.execute("SELECT MAX(id) FROM messages WHERE ts < ?", (until,)).fetchone()
+            if row[0] is None: return {"results": [], "next_before": None, "took_ms": 0.0}
+            high = min(high, row[0] + 1)
+
+        match = " AND ".join(part for part in (
+            f"text : ({q})" if q else "", f"user : {_quote(user)}" if user else "", f"kind : {_quote(kind)}" if kind else "",
+        ) if part)
+        id_column = "messages_fts.rowid" if match else "m.id"  # Bounds on the FTS rowid are handled inside FTS5
+        where, params = [], []
+        if match:
+            where.append("messages_fts MATCH ?")
+            params.append(match)
+        for column, value in (("session", session), ("user", user), ("kind", kind)):
+            if value:  # Exact, on top of the token match above ("widget" also matches widget_event there)
+                where.append(f"m.{column} = ?")
+                params.append(value)
+        for condition, value in (("m.ts >= ?", since), ("m.ts < ?", until)):
+            if value is not None:
+                where.append(condition)
+                params.append(value)
+        sql = (
+            "SELECT m.id, m.ts, m.session, m.user, m.kind, m.m, "
+            + ("snippet(messages_fts, 0, '[', ']', '…', 16) FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid " if match
+               else "substr(m.text, 1, 200) FROM messages m ")
+            + f"WHERE {' AND '.join([*where, f'{id_column} >= ?', f'{id_column} < ?'])} ORDER BY {id_column} DESC LIMIT ?"
+        )
+        # A rare match (a phrase of common words, say) can mean walking the whole index. Walk it newest first in
+        # id windows, each sized by the scan rate so far to fit the rest of the time budget, and stop at `limit` hits.
+        rows, rate = [], 0.0
+        window = self._windows.get(match, SEARCH_WINDOW) if match else high
+        deadline = t_query + SEARCH_BUDGET_MS / 1000
+        try:
+            while high > low and len(rows) < limit:
+                t_round = time.perf_counter()
+                start = max(low, high - window)
+                found = db.execute(sql, (*params, start, high, limit - len(rows))).fetchall()
+                now = time.perf_counter()
+                if len(found) < limit - len(rows):  # Walked the whole window: ids per second for this query
+                    rate = (high - start) / max(now - t_round, 1e-4)
+                rows += found
+                high = start
+                window = int(rate * (deadline - now) * 0.8)
+                if window < SEARCH_WINDOW: break  # Too little budget left for a round worth its fixed cost
+        except sqlite3.OperationalError as e:
+            raise ValueError(f"Invalid search query: {e}")
+        if match and rate:  # The next page of this search starts with a window that fills its budget
+            if len(self._windows) > SEARCH_WINDOW_CACHE: self._windows.clear()
+            self._windows[match] = max(SEARCH_WINDOW, int(rate * SEARCH_BUDGET_MS / 1000 * 0.8))
+        return {
+            "results": [{"id": r[0], "ts": r[1], "session": r[2], "user": r[3], "kind": r[4], "m_id": r[5], "snippet": r[6]} for r in rows],
+            # Full page: continue after its last hit. Short page with ids left: the budget ran out, continue below the window.
+            "next_before": rows[-1][0] if len(rows) == limit else (high if high > low else None),
+            "took_ms": round((time.perf_counter() - t_query) * 1000, 1),
+        }
+
+
+transcript_index = TranscriptIndex()
@@ -0,0 +1,293 @@
+"""
+Server-side normalization of microphone audio to what the Live API expects: 16 kHz, mono, int16 little-endian.
+
+Browsers capture at 44.1/48 kHz, often as float32 and sometimes in stereo. The client describes its raw
+PCM in the AudioMessage mimeType, e.g.
+    audio/pcm;rate=48000;channels=2;format=f32le     (format: s16le (default) or f32le)
+and AudioNormalizer converts it with NumPy on reusable buffers (no per-sample Python loops).
+Audio that is already 16 kHz mono s16le is passed through untouched. Compressed containers
+(webm/ogg/opus) are not decoded here.
+
+Browsers often send mic chunks of only a few ms. FrameAggregator packs them into AUDIO_FRAME_MS frames
+before normalizing and sending, so the Live queue sees one Blob per frame instead of one per chunk.
+"""
+import os
+import re
+import asyncio
+import logging
+from functools import lru_cache
+from typing import Callable, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TARGET_RATE = 16000
+TARGET_MIME = f"audio/pcm;rate={TARGET_RATE}"
+AUDIO_FRAME_MS = int(os.getenv("ZIJUS_AUDIO_FRAME_MS", "40"))  # 20, 40 or 60
+SILENCE_PEAK = 0.01  # Chunk peak (full scale = 1) below which the mic counts as silent
+
+PARAM_RE = re.compile(r"(\w+)=([\w.]+)")
+SAMPLE_FORMATS = {"s16le": np.dtype("<i2"), "f32le": np.dtype("<f4")}
+
+
+@lru_cache(maxsize=64)  # Clients repeat the same mime type on every chunk
+def parse_audio_mime(mime_type: str) -> Optional[tuple[int, int, str]]:
+    """(rate, channels, format) of a raw PCM mime type, or None for anything else."""
+    mime_type = (mime_type or "audio/pcm").lower()
+    if not mime_type.startswith(("audio/pcm", "audio/l16", "audio/raw")):
+        return None
+    params = dict(PARAM_RE.findall(mime_type))
+    sample_format = params.get("format", "s16le")
+    if sample_format not in SAMPLE_FORMATS:
+        return None
+    return int(float(params.get("rate", TARGET_RATE))), int(params.get("channels", 1)), sample_format
+
+
+class _Scratch:
+    """Grow-only work buffers, so steady-state chunks allocate nothing new."""
+    def __init__(self):
+        self._buffers: dict = {}
+
+    def get(self, name: str, size: int, dtype=np.float32) -> np.ndarray:
+        buf = self._buffers.get(name)
+        if buf is None or buf.size < size:
+            buf = self._buffers[name] = np.empty(max(size, 4096), dtype=dtype)
+        return buf[:size]
+
+
+class AudioNormalizer:
+    """
+    Streaming converter for one client connection.
+
+    Downmixes to mono, low-passes with a moving average as wide as the decimation step, and resamples
+    by linear interpolation. The interpolation phase, filter history and any partial frame are carried
+    across chunks, so splitting the input differently gives the same output.
+    """
+    def __init__(self, target_rate: int = TARGET_RATE):
+        self.target_rate = target_rate
+        self.source: Optional[tuple[int, int, str]] = None
+        self._scratch = _Scratch()
+        self._partial = b""
+        self._ramp_cache = np.zeros(0, dtype=np.float64)
+        self._reset_stream()
+
+    def _reset_stream(self):
+        self._phase = 0.0                # Position of the next output sample, relative to the chunk start
+        self._history = np.zeros(0, dtype=np.float32)  # Last filtered samples (index -1 = previous chunk end)
+        self._filter_tail = np.zeros(0, dtype=np.float32)
+
+    def normalize(self, data: bytes, mime_type: str) -> Optional[bytes]:
+        """16 kHz mono s16le bytes for one chunk, b"" while a frame is incomplete, or None if unsupported."""
+        source = parse_audio_mime(mime_type)
+        if source is None:
+            return None
+        rate, channels, sample_format = source
+        if source != self.source:
+            # New format (or first chunk): start a fresh stream
+            self.source, self._partial = source, b""
+            self._reset_stream()
+        if rate == self.target_rate and channels == 1 and sample_format == "s16le":
+            return data
+
+        dtype = SAMPLE_FORMATS[sample_format]
+        frame_bytes = dtype.itemsize * channels
+        data = self._partial + data if self._partial else data
+        usable = len(data) - len(data) % frame_bytes
+        self._partial = data[usable:]
+        if not usable:
+            return b""
+
+        samples = np.frombuffer(data, dtype=dtype, count=usable // dtype.itemsize)
+        mono = self._to_mono_float(samples, channels, sample_format)
+        out = self._resample(mono, rate) if rate != self.target_rate else mono
+        return self._to_int16(out)
+
+    def _to_mono_float(self, samples: np.ndarray, channels: int, sample_format: str) -> np.ndarray:
+        frames = samples.size // channels
+        mono = self._scratch.get("mono", frames)
+        if channels == 1:
+            mono[:] = samples
+        else:
+            np.mean(samples.reshape(frames, channels), axis=1, out=mono, dtype=np.float32)
+        if sample_format == "s16le":
+            mono *= 1 / 32768
+        return mono
+
+    def _resample(self, x: np.ndarray, rate: int) -> np.ndarray:
+        step = rate / self.target_rate
+
+        # 1. Anti-alias: moving average over `width` input samples (only when downsampling)
+        width = int(step) if step >= 2 else 1
+        if width > 1:
+            if self._filter_tail.size != width - 1:
+                self._filter_tail = np.zeros(width - 1, dtype=np.float32)
+            padded = self._scratch.get("padded", x.size + width)
+            padded[0] = 0.0
+            padded[1:width] = self._filter_tail
+            padded[width:] = x
+            np.cumsum(padded, out=padded)
+            filtered = self._scratch.get("filtered", x.size)
+            np.subtract(padded[width:], padded[:-width], out=filtered)
+            filtered *= 1 / width
+            self._filter_tail = x[-(width - 1):].copy() if x.size >= width - 1 else np.concatenate([self._filter_tail, x])[-(width - 1):]
+        else:
+            filtered = x
+
+        # 2. Linear interpolation at positions phase, phase + step, ... (index -1 = last sample of the previous chunk)
+        n = filtered.size
+        buf = self._scratch.get("buf", n + 1)
+        buf[0] = self._history[-1] if self._history.size else filtered[0]
+        buf[1:] = filtered
+        if self._phase > n - 1:
+            self._phase -= n
+            self._history = filtered[-1:].copy()
+            return filtered[:0]
+        count = int((n - 1 - self._phase) // step) + 1
+        pos = self._scratch.get("pos", count, np.float64)
+        np.multiply(self._ramp(count), step, out=pos)
+        pos += self._phase + 1  # Always > 0, so truncating to int is floor()
+        idx = self._scratch.get("idx", count, np.int64)
+        np.copyto(idx, pos, casting="unsafe")
+        np.minimum(idx, n - 1, out=idx)
+        frac = self._scratch.get("frac", count)
+        np.subtract(pos, idx, out=frac, casting="unsafe")
+        out = self._scratch.get("out", count)
+        np.take(buf, idx, out=out)
+        idx += 1
+        upper = self._scratch.get("upper", count)
+        np.take(buf, idx, out=upper)
+        upper -= out
+        upper *= frac
+        out += upper
+
+        self._phase = self._phase + count * step - n
+        self._history = filtered[-1:].copy()
+        return out
+
+    def _ramp(self, count: int) -> np.ndarray:
+        """0, 1, ..., count-1 as float64, sliced from a cached array."""
+        if self._ramp_cache.size < count:
+            self._ramp_cache = np.arange(max(count, 4096), dtype=np.float64)
+        return self._ramp_cache[:count]
+
+    def _to_int16(self, x: np.ndarray) -> bytes:
+        scaled = self._scratch.get("scaled", x.size)
+        np.multiply(x, 32767, out=scaled)
+        np.clip(scaled, -32768, 32767, out=scaled)
+        pcm = self._scratch.get("pcm", x.size, np.dtype("<i2"))
+        np.copyto(pcm, scaled, casting="unsafe")
+        return pcm.tobytes()
+
+
+class FrameAggregator:
+    """
+    Packs small client chunks into frame_ms frames of the client's own format in a preallocated buffer,
+    then normalizes and sends each frame in one call. A partial frame is flushed early when speech turns
+    to silence (so end of speech reaches the model promptly), or after frame_ms if no more audio arrives.
+
+    send(pcm_bytes, mime_type) is synchronous, like LiveRequestQueue.send_realtime.
+    """
+    def __init__(self, send: Callable[[bytes, str], None], normalizer: Optional[AudioNormalizer] = None, frame_ms: int = AUDIO_FRAME_MS):
+        self.send = send
+        self.normalizer = normalizer or AudioNormalizer()
+        self.frame_ms = frame_ms
+        self.mime = ""
+        self.source: Optional[tuple[int, int, str]] = None
+        self.frame_bytes = 0
+        self._buf = bytearray()
+        self._view = memoryview(self._buf)
+        self._fill = 0
+        self._speaking = False
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._partial_since = 0.0  # Loop time the oldest unsent byte arrived
+        self.stats = {"chunks_in": 0, "frames_out": 0, "sends": 0, "flush_full": 0, "flush_silence": 0, "flush_timer": 0, "flush_format": 0}
+
+    def push(self, data: bytes, mime_type: str):
+        self.stats["chunks_in"] += 1
+        source = parse_audio_mime(mime_type)
+        if source is None:
+            # Not raw PCM: nothing to aggregate or normalize
+            self.flush("format")
+            self.stats["sends"] += 1
+            self.send(data, mime_type)
+            return
+        if source != self.source:
+            self.flush("format")
+            self._set_format(source, mime_type)
+
+        silent = self._is_silent(data)
+        if not self._fill and len(data) >= self.frame_bytes:
+            # Already frame-sized: send as is, without copying through the buffer
+            self.stats["frames_out"] += 1
+            self.stats["flush_full"] += 1
+            self._send_normalized(data)
+            self._speaking = not silent
+            return
+        view = memoryview(data)
+        while len(view):
+            n = min(len(view), len(self._buf) - self._fill)
+            self._view[self._fill:self._fill + n] = view[:n]
+            self._fill += n
+            view = view[n:]
+            if self._fill == len(self._buf):
+                self.flush("full")
+
+        if silent and self._speaking:
+            self.flush("silence")
+        self._speaking = not silent
+        if self._fill:
+            if not self._partial_since: self._partial_since = asyncio.get_running_loop().time()
+            if self._timer is None: self._arm_timer(self.frame_ms / 1000)
+
+    def _arm_timer(self, delay_s: float):
+        self._timer = asyncio.get_running_loop().call_later(delay_s, self._on_timer)
+
+    def _on_timer(self):
+        # One timer at a time, re-armed lazily rather than cancelled and recreated for every frame
+        self._timer = None
+        if not self._fill:
+            return
+        age_s = asyncio.get_running_loop().time() - self._partial_since
+        if age_s >= self.frame_ms / 1000:
+            self.flush("timer")
+        else:
+            self._arm_timer(self.frame_ms / 1000 - age_s)
+
+    def flush(self, reason: str = "timer"):
+        """Normalizes and sends the buffered frame (whole, or partial on silence/timer/format change)."""
+        self._partial_since = 0.0
+        if not self._fill:
+            return
+        data = bytes(self._view[:self._fill])
+        self.stats["frames_out"] += 1
+        self.stats[f"flush_{reason}"] += 1
+        self._fill = 0
+        self._send_normalized(data)
+
+    def _send_normalized(self, data: bytes):
+        pcm = self.normalizer.normalize(data, self.mime)
+        if pcm:
+            self.stats["sends"] += 1
+            self.send(pcm, TARGET_MIME)
+
+    def close(self):
+        if self._timer is not None: self._timer.cancel()
+        self.flush("timer")
+        logger.info(f"Audio frame aggregation: {self.stats}")
+
+    def _set_format(self, source: tuple[int, int, str], mime_type: str):
+        rate, channels, sample_format = source
+        self.source, self.mime = source, mime_type
+        self.frame_bytes = rate * self.frame_ms // 1000 * channels * SAMPLE_FORMATS[sample_format].itemsize
+        self._buf = bytearray(self.frame_bytes)
+        self._view = memoryview(self._buf)
+        self._fill = 0
+
+    def _is_silent(self, data: bytes) -> bool:
+        dtype = SAMPLE_FORMATS[self.source[2]]  # type: ignore
+        samples = np.frombuffer(data, dtype=dtype, count=len(data) // dtype.itemsize)
+        if not samples.size:
+            return True
+        peak = max(float(samples.max()), -float(samples.min()))
+        return peak < SILENCE_PEAK * (32768 if dtype.itemsize == 2 else 1)
@@ -0,0 +1,117 @@
+"""
+Optional Opus encoding of bot audio for clients that ask for it.
+
+The Live API returns 24 kHz 16-bit mono PCM (384 kbit/s, ~512 kbit/s once base64'd into JSON). Opus voice
+at ZIJUS_OPUS_BITRATE (default 24 kbit/s) is more than 10x smaller. Encoding runs on a shared thread pool
+(libopus is called through ctypes, which releases the GIL) so it never blocks the event loop.
+
+Negotiation: the client lists what it can decode on the WebSocket URL, e.g. /ws?audio_codecs=opus,pcm.
+The server answers with "audio_codec" in the session message. Opus is used only when the client lists it,
+ZIJUS_OPUS is not off, and opuslib + libopus are installed (`pip install opuslib`, `apt install libopus0`).
+Everyone else keeps getting PCM.
+
+Opus AudioMessages carry 20 ms packets, each prefixed with its length (uint16 big-endian), in `data`:
+    mime_type: audio/opus;rate=24000;frame_ms=20;framing=u16be
+"""
+import os
+import re
+import struct
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+OPUS_ENABLED = os.getenv("ZIJUS_OPUS", "true").lower() not in ("0", "false", "no", "off")
+OPUS_BITRATE = int(os.getenv("ZIJUS_OPUS_BITRATE", "24000"))
+OPUS_COMPLEXITY = int(os.getenv("ZIJUS_OPUS_COMPLEXITY", "5"))  # 0-10: CPU vs quality
+OPUS_WORKERS = int(os.getenv("ZIJUS_OPUS_WORKERS", str(os.cpu_count() or 2)))
+FRAME_MS = 20
+OPUS_RATES = (8000, 12000, 16000, 24000, 48000)
+
+RATE_RE = re.compile(r"rate=(\d+)")
+
+try:
+    import opuslib
+except Exception as e:  # ImportError, or opuslib failing to find libopus
+    opuslib = None
+    if OPUS_ENABLED: logger.info(f"Opus unavailable ({e}); bot audio will be sent as PCM.")
+
+_pool: Optional[ThreadPoolExecutor] = None  # Shared by all connections
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=OPUS_WORKERS, thread_name_prefix="opus")
+    return _pool
+
+
+class OpusStream:
+    """
+    Stateful encoder for one connection's bot audio. encode_sync() is the CPU part and runs in the pool;
+    calls for one stream must not overlap (the downstream loop awaits each one).
+    """
+    def __init__(self):
+        self.rate = 0
+        self.encoder = None
+        self._pending = b""  # PCM shorter than one frame, carried to the next chunk
+
+    @property
+    def mime_type(self) -> str:
+        return f"audio/opus;rate={self.rate};frame_ms={FRAME_MS};framing=u16be"
+
+    def accepts(self, mime_type: str) -> bool:
+        """Raw PCM at a rate Opus can encode natively (the Live API sends audio/pcm;rate=24000)."""
+        match = RATE_RE.search(mime_type or "")
+        return (mime_type or "").startswith("audio/pcm") and bool(match) and int(match.group(1)) in OPUS_RATES  # type: ignore
+
+    def _open(self, rate: int):
+        self.rate, self._pending = rate, b""
+        self.encoder = opuslib.Encoder(rate, 1, opuslib.APPLICATION_VOIP)  # type: ignore
+        self.encoder.bitrate = OPUS_BITRATE
+        self.encoder.complexity = OPUS_COMPLEXITY
+
+    def encode_sync(self, pcm: bytes, rate: int, flush: bool = False) -> tuple[bytes, float]:
+        """Framed Opus packets for whole 20 ms frames of `pcm`, and their duration in seconds."""
+        if rate != self.rate:
+            self._open(rate)
+        frame_samples = rate * FRAME_MS // 1000
+        frame_bytes = frame_samples * 2
+        data = self._pending + pcm if self._pending else pcm
+        if flush and len(data) % frame_bytes:
+            data += b"\0" * (frame_bytes - len(data) % frame_bytes)  # Pad the turn's last frame with silence
+        usable = len(data) - len(data) % frame_bytes
+        self._pending = data[usable:]
+        out = bytearray()
+        for i in range(0, usable, frame_bytes):
+            packet = self.encoder.encode(data[i:i + frame_bytes], frame_samples)  # type: ignore
+            out += struct.pack(">H", len(packet)) + packet
+        return bytes(out), usable // frame_bytes * FRAME_MS / 1000
+
+    async def encode(self, pcm: bytes, mime_type: str = "", flush: bool = False) -> tuple[bytes, float]:
+        match = RATE_RE.search(mime_type or "")
+        rate = int(match.group(1)) if match else (self.rate or 24000)
+        return await asyncio.get_running_loop().run_in_executor(_get_pool(), self.encode_sync, pcm, rate, flush)
+
+    async def flush(self) -> tuple[bytes, float]:
+        """Encodes whatever is left at the end of a turn."""
+        if not self._pending:
+            return b"", 0.0
+        return await self.encode(b"", "", flush=True)
+
+    def drop_pending(self):
+        """Barge-in: the partial frame belongs to audio the user will never hear."""
+        self._pending = b""
+
+
+def negotiate(audio_codecs: str) -> Optional[OpusStream]:
+    """An OpusStream if the client accepts Opus and the server can encode it, else None (send PCM)."""
+    accepted = [c.strip().lower() for c in (audio_codecs or "").split(",")]
+    if "opus" not in accepted or not OPUS_ENABLED:
+        return None
+    if opuslib is None:
+        logger.warning("Client asked for Opus but opuslib/libopus is not installed; sending PCM.")
+        return None
+    return OpusStream()
@@ -0,0 +1,121 @@
+"""
+permessage-deflate (RFC 7692) with a per-connection and per-message policy.
+
+uvicorn's own setup negotiates deflate with every client that offers it, then compresses every frame with
+zlib defaults (level 6, 32 KB window, memLevel 8). That is about 300 KB of zlib state per connection, and
+in a voice session most of the CPU goes into base64 audio that shrinks by less than a third. Run the app
+with this module's protocol instead:
+
+    uvicorn.run(app, host="0.0.0.0", port=8000, ws=WebSocketProtocol)
+
+It subclasses uvicorn's legacy websockets protocol (websockets_impl), whose internals change between
+releases, so requirements.txt pins the uvicorn and websockets versions it was tested with (0.54.0, 15.0.1).
+
+Per connection (negotiated at the handshake): ZIJUS_WS_DEFLATE=on / off sets the default, and a client
+can override it with ?deflate=0 / ?deflate=1 on the /ws URL. Once deflate is negotiated the browser
+compresses every message it sends, mic audio included. A phone that streams audio may prefer ?deflate=0.
+
+Per message (RFC 7692 lets every message choose), these are sent uncompressed:
+  - message types in ZIJUS_WS_DEFLATE_SKIP (AudioMessage by default)
+  - binary frames (media)
+  - messages under ZIJUS_WS_DEFLATE_MIN_BYTES
+Everything else (streamed text deltas, widgets, long answers) is compressed at ZIJUS_WS_DEFLATE_LEVEL with
+a 2^ZIJUS_WS_DEFLATE_WINDOW_BITS window (about 50 KB per connection at the defaults). The window is kept
+between messages (context takeover), so a 150-byte delta repeating the previous one's keys and m_id goes
+out as ~20 bytes. See examples/tools/python/deflate-bench for CPU vs. bytes saved per message class.
+"""
+import os
+import logging
+from typing import Optional
+from urllib.parse import parse_qs
+
+from websockets.extensions.permessage_deflate import PerMessageDeflate, ServerPerMessageDeflateFactory
+from websockets.frames import CTRL_OPCODES, Frame, Opcode
+from uvicorn.protocols.websockets import websockets_impl
+
+logger = logging.getLogger(__name__)
+
+WS_DEFLATE = os.getenv("ZIJUS_WS_DEFLATE", "on").lower() not in ("off", "0", "false")
+WS_DEFLATE_MIN_BYTES = int(os.getenv("ZIJUS_WS_DEFLATE_MIN_BYTES", "96"))
+WS_DEFLATE_SKIP = [t.strip() for t in os.getenv("ZIJUS_WS_DEFLATE_SKIP", "AudioMessage").split(",") if t.strip()]
+WS_DEFLATE_LEVEL = int(os.getenv("ZIJUS_WS_DEFLATE_LEVEL", "1"))
+WS_DEFLATE_WINDOW_BITS = int(os.getenv("ZIJUS_WS_DEFLATE_WINDOW_BITS", "12"))  # 9-15
+WS_DEFLATE_MEM_LEVEL = int(os.getenv("ZIJUS_WS_DEFLATE_MEM_LEVEL", "5"))  # 1-9
+
+# Starlette's send_json writes compact JSON, and the skipped types put "type" up front
+SKIP_MARKERS = [f'"type":"{t}"'.encode() for t in WS_DEFLATE_SKIP]
+SNIFF_BYTES = 64
+
+deflate_stats = {"connections": 0, "negotiated": 0, "compressed": 0, "skipped": 0, "bytes_in": 0, "bytes_out": 0}
+
+
+def should_compress(frame: Frame) -> bool:
+    if frame.opcode is Opcode.BINARY or len(frame.data) < WS_DEFLATE_MIN_BYTES:
+        return False
+    head = frame.data[:SNIFF_BYTES]
+    for marker in SKIP_MARKERS:
+        if marker in head: return False
+    return True
+
+
+class SelectiveDeflate(PerMessageDeflate):
+    """PerMessageDeflate that sends the messages should_compress() rejects as they are (RSV1 unset)."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._compressing = False  # Decision for the message in flight, kept for its continuation frames
+
+    def encode(self, frame: Frame) -> Frame:
+        if frame.opcode is not Opcode.CONT:
+            if frame.opcode in CTRL_OPCODES:
+                return frame
+            self._compressing = should_compress(frame)
+            deflate_stats["compressed" if self._compressing else "skipped"] += 1
+        if not self._compressing:
+            return frame
+        encoded = super().encode(frame)
+        deflate_stats["bytes_in"] += len(frame.data)
+        deflate_stats["bytes_out"] += len(encoded.data)
+        return encoded
+
+
+class SelectiveDeflateFactory(ServerPerMessageDeflateFactory):
+    def process_request_params(self, params, accepted_extensions):
+        response, extension = super().process_request_params(params, accepted_extensions)
+        return response, SelectiveDeflate(
+            extension.remote_no_context_takeover, extension.local_no_context_takeover,
+            extension.remote_max_window_bits, extension.local_max_window_bits, extension.compress_settings,
+        )
+
+
+def deflate_factory() -> SelectiveDeflateFactory:
+    return SelectiveDeflateFactory(
+        server_max_window_bits=WS_DEFLATE_WINDOW_BITS,
+        client_max_window_bits=WS_DEFLATE_WINDOW_BITS,  # Caps the client's window too, and so our inflate buffers
+        compress_settings={"level": WS_DEFLATE_LEVEL, "memLevel": WS_DEFLATE_MEM_LEVEL},
+    )
+
+
+def wants_deflate(path: str) -> bool:
+    """ZIJUS_WS_DEFLATE, unless the connection URL says ?deflate=0 / ?deflate=1."""
+    value = parse_qs(path.partition("?")[2]).get("deflate", [""])[0].lower()
+    if value in ("0", "off", "false"): return False
+    if value in ("1", "on", "true"): return True
+    return WS_DEFLATE
+
+
+class WebSocketProtocol(websockets_impl.WebSocketProtocol):
+    """uvicorn's websockets protocol with the deflate policy above (uvicorn.run(app, ws=WebSocketProtocol))."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._deflate: Optional[bool] = None
+        self._factory = deflate_factory()
+
+    async def process_request(self, path, request_headers):
+        self._deflate = wants_deflate(path)
+        deflate_stats["connections"] += 1
+        return await super().process_request(path, request_headers)
+
+    def process_extensions(self, headers, available_extensions):
+        header, extensions = super().process_extensions(headers, [self._factory] if self._deflate else [])
+        deflate_stats["negotiated"] += bool(extensions)
+        return header, extensions
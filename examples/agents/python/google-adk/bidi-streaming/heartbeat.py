@@ -0,0 +1,123 @@
+"""
+Application-level heartbeat and idle-session reaper.
+
+The /ws receive loop waits on receive_text() for as long as the socket looks open. A phone that went to
+sleep, or a NAT that dropped the flow, can leave a half-open connection that nothing ever closes. Its
+agent, history, voice pipeline and tasks then stay in memory for good. A single reaper loop handles
+every session:
+
+  - Every ZIJUS_PING_INTERVAL_S it sends {"type": "ping", "ts": <ms>}, and the client answers
+    {"type": "pong"}. Once a client has answered a ping, silence for longer than the interval plus
+    ZIJUS_PONG_TIMEOUT_S closes the session as dead. Clients that never answer pings are only
+    reaped for idleness, plus the server's protocol-level pings.
+  - A session with no client message and no running turn for ZIJUS_IDLE_TIMEOUT_S is closed as idle.
+
+Closing a session runs the handler's usual cleanup, which cancels the turn and closes the voice pipeline
+and transcript. State that outlives the connection (an agent, a history, a checkpointed thread) is then
+hibernated. It moves to the handoff store (drain.py), and the next connect with the same session_id
+restores it.
+"""
+import os
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+from drain import handoff
+
+logger = logging.getLogger(__name__)
+
+PING_INTERVAL_S = float(os.getenv("ZIJUS_PING_INTERVAL_S", "20"))  # 0 = no reaper
+PONG_TIMEOUT_S = float(os.getenv("ZIJUS_PONG_TIMEOUT_S", "20"))
+IDLE_TIMEOUT_S = float(os.getenv("ZIJUS_IDLE_TIMEOUT_S", "1800"))  # 0 = never close idle sessions
+SEND_TIMEOUT_S = 5.0  # A ping stuck this long in a full send buffer means the peer is gone
+
+
+class Liveness:
+    """Last signs of life of one session."""
+    def __init__(self, websocket, busy: Callable[[], bool]):
+        self.websocket, self.busy = websocket, busy
+        self.last_seen = self.last_active = time.monotonic()
+        self.answers_pings = False
+        self.reaped: Optional[str] = None  # "dead" or "idle" once the reaper closed the session
+
+    def inbound(self, msg_type) -> bool:
+        """Call for every client message. Returns True for a pong, which the caller should skip."""
+        self.last_seen = time.monotonic()
+        if msg_type == "pong":
+            self.answers_pings = True
+            return True
+        self.last_active = self.last_seen
+        return False
+
+
+class Reaper:
+    def __init__(self):
+        self.sessions: set = set()
+        self._loop: Optional[asyncio.Task] = None
+        self._closing = False
+        self.stats = {"sessions": 0, "pings": 0, "reaped_dead": 0, "reaped_idle": 0,
+                      "hibernated": 0, "hibernated_bytes": 0, "hibernate_errors": 0}
+
+    def track(self, websocket, busy: Callable[[], bool]) -> Liveness:
+        liveness = Liveness(websocket, busy)
+        self.sessions.add(liveness)
+        self.stats["sessions"] = len(self.sessions)
+        if self._loop is None and PING_INTERVAL_S > 0 and not self._closing:
+            self._loop = asyncio.create_task(self._run())
+        return liveness
+
+    def untrack(self, liveness: Liveness):
+        self.sessions.discard(liveness)
+        self.stats["sessions"] = len(self.sessions)
+
+    async def _run(self):
+        while not self._closing:
+            await asyncio.sleep(PING_INTERVAL_S)
+            await asyncio.gather(*(self._check(liveness) for liveness in list(self.sessions)), return_exceptions=True)
+
+    async def _check(self, liveness: Liveness):
+        now = time.monotonic()
+        if liveness.answers_pings and now - liveness.last_seen > PING_INTERVAL_S + PONG_TIMEOUT_S:
+            return await self._reap(liveness, "dead")
+        if IDLE_TIMEOUT_S > 0 and now - liveness.last_active > IDLE_TIMEOUT_S and not liveness.busy():
+            return await self._reap(liveness, "idle")
+        try:
+            await asyncio.wait_for(liveness.websocket.send_json({"type": "ping", "ts": int(time.time() * 1000)}), SEND_TIMEOUT_S)
+            self.stats["pings"] += 1
+        except asyncio.TimeoutError:
+            await self._reap(liveness, "dead")
+        except Exception: pass  # Already closed; the handler is cleaning up
+
+    async def _reap(self, liveness: Liveness, reason: str):
+        """Closing makes the handler's receive_text() raise WebSocketDisconnect, so its cleanup runs."""
+        liveness.reaped = reason
+        self.stats[f"reaped_{reason}"] += 1
+        self.untrack(liveness)
+        try: await asyncio.wait_for(liveness.websocket.close(code=1001, reason=reason), SEND_TIMEOUT_S)
+        except Exception: pass
+
+    async def hibernate(self, session_id: str, export: Callable[[], Awaitable[Optional[bytes]]], release: Callable[[], Awaitable]):
+        """Moves a reaped session's state out of memory into the handoff store. Kept in memory if export() has nothing or the save fails."""
+        if not handoff.path: return
+        try:
+            state = await export()
+            if state is None: return  # Nothing saved, so nothing may be released
+            await handoff.save(session_id, state)
+            self.stats["hibernated"] += 1
+            self.stats["hibernated_bytes"] += len(state)
+            await release()  # Only once the state is safely in the handoff store
+        except Exception as e:
+            self.stats["hibernate_errors"] += 1
+            logger.error(f"Could not hibernate session {session_id}: {e}")
+
+    async def close(self):
+        self._closing = True
+        if self._loop is not None:
+            self._loop.cancel()  # Only ever sleeping or pinging, nothing to lose
+            try: await self._loop
+            except asyncio.CancelledError: pass
+            self._loop = None
+
+
+reaper = Reaper()
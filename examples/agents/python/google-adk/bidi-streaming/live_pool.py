@@ -0,0 +1,169 @@
+"""
+Pre-warmed Live API connections, so a new voice session doesn't pay the Live connect + setup handshake.
+
+ADK opens the Live connection inside `runner.run_live()` through the agent model's `connect()`. PooledGemini
+overrides that method. It hands out an already opened connection when one matches the request (same model,
+voice, transcription, tools and system instruction), and otherwise connects as usual. The first connection
+after start-up is always a miss: it teaches the pool the exact connect request, and from then on the pool
+keeps ZIJUS_LIVE_POOL_SIZE connections open in the background.
+
+  ZIJUS_LIVE_POOL_SIZE     warm connections to keep (0 = off, the default)
+  ZIJUS_LIVE_POOL_IDLE_S   close and replace connections idle this long (the Live API ends idle sessions)
+  ZIJUS_LIVE_POOL_CHECK_S  how often closed/expired connections are pruned and the pool is refilled
+
+Warm connections count against the project's concurrent Live session quota. Requests that can't be
+pre-built never match and connect normally. A request with a resumption handle skips the pool entirely: it
+is neither served from it nor used as the template for refilling it.
+
+Measure first-audio latency with and without the pool against the mock server:
+    python main.py --port 9443 --live-setup-ms 600 ...       (examples/tools/python/mock-model-server)
+    python main.py --url ws://localhost:8000/ws --scenario small-talk --sessions 20 --ramp-rate 1
+                                                              (examples/tools/python/loadtest, see first_audio)
+"""
+import os
+import time
+import asyncio
+import logging
+import contextlib
+from collections import deque
+from typing import Callable, Optional
+
+from google.adk.models.google_llm import Gemini
+from google.adk.models.llm_request import LlmRequest
+
+logger = logging.getLogger(__name__)
+
+LIVE_POOL_SIZE = int(os.getenv("ZIJUS_LIVE_POOL_SIZE", "0"))
+LIVE_POOL_IDLE_S = float(os.getenv("ZIJUS_LIVE_POOL_IDLE_S", "300"))
+LIVE_POOL_CHECK_S = float(os.getenv("ZIJUS_LIVE_POOL_CHECK_S", "15"))
+
+
+def fingerprint(llm_request: LlmRequest) -> Optional[str]:
+    """Everything that goes into the Live setup message. History (contents) is sent after connecting."""
+    try: return llm_request.model_dump_json(exclude={"contents", "tools_dict"})
+    except Exception: return None
+
+
+def resumes(llm_request: LlmRequest) -> bool:
+    """True when the request carries a session resumption handle (ADK copies run_config's into the connect config)."""
+    resumption = getattr(getattr(llm_request, "live_connect_config", None), "session_resumption", None)
+    return bool(getattr(resumption, "handle", None))
+
+
+def is_open(connection) -> bool:
+    """Health check without a round trip: the underlying WebSocket must not have been closed."""
+    ws = getattr(getattr(connection, "_gemini_session", None), "_ws", None)
+    return ws is not None and getattr(ws, "close_code", None) is None
+
+
+class LiveSessionPool:
+    """Idle, already set-up Live connections for one connect request (the most recent one seen)."""
+    def __init__(self, size: int = LIVE_POOL_SIZE, idle_s: float = LIVE_POOL_IDLE_S, check_s: float = LIVE_POOL_CHECK_S):
+        self.size = size
+        self.idle_s = idle_s
+        self.check_s = check_s
+        self.idle: deque = deque()  # (fingerprint, context manager, connection, opened_at)
+        self.template: Optional[tuple[str, Callable]] = None  # (fingerprint, opener returning a connect() context)
+        self.opening = 0
+        self.stats = {"hits": 0, "misses": 0, "opened": 0, "open_errors": 0, "expired": 0, "unhealthy": 0, "resumed": 0}
+        self._maintainer: Optional[asyncio.Task] = None
+
+    def learn(self, key: str, opener: Callable):
+        """Remembers how to open connections like this one, and starts filling the pool."""
+        if self.template is None or self.template[0] != key:
+            self.template = (key, opener)
+            self._discard(lambda entry: entry[0] != key, "expired")
+        if self._maintainer is None:
+            self._maintainer = asyncio.create_task(self._maintain())
+        self._refill()
+
+    def take(self, key: Optional[str]):
+        """A healthy (context manager, connection) for this request, or None."""
+        while self.idle:
+            entry_key, cm, connection, opened_at = self.idle.popleft()
+            if entry_key == key and is_open(connection) and time.monotonic() - opened_at < self.idle_s:
+                self.stats["hits"] += 1
+                self._refill()
+                return cm, connection
+            self.stats["unhealthy" if not is_open(connection) else "expired"] += 1
+            asyncio.create_task(self._close(cm))
+        self.stats["misses"] += 1
+        return None
+
+    def _refill(self):
+        if self.template is None:
+            return
+        for _ in range(self.size - len(self.idle) - self.opening):
+            self.opening += 1
+            asyncio.create_task(self._open(*self.template))
+
+    async def _open(self, key: str, opener: Callable):
+        try:
+            cm = opener()
+            connection = await cm.__aenter__()
+            self.stats["opened"] += 1
+            self.idle.append((key, cm, connection, time.monotonic()))
+        except Exception as e:
+            self.stats["open_errors"] += 1
+            logger.warning(f"Live pool: could not pre-open a connection: {e}")
+        finally:
+            self.opening -= 1
+
+    async def _maintain(self):
+        """Health check: prune closed and expired connections, then top the pool back up."""
+        while True:
+            await asyncio.sleep(self.check_s)
+            now = time.monotonic()
+            self._discard(lambda entry: not is_open(entry[2]), "unhealthy")
+            self._discard(lambda entry: now - entry[3] >= self.idle_s, "expired")
+            self._refill()
+
+    def _discard(self, predicate: Callable, reason: str):
+        keep = deque()
+        for entry in self.idle:
+            if predicate(entry):
+                self.stats[reason] += 1
+                asyncio.create_task(self._close(entry[1]))
+            else:
+                keep.append(entry)
+        self.idle = keep
+
+    async def _close(self, cm):
+        try: await cm.__aexit__(None, None, None)
+        except Exception: pass
+
+    async def close(self):
+        if self._maintainer is not None: self._maintainer.cancel()
+        while self.idle:
+            await self._close(self.idle.popleft()[1])
+        logger.info(f"Live pool stats: {self.stats}")
+
+
+pool = LiveSessionPool()
+
+
+class PooledGemini(Gemini):
+    """Gemini model whose Live connections come from `pool` when a warm one matches."""
+
+    @contextlib.asynccontextmanager
+    async def connect(self, llm_request: LlmRequest):
+        if resumes(llm_request):  # One user's Live session: not for the pool, and not a template for it either
+            pool.stats["resumed"] += 1
+            async with super().connect(llm_request) as connection:
+                yield connection
+            return
+        key = fingerprint(llm_request)
+        warm = pool.take(key) if key else None
+        if warm is None:
+            if key:
+                template = llm_request.model_copy(deep=True)
+                pool.learn(key, lambda: Gemini.connect(self, template.model_copy(deep=True)))
+            async with super().connect(llm_request) as connection:
+                yield connection
+            return
+
+        cm, connection = warm
+        try:
+            yield connection
+        finally:
+            await pool._close(cm)
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
@@ -13,13 +13,27 @@ from my_agent.agent import root_agent
 import os
 import json
 import asyncio
+from contextlib import asynccontextmanager
 import uuid
 import logging
 import base64
 import time
 from datetime import datetime, timezone
 
-from utils import generate_jwt, validate_jwt, save_feedback
+from utils import generate_jwt, validate_jwt, save_feedback, require_admin
+from feedback import feedback_sink
+from transcripts import transcript_log
+from compression import WebSocketProtocol
+from mux import serve_mux
+from drain import drain, handoff
+from heartbeat import reaper
+from memory import accountant
+from playback import Playback, pcm_duration_s, GATEWAY_BARGE_IN
+from audio import AudioNormalizer, FrameAggregator, TARGET_MIME
+from codec import negotiate
+from video import VideoIngest
+from live_pool import PooledGemini, LIVE_POOL_SIZE, pool as live_pool
+from resumption import handles as resumption
 from zijus_tools import set_websocket_sender
 
 logging.basicConfig(level=logging.INFO)
@@ -28,13 +42,37 @@ logger = logging.getLogger(__name__)
 from dotenv import load_dotenv
 load_dotenv()
 
-app = FastAPI()
+# Pre-warmed Live connections (see live_pool.py)
+if LIVE_POOL_SIZE > 0 and isinstance(root_agent.model, str):
+    root_agent.model = PooledGemini(model=root_agent.model)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    drain.install()  # SIGTERM drains the sessions before the server shuts down
+    yield
+    await live_pool.close()
+    await feedback_sink.close()
+    await transcript_log.close()
+    logger.info(f"Live session resumption: {resumption.summary()}")
+    await reaper.close()
+    await drain.close()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
 templates = Jinja2Templates(directory="templates")
 
 APP_NAME = os.getenv("APP_NAME", "ZijusGoogleBidiApp")
 ZIJUS_JAVASCRIPT = "https://cdn.jsdelivr.net/gh/zijus/zijus-chat-ui@main/dist/zijus-webclient-v0.1.0.js"
+CONTEXT_TRIGGER_TOKENS = int(os.getenv("ZIJUS_CONTEXT_TRIGGER_TOKENS", "100000")) # 0 = no context window compression
+
+# Shared by all connections, so a reconnecting client finds its ADK session (history) again
+session_service = InMemorySessionService()
+runner = Runner(app_name=APP_NAME, agent=root_agent, session_service=session_service)
+
+# Memory accounting (memory.py): ADK sessions (history and state events) of every user
+accountant.register("adk_session", lambda: {session_id: session for sessions in session_service.sessions.get(APP_NAME, {}).values()
+                                            for session_id, session in sessions.items()})
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
@@ -48,8 +86,19 @@ async def read_root(request: Request):
         }
     )
 
+@app.get("/admin/memory", dependencies=[Depends(require_admin)])
+async def admin_memory(top: int = 20, refresh: bool = False):
+    """Estimated memory retained per session and component (memory.py): totals and the `top` sessions."""
+    return await accountant.report(top, refresh)
+
+@app.get("/healthz")
+async def healthz():
+    if drain.draining: raise HTTPException(status_code=503, detail="draining")
+    return {"status": "ok"}
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
+    if drain.draining: return await drain.turn_away(websocket)  # Before any JWT or agent work
     token = websocket.query_params.get("token", "")
     session_id = websocket.query_params.get("session_id", "")
     
@@ -59,28 +108,45 @@ async def websocket_endpoint(websocket: WebSocket):
     
     new_token = await generate_jwt(session_id) if not payload else token
     await websocket.accept()
+    # QA transcript (transcripts.py): everything sent on this socket, and client messages as they arrive
+    transcript = transcript_log.session(session_id, user_id)
+    websocket.send_json = transcript.tap(websocket.send_json)  # type: ignore
 
     async def sender(msg: dict):
         await websocket.send_json(msg)
     set_websocket_sender(sender)
 
-    await websocket.send_json({"type": "session", "token": new_token})
+    # Bot audio codec: Opus for clients that list it in ?audio_codecs= (see codec.py), raw PCM otherwise
+    opus = negotiate(websocket.query_params.get("audio_codecs", ""))
+    await websocket.send_json({"type": "session", "token": new_token, "audio_codec": "opus" if opus else "pcm"})
 
     # Initialize ADK
-    session_service = InMemorySessionService() 
-    runner = Runner(app_name=APP_NAME, agent=root_agent, session_service=session_service)
-
     adk_session = await session_service.get_session(app_name=APP_NAME, user_id=user_id, session_id=session_id) # type: ignore
     if not adk_session:
         await session_service.create_session(app_name=APP_NAME, user_id=user_id, session_id=session_id)
 
+    # Live resumption handles (and their drain handoff rows) belong to this user's session: a client with another
+    # JWT that reuses the session_id must not resume someone else's conversation
+    resume_key = json.dumps([user_id, session_id])
+
+    # A draining worker may have handed over this session's Live resumption handle (drain.py)
+    handed_off = await handoff.take(resume_key)
+    if handed_off: resumption.put(resume_key, handed_off.decode())
+
     # --- BIDI / REALTIME CONFIGURATION ---
     run_config = RunConfig(
         streaming_mode=StreamingMode.BIDI,
         response_modalities=[types.Modality.AUDIO], # Force native audio responses
         input_audio_transcription=types.AudioTranscriptionConfig(),
         output_audio_transcription=types.AudioTranscriptionConfig(),
-        session_resumption=types.SessionResumptionConfig(),
+        # Reconnects with a stored handle continue the same Live session (see resumption.py)
+        session_resumption=types.SessionResumptionConfig(handle=resumption.get(resume_key)),
+        # Long voice sessions slide the context window instead of failing at the limit
+        context_window_compression=types.ContextWindowCompressionConfig(
+            trigger_tokens=CONTEXT_TRIGGER_TOKENS, sliding_window=types.SlidingWindow(target_tokens=CONTEXT_TRIGGER_TOKENS // 2)
+        ) if CONTEXT_TRIGGER_TOKENS > 0 else None,
+        # With gateway barge-in the model keeps generating through user noise and playback.py decides
+        realtime_input_config=types.RealtimeInputConfig(activity_handling=types.ActivityHandling.NO_INTERRUPTION) if GATEWAY_BARGE_IN else None,
         speech_config=types.SpeechConfig(
             voice_config=types.VoiceConfig(
                 prebuilt_voice_config=types.PrebuiltVoiceConfigDict(voice_name="Kore") # type: ignore
@@ -91,10 +157,12 @@ async def websocket_endpoint(websocket: WebSocket):
     live_request_queue = LiveRequestQueue()
 
     # --- 3-TIER STATE MACHINE & LATENCY TRACKING ---
+    playback = Playback(websocket.send_json)
+    # Mic audio -> fixed-size frames of 16 kHz mono int16 (see audio.py)
+    mic_frames = FrameAggregator(lambda pcm, mime: live_request_queue.send_realtime(types.Blob(mime_type=mime, data=pcm)))
+    # Camera/screen frames -> rate-capped, deduplicated, downscaled JPEGs (see video.py)
+    video = VideoIngest(lambda jpeg, mime: live_request_queue.send_realtime(types.Blob(mime_type=mime, data=jpeg)))
     session_state = {
-        "audio_state": "NORMAL", 
-        "pause_buffer": [],
-        "playing_until": 0.0,
         "is_generating": False,
         "turn_start_t0": time.perf_counter(),
         "logged_first_in_tx": False,
@@ -103,30 +171,13 @@ async def websocket_endpoint(websocket: WebSocket):
     }
 
     async def route_bot_message(payload: dict, duration_s: float = 0.0):
-        """Routes audio/text based on the 3-Tier State Machine to prevent audio overlap."""
-        state = session_state["audio_state"]
-        
-        if state == "MUTED":
-            return  # Drop completely (Barge-in successful)
-            
-        if duration_s > 0:
-            loop_now = asyncio.get_running_loop().time()
-            session_state["playing_until"] = max(loop_now, session_state["playing_until"]) + duration_s
-            
-        if state == "PAUSED":
-            session_state["pause_buffer"].append(payload) # Soft pause (Hold in memory)
-        else:
-            try: await websocket.send_json(payload)
-            except Exception: pass
+        """Routes audio/text through the 3-Tier State Machine (see playback.py) to prevent audio overlap."""
+        await playback.route(payload, duration_s)
 
     async def hard_interrupt(reason: str):
         """Immediately stops all bot audio output."""
-        logger.info(f"Barge-in triggered: {reason}")
-        session_state["audio_state"] = "MUTED"
-        session_state["pause_buffer"].clear()
-        session_state["playing_until"] = 0.0
-        try: await websocket.send_json({"source": "assistant", "type": "InterruptMessage", "ts": datetime.now(timezone.utc).isoformat()})
-        except Exception: pass
+        await playback.hard_interrupt(reason)
+        if opus: opus.drop_pending()
 
     # --- TASK 1: UPSTREAM (Client -> Agent) ---
     async def upstream_task():
@@ -137,6 +188,8 @@ async def websocket_endpoint(websocket: WebSocket):
                 except Exception: continue
 
                 msg_type = data_json.get('type')
+                if liveness.inbound(msg_type): continue  # A pong
+                transcript.inbound(data_json)
 
                 # 1. Handle Audio Inputs
                 if msg_type == 'AudioMessage':
@@ -150,11 +203,14 @@ async def websocket_endpoint(websocket: WebSocket):
                             logger.info(f"Received FULL audio payload ({len(audio_bytes)} bytes).")
                             session_state["turn_start_t0"] = time.perf_counter()
                             
-                            is_bot_active = (asyncio.get_running_loop().time() < session_state.get("playing_until", 0)) or session_state.get("is_generating", False)
+                            is_bot_active = playback.is_playing() or session_state.get("is_generating", False)
                             if is_bot_active:
                                 await hard_interrupt(reason="Received full audio upload")
 
-                            mime = data_json.get('mimeType', 'audio/pcm;rate=16000')
+                            mime = data_json.get('mimeType', TARGET_MIME)
+                            pcm = AudioNormalizer().normalize(audio_bytes, mime)
+                            if pcm is not None:
+                                audio_bytes, mime = pcm, TARGET_MIME
                             live_request_queue.send_content(types.Content(
                                 parts=[types.Part(inline_data=types.Blob(mime_type=mime, data=audio_bytes))], role="user"
                             ))
@@ -169,18 +225,30 @@ async def websocket_endpoint(websocket: WebSocket):
                             continue
 
                         # B. Realtime Streaming Audio (WebRTC / Browser Mic)
-                        live_request_queue.send_realtime(types.Blob(
-                            mime_type=data_json.get('mimeType', 'audio/pcm;rate=16000'), 
-                            data=audio_bytes
-                        ))
+                        # Aggregated into frames and resampled/downmixed on the server, since browsers send
+                        # tiny chunks and rarely capture at 16 kHz mono int16. Non-PCM is forwarded unchanged.
+                        mic_frames.push(audio_bytes, data_json.get('mimeType', TARGET_MIME))
+
+                # 2. Camera / screen-share frames
+                elif msg_type == 'VideoFrame':
+                    video.push(data_json.get('data', ''))
+
+                # 3. Client playback progress (drives playback.playing_until)
+                elif msg_type == 'PlaybackAck':
+                    try: playback.on_ack(data_json.get('m_id', ''), float(data_json.get('played_ms', 0)))
+                    except (TypeError, ValueError): pass
 
-                # 2. Handle Text Inputs
+                # 4. Thumbs up/down on a bot message (queued, never blocks this loop)
+                elif msg_type == 'feedback':
+                    await save_feedback(data_json, session_id)
+
+                # 5. Handle Text Inputs
                 elif msg_type == 'TextMessage':
                     content_text = data_json.get('content', '')
                     if content_text:
                         session_state["turn_start_t0"] = time.perf_counter()
                         
-                        is_bot_active = (asyncio.get_running_loop().time() < session_state.get("playing_until", 0)) or session_state.get("is_generating", False)
+                        is_bot_active = playback.is_playing() or session_state.get("is_generating", False)
                         if is_bot_active:
                             await hard_interrupt(reason="User typed text")
                             
@@ -188,14 +256,14 @@ async def websocket_endpoint(websocket: WebSocket):
                             parts=[types.Part(text=content_text)], role="user"
                         ))
 
-                # 3. Handle Widget/Form Interactions
+                # 6. Handle Widget/Form Interactions
                 elif msg_type == 'WidgetEvent':
                     payload = data_json.get("widgetEvent", {}).get("payload", {})
                     text_content = "\n".join(f"{k}: {v}" for k, v in payload.items()).strip()
                     if text_content:
                         session_state["turn_start_t0"] = time.perf_counter()
                         
-                        is_bot_active = (asyncio.get_running_loop().time() < session_state.get("playing_until", 0)) or session_state.get("is_generating", False)
+                        is_bot_active = playback.is_playing() or session_state.get("is_generating", False)
                         if is_bot_active:
                             await hard_interrupt(reason="User interacted with UI Widget")
                             
@@ -207,6 +275,31 @@ async def websocket_endpoint(websocket: WebSocket):
             logger.info(f"Client disconnected: {session_id}")
             raise 
 
+    async def live_events():
+        """runner.run_live() that stores resumption handles, and starts fresh once if the stored handle is rejected."""
+        connect_t0 = time.perf_counter()
+        resuming = bool(run_config.session_resumption.handle) # type: ignore
+        received = False
+        while True:
+            try:
+                async for event in runner.run_live(user_id=user_id, session_id=session_id, live_request_queue=live_request_queue, run_config=run_config):
+                    if event is None: continue
+                    if resuming and not received:
+                        resumption.record_resume(time.perf_counter() - connect_t0)
+                    received = True
+                    update = getattr(event, "live_session_resumption_update", None)
+                    if update and update.resumable and update.new_handle:
+                        resumption.put(resume_key, update.new_handle)
+                    yield event
+                return
+            except Exception as e:
+                if not resuming or received: raise
+                logger.warning(f"Could not resume Live session for {session_id} ({e}); starting a new one.")
+                resumption.stats["fallbacks"] += 1
+                resumption.drop(resume_key)
+                run_config.session_resumption = types.SessionResumptionConfig()
+                resuming = False
+
     # --- TASK 2: DOWNSTREAM (Agent -> Client) ---
     async def downstream_task():
         try:
@@ -215,9 +308,7 @@ async def websocket_endpoint(websocket: WebSocket):
             acc_input = ""
             acc_output = ""
             
-            async for event in runner.run_live(user_id=user_id, session_id=session_id, live_request_queue=live_request_queue, run_config=run_config):
-                if event is None: continue
-                
+            async for event in live_events():
                 event_content = getattr(event, "content", None)
                 is_interrupted = getattr(event, 'interrupted', False) is True
                 is_turn_complete = getattr(event, 'turn_complete', False) is True
@@ -228,7 +319,7 @@ async def websocket_endpoint(websocket: WebSocket):
                 t0 = session_state.get("turn_start_t0", now)
 
                 # 1. Cloud Interruption (Google VAD)
-                if is_interrupted and session_state["audio_state"] != "MUTED":
+                if is_interrupted and playback.state != "MUTED":
                     await hard_interrupt(reason="Cloud VAD Interruption")
 
                 # 2. Input Transcription (SILENT ACCUMULATION WITH UI PLACEHOLDER)
@@ -251,6 +342,9 @@ async def websocket_endpoint(websocket: WebSocket):
                         if len(raw_text) > len(acc_input):
                             acc_input = raw_text
 
+                        # User sound while the bot is audible: hold output, and only barge in once it is real speech
+                        await playback.on_user_speech(tx.text)
+
                 # 3. Output Processing
                 # A. Output Transcription (Text)
                 if hasattr(event, 'output_transcription') and event.output_transcription:
@@ -278,12 +372,21 @@ async def websocket_endpoint(websocket: WebSocket):
                                     logger.info(f"[Latency] First audio byte streamed in {int((now - t0)*1000)}ms.")
                                     session_state["logged_first_audio"] = True
                                     
+                                mime = part.inline_data.mime_type or ""
+                                if opus and opus.accepts(mime):
+                                    if playback.state == "MUTED": continue  # Don't spend CPU encoding dropped audio
+                                    audio_chunk, duration_s = await opus.encode(audio_chunk, mime)
+                                    mime = opus.mime_type
+                                    if not audio_chunk: continue  # Less than one 20 ms frame so far
+                                else:
+                                    duration_s = pcm_duration_s(audio_chunk, mime)
+
                                 await route_bot_message({
                                     "source": "assistant", "type": "AudioMessage",
                                     "data": base64.b64encode(audio_chunk).decode('utf-8'),
-                                    "mime_type": part.inline_data.mime_type, "m_id": current_output_id,
+                                    "mime_type": mime, "m_id": current_output_id,
                                     "ts": datetime.now(timezone.utc).isoformat()
-                                }, duration_s=len(audio_chunk) / (24000 * 2))
+                                }, duration_s=duration_s)
 
                 # 4. Turn Complete / Finalize Output
                 if is_turn_complete:
@@ -298,9 +401,20 @@ async def websocket_endpoint(websocket: WebSocket):
                         })
                         except Exception: pass
                     
-                    # Signal bot completion
-                    try: await websocket.send_json({"source": "assistant", "type": "FinalMessage", "m_id": current_output_id, "ts": datetime.now(timezone.utc).isoformat()})
-                    except Exception: pass
+                    # Last partial Opus frame of the answer
+                    if opus:
+                        if playback.state == "MUTED":
+                            opus.drop_pending()
+                        else:
+                            tail, tail_s = await opus.flush()
+                            if tail:
+                                await route_bot_message({
+                                    "source": "assistant", "type": "AudioMessage", "data": base64.b64encode(tail).decode('utf-8'),
+                                    "mime_type": opus.mime_type, "m_id": current_output_id, "ts": datetime.now(timezone.utc).isoformat()
+                                }, duration_s=tail_s)
+
+                    # Signal bot completion (after any output still held by a soft pause)
+                    await playback.finish_turn({"source": "assistant", "type": "FinalMessage", "m_id": current_output_id, "ts": datetime.now(timezone.utc).isoformat()})
                     
                     # Reset Session States
                     acc_input = ""
@@ -308,8 +422,6 @@ async def websocket_endpoint(websocket: WebSocket):
                     current_input_id = str(uuid.uuid4())
                     current_output_id = str(uuid.uuid4())
                     
-                    session_state["audio_state"] = "NORMAL"
-                    session_state["pause_buffer"].clear()
                     session_state["turn_start_t0"] = time.perf_counter()
                     session_state["logged_first_in_tx"] = False
                     session_state["logged_first_out_tx"] = False
@@ -323,6 +435,21 @@ async def websocket_endpoint(websocket: WebSocket):
                 logger.error(f"Downstream error: {e}")
             raise
 
+    # Graceful shutdown (drain.py): the bot finishes its reply, the Live resumption handle is handed off, then the
+    # client reconnects and the next worker resumes the same Live session
+    async def export_handle():
+        handle = resumption.get(resume_key)
+        return handle.encode() if handle else None
+    draining = drain.track(websocket, resume_key, busy=lambda: playback.is_playing() or session_state.get("is_generating", False),
+                           export=export_handle)
+    # Heartbeat (heartbeat.py): pings the client, closes the session once it stops answering or sits idle
+    liveness = reaper.track(websocket, busy=lambda: playback.is_playing() or session_state.get("is_generating", False))
+    # Memory accounting (memory.py): connection-scoped state, counted under this session
+    accounted = accountant.attach(session_id, playback=playback)
+    async def release_session():
+        resumption.drop(resume_key)
+        await session_service.delete_session(app_name=APP_NAME, user_id=user_id, session_id=session_id)
+
     # --- EXECUTE CONCURRENT TASKS ---
     try:
         done, pending = await asyncio.wait(
@@ -334,9 +461,23 @@ async def websocket_endpoint(websocket: WebSocket):
             try: task.result()
             except Exception: pass
     finally:
+        drain.untrack(draining)
+        reaper.untrack(liveness)
+        accountant.detach(accounted)
+        mic_frames.close()
+        await video.close()
         live_request_queue.close()
+        await playback.close()
+        if liveness.reaped:  # Dead or idle: keep only the Live resumption handle, on disk, until the client comes back
+            await reaper.hibernate(resume_key, export=export_handle, release=release_session)
+        transcript.close()
+
 
+@app.websocket("/ws/mux")
+async def websocket_mux(websocket: WebSocket):
+    # Several sessions on one socket (mux.py): every channel runs websocket_endpoint like its own /ws connection
+    await serve_mux(websocket, websocket_endpoint)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000, ws=WebSocketProtocol)  # Deflate policy (compression.py)
\ No newline at end of file
@@ -0,0 +1,216 @@
+"""
+Per-session memory accounting, for finding out which sessions hold on to RAM.
+
+Process RSS only says that memory grows, not where. The state that grows with use lives in a few places,
+and which ones depends on the framework: checkpointed threads, conversation histories, per-session agents,
+audio buffers, the voice pipeline, and the decoded attachments inside them. Each of those places is
+registered here as a component:
+
+  - accountant.register(name, roots) for state that outlives the connection: `roots()` returns
+    {session_id: object} (e.g. an agent's histories dict).
+  - accountant.attach(session_id, name=obj, ...) for objects that live as long as one /ws connection,
+    undone with accountant.detach(handle) in the handler's cleanup.
+
+GET /admin/memory?top=N walks those objects and estimates the bytes each session retains, by component.
+Strings, bytes and images of ATTACHMENT_MIN_BYTES or more are counted under "attachments" instead of the
+component that holds them, since those are almost always decoded uploads. The walk is built to stay on
+in production:
+
+  - Nothing is measured until the endpoint is called, and a report is reused for ZIJUS_MEMORY_CACHE_S.
+  - Containers with more than SAMPLE_ITEMS items are sampled and extrapolated, and one session's walk
+    stops at ZIJUS_MEMORY_MAX_NODES objects (reported as "truncated", a lower bound).
+  - A report spends at most ZIJUS_MEMORY_BUDGET_MS walking. With more sessions than fit, a random sample
+    is measured and the totals extrapolated ("measured" < "sessions"); top-N then covers the sample.
+  - The walk yields to the event loop between sessions, so running turns only ever wait for one session.
+
+Functions, classes, modules, tasks and event loops are not followed, so shared state reachable from a
+session (the model client, tools, the loop) isn't charged to it. Numbers are estimates: good for ranking
+sessions and components and for spotting growth, not an exact heap profile.
+"""
+import os
+import sys
+import time
+import types
+import random
+import asyncio
+import logging
+from collections import deque
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+MEMORY_BUDGET_MS = float(os.getenv("ZIJUS_MEMORY_BUDGET_MS", "250"))
+MEMORY_MAX_NODES = int(os.getenv("ZIJUS_MEMORY_MAX_NODES", "20000"))
+MEMORY_CACHE_S = float(os.getenv("ZIJUS_MEMORY_CACHE_S", "30"))
+SAMPLE_ITEMS = 64
+ATTACHMENT_MIN_BYTES = 16 * 1024
+
+# Shared by every session, or only reach shared state: never followed
+SHARED = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType, types.CodeType,
+          types.FrameType, types.CoroutineType, types.GeneratorType, types.AsyncGeneratorType, types.CellType,
+          asyncio.Future, asyncio.AbstractEventLoop, logging.Logger)
+ATOMS = (str, bytes, bytearray, memoryview, int, float, complex, bool, type(None))
+BLOBS = (str, bytes, bytearray)
+SEQUENCES = (list, tuple, set, frozenset, deque)
+
+
+def rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return None  # Not Linux
+
+
+def _children(obj) -> list:
+    if isinstance(obj, dict): return list(obj)  # The keys; estimate() adds the values
+    if isinstance(obj, SEQUENCES): return obj if isinstance(obj, (list, tuple)) else list(obj)
+    found = []
+    if isinstance(getattr(obj, "__dict__", None), dict): found.append(obj.__dict__)
+    for cls in type(obj).__mro__:
+        slots = cls.__dict__.get("__slots__", ())
+        for name in (slots,) if isinstance(slots, str) else slots:
+            if name not in ("__dict__", "__weakref__"):
+                try: found.append(getattr(obj, name))
+                except AttributeError: pass
+    return found
+
+
+def _image_bytes(obj) -> int:
+    """Decoded pixels of a PIL image, which sys.getsizeof doesn't see."""
+    try:
+        width, height = obj.size
+        return width * height * len(obj.getbands())
+    except Exception:
+        return 0
+
+
+def estimate(root, attachments: bool = True) -> tuple[float, float, bool]:
+    """(bytes, attachment bytes, truncated) retained by `root`, walking at most MEMORY_MAX_NODES objects."""
+    seen, stack = set(), [(root, 1.0)]
+    total = blobs = 0.0
+    nodes = 0
+    while stack:
+        if nodes >= MEMORY_MAX_NODES: return total, blobs, True
+        obj, weight = stack.pop()
+        if id(obj) in seen or isinstance(obj, SHARED): continue
+        seen.add(id(obj))
+        nodes += 1
+        size = sys.getsizeof(obj, 0)
+        if attachments and isinstance(obj, BLOBS) and size >= ATTACHMENT_MIN_BYTES:
+            blobs += size * weight
+            continue
+        if isinstance(obj, ATOMS):
+            total += size * weight
+            continue
+        pixels = _image_bytes(obj) if hasattr(obj, "getbands") else 0
+        if attachments and pixels: blobs += pixels * weight
+        else: total += (size + pixels) * weight
+        children = _children(obj)
+        if len(children) > SAMPLE_ITEMS:  # Extrapolate from a random sample
+            weight *= len(children) / SAMPLE_ITEMS
+            children = random.sample(children, SAMPLE_ITEMS)
+        if isinstance(obj, dict): children += [obj[key] for key in children]
+        stack.extend((child, weight) for child in children)
+    return total, blobs, False
+
+
+class Component:
+    def __init__(self, name: str, roots: Callable[[], dict], attachments: bool):
+        self.name, self.roots, self.attachments = name, roots, attachments
+
+
+class MemoryAccountant:
+    def __init__(self):
+        self.components: dict[str, Component] = {}
+        self.attached: dict[str, dict] = {}  # component -> {handle: (session_id, object)}
+        self._handles = 0
+        self._report: Optional[dict] = None
+        self._running: Optional[asyncio.Task] = None
+
+    def register(self, name: str, roots: Callable[[], dict], attachments: bool = True):
+        """
+        `roots()` returns {session_id: object} for state kept across connections. attachments=False when the
+        state is serialized (e.g. checkpoints), where an upload can't be told apart from the rest.
+        """
+        self.components[name] = Component(name, roots, attachments)
+
+    def attach(self, session_id: str, **objects) -> list:
+        """Counts connection-scoped objects (name=object) for this session until detach(handle)."""
+        handle = []
+        for name, obj in objects.items():
+            if name not in self.components:
+                self.attached[name] = {}
+                self.register(name, lambda name=name: self._attached_roots(name))
+            self._handles += 1
+            self.attached[name][self._handles] = (session_id, obj)
+            handle.append((name, self._handles))
+        return handle
+
+    def detach(self, handle: list):
+        for name, key in handle:
+            self.attached.get(name, {}).pop(key, None)
+
+    def _attached_roots(self, name: str) -> dict:
+        roots: dict = {}
+        for session_id, obj in list(self.attached[name].values()):
+            roots.setdefault(session_id, []).append(obj)  # A session can be open on several sockets
+        return roots
+
+    async def report(self, top: int = 20, refresh: bool = False) -> dict:
+        """Estimated retained bytes by component and for the top sessions. Reused for ZIJUS_MEMORY_CACHE_S."""
+        cached = self._report
+        if refresh or cached is None or time.monotonic() - cached["computed_at"] > MEMORY_CACHE_S:
+            if self._running is None:  # Concurrent callers share one walk
+                self._running = asyncio.create_task(self._measure())
+                self._running.add_done_callback(lambda _: setattr(self, "_running", None))
+            cached = await asyncio.shield(self._running)
+        top = max(0, min(top, 500))
+        return {**{k: v for k, v in cached.items() if k not in ("computed_at", "sessions_by_bytes")}, "age_s": round(time.monotonic() - cached["computed_at"], 1),
+                "top": cached["sessions_by_bytes"][:top]}
+
+    async def _measure(self) -> dict:
+        started = time.monotonic()
+        roots: dict[str, dict] = {}
+        for component in list(self.components.values()):
+            try: roots[component.name] = dict(component.roots())
+            except Exception as e: logger.error(f"Memory accounting could not list {component.name}: {e}")
+        sessions = list({session_id for found in roots.values() for session_id in found})
+        random.shuffle(sessions)
+
+        totals = {name: {"sessions": len(found), "measured": 0, "bytes": 0.0} for name, found in roots.items()}
+        totals["attachments"] = {"sessions": 0, "measured": 0, "bytes": 0.0}
+        measured, truncated, spent = [], 0, 0.0
+        for session_id in sessions:
+            if spent * 1000 >= MEMORY_BUDGET_MS: break
+            walk_started = time.perf_counter()
+            usage, attachment_bytes = {}, 0.0
+            for name, found in roots.items():
+                if session_id not in found: continue
+                size, blobs, cut = estimate(found[session_id], self.components[name].attachments)
+                usage[name], attachment_bytes, truncated = size, attachment_bytes + blobs, truncated + cut
+                totals[name]["measured"] += 1
+                totals[name]["bytes"] += size
+            if attachment_bytes:
+                usage["attachments"] = attachment_bytes
+                totals["attachments"]["measured"] += 1
+                totals["attachments"]["bytes"] += attachment_bytes
+            measured.append({"session_id": session_id, "bytes": int(sum(usage.values())), "components": {k: int(v) for k, v in usage.items()}})
+            spent += time.perf_counter() - walk_started
+            await asyncio.sleep(0)  # Let running turns through between sessions
+
+        scale = len(sessions) / len(measured) if measured else 0.0
+        totals["attachments"]["sessions"] = round(totals["attachments"]["measured"] * scale)
+        for total in totals.values():
+            total["bytes"] = int(total["bytes"] * total["sessions"] / total["measured"]) if total["measured"] else 0
+        measured.sort(key=lambda s: s["bytes"], reverse=True)
+        self._report = {
+            "rss_bytes": rss_bytes(), "tracked_bytes": sum(t["bytes"] for t in totals.values()),
+            "sessions": len(sessions), "measured": len(measured), "truncated": truncated,
+            "walk_ms": round(spent * 1000, 1), "elapsed_ms": round((time.monotonic() - started) * 1000, 1),
+            "components": totals, "computed_at": time.monotonic(), "sessions_by_bytes": measured,
+        }
+        return self._report
+
+
+accountant = MemoryAccountant()
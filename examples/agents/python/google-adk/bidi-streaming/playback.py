@@ -0,0 +1,266 @@
+"""
+Bot output routing for the Live (bidi) gateway: the NORMAL / PAUSED / MUTED state machine.
+
+NORMAL  bot audio and transcription go straight to the client.
+PAUSED  soft pause: the user made a sound while the bot was talking. New bot output is held in a bounded
+        buffer instead of being sent. If the model does not report an interruption within SOFT_PAUSE_S,
+        the buffer is flushed and the answer carries on without being regenerated.
+MUTED   barge-in confirmed: everything until the end of the turn is dropped.
+
+A soft pause becomes a barge-in when the model reports an interruption, when the user says BARGE_IN_WORDS
+words, or when the held output outgrows PAUSE_BUFFER_MAX_S. With ZIJUS_GATEWAY_BARGE_IN=true the Live
+session is opened with activity_handling=NO_INTERRUPTION, so only these gateway rules end a bot answer.
+
+`playing_until` follows the client's playback acks when it sends them:
+    {"type": "PlaybackAck", "m_id": "<assistant m_id>", "played_ms": 1234}   (ms of that message played so far)
+Clients that don't ack fall back to the duration of the PCM that was sent.
+
+Outbound audio is paced: the Live API delivers a whole answer's audio much faster than real time, and
+audio already sent when the user barges in is wasted bandwidth the client has to throw away. Once the
+client is playing, at most PACE_LEAD_S of unplayed audio is kept in flight; the rest waits in `outbox`
+and is released as playback progresses. The first chunk after silence is sent immediately, so pacing
+adds no first-audio latency. Lead time and discarded audio bytes are logged per turn and per connection.
+"""
+import os
+import re
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+SOFT_PAUSE_S = float(os.getenv("ZIJUS_SOFT_PAUSE_S", "0.8"))
+PAUSE_BUFFER_MAX_S = float(os.getenv("ZIJUS_PAUSE_BUFFER_MAX_S", "6.0"))
+BARGE_IN_WORDS = int(os.getenv("ZIJUS_BARGE_IN_WORDS", "3"))
+GATEWAY_BARGE_IN = os.getenv("ZIJUS_GATEWAY_BARGE_IN", "false").lower() in ("1", "true", "yes")
+PACE_LEAD_S = float(os.getenv("ZIJUS_PACE_LEAD_S", "0.4"))  # 0 = send audio as fast as it arrives
+
+RATE_RE = re.compile(r"rate=(\d+)")
+
+
+def pcm_duration_s(data: bytes, mime_type: str = "", default_rate: int = 24000) -> float:
+    """Duration of 16-bit mono PCM, using the sample rate in the mime type (e.g. 'audio/pcm;rate=24000')."""
+    match = RATE_RE.search(mime_type or "")
+    rate = int(match.group(1)) if match else default_rate
+    return len(data) / (rate * 2)
+
+
+class Playback:
+    """Per-connection bot output state. `send` writes one JSON message to the client WebSocket."""
+    def __init__(self, send: Callable[[dict], Awaitable[None]]):
+        self.send = send
+        self.state = "NORMAL"
+        self.pause_buffer: deque = deque()
+        self.buffered_s = 0.0
+        self.sent_s: dict = {}     # m_id -> audio seconds sent
+        self.played_s: dict = {}   # m_id -> audio seconds the client reports as played
+        self.ends_s: dict = {}     # m_id -> loop time its audio ends if played in real time from when it was sent
+        self.finished: set = set() # m_ids whose FinalMessage has been sent
+        self.acked = False         # True once this client has sent a PlaybackAck
+        self.playing_until = 0.0   # Loop time at which the client runs out of bot audio
+        self.heard_words = 0       # Words transcribed since the soft pause started
+        self.soft_pauses = 0
+        self.resumes = 0           # Soft pauses that ended without an interruption
+        self._resume_task = None
+        self._unpaused = asyncio.Event()
+        self._unpaused.set()
+        # Pacing
+        self.outbox: deque = deque()  # (payload, duration_s) waiting for the client to catch up
+        self._pacer_task = None
+        self._bytes_per_s = 48000.0   # Of the last audio sent (24 kHz int16 until known)
+        self.turn_leads: list = []    # Lead (s) after each audio send in the current turn
+        self.stats = {"audio_bytes_sent": 0, "discarded_bytes": 0, "withheld_bytes": 0, "max_lead_ms": 0}
+
+    def _now(self) -> float:
+        return asyncio.get_running_loop().time()
+
+    def is_playing(self) -> bool:
+        return self._now() < self.playing_until or bool(self.outbox)
+
+    def lead_s(self) -> float:
+        """Seconds of sent audio the client has not played yet."""
+        return max(0.0, self.playing_until - self._now())
+
+    async def route(self, payload: dict, duration_s: float = 0.0):
+        """Sends, holds or drops one bot message depending on the current state."""
+        if self.state == "MUTED":
+            return  # Drop completely (Barge-in successful)
+
+        if self.state == "PAUSED":
+            if self.buffered_s + duration_s > PAUSE_BUFFER_MAX_S:
+                # The user has kept talking, so this was not a short noise
+                await self.hard_interrupt(reason="Soft-pause buffer full")
+                return
+            self.pause_buffer.append((payload, duration_s))
+            self.buffered_s += duration_s
+            return
+
+        await self._send_now(payload, duration_s)
+
+    async def finish_turn(self, final_payload: dict):
+        """Sends the turn's FinalMessage after any held output, and leaves MUTED for the next turn."""
+        if self.state == "PAUSED":
+            self.pause_buffer.append((final_payload, 0.0))
+        else:
+            self.state = "NORMAL"
+            await self._send_now(final_payload, 0.0)
+
+    async def _send_now(self, payload: dict, duration_s: float):
+        """Sends now, or queues behind audio the pacer is holding back (keeps message order)."""
+        if PACE_LEAD_S <= 0 or (not self.outbox and (duration_s == 0 or self.lead_s() == 0 or self.lead_s() + duration_s <= PACE_LEAD_S)):
+            await self._deliver(payload, duration_s)
+            return
+        self.outbox.append((payload, duration_s))
+        if self._pacer_task is None or self._pacer_task.done():
+            self._pacer_task = asyncio.create_task(self._pace())
+
+    async def _pace(self):
+        """Releases queued output whenever the client's unplayed audio drops below PACE_LEAD_S."""
+        while self.outbox:
+            await self._unpaused.wait()
+            if not self.outbox:
+                break
+            payload, duration_s = self.outbox[0]
+            wait_s = self.lead_s() + duration_s - PACE_LEAD_S
+            if duration_s > 0 and wait_s > 0:
+                await asyncio.sleep(min(wait_s, PACE_LEAD_S))  # Re-check: acks can move playing_until
+                continue
+            self.outbox.popleft()
+            await self._deliver(payload, duration_s)
+
+    async def _deliver(self, payload: dict, duration_s: float):
+        if duration_s > 0:
+            m_id = payload.get("m_id", "")
+            self.sent_s[m_id] = self.sent_s.get(m_id, 0.0) + duration_s
+            self.ends_s[m_id] = max([self._now(), *self.ends_s.values()]) + duration_s  # Queued behind earlier audio
+            if len(self.sent_s) > 16:
+                self._forget(next(iter(self.sent_s)))
+            if self.acked:
+                self._update_playing_until()
+            else:
+                self.playing_until = max(self._now(), self.playing_until) + duration_s
+            nbytes = len(payload.get("data", "")) * 3 // 4
+            self._bytes_per_s = nbytes / duration_s
+            self.stats["audio_bytes_sent"] += nbytes
+            self.turn_leads.append(self.lead_s())
+        try: await self.send(payload)
+        except Exception: pass
+        if payload.get("type") == "FinalMessage":
+            if payload.get("m_id", "") in self.sent_s: self.finished.add(payload["m_id"])
+            self._log_turn()
+
+    def _log_turn(self):
+        if not self.turn_leads:
+            return
+        leads = sorted(self.turn_leads)
+        peak_ms = int(leads[-1] * 1000)
+        self.stats["max_lead_ms"] = max(self.stats["max_lead_ms"], peak_ms)
+        logger.info(f"[Pacing] Turn audio lead: median {int(leads[len(leads) // 2] * 1000)}ms, max {peak_ms}ms over {len(leads)} chunks.")
+        self.turn_leads = []
+
+    def on_ack(self, m_id: str, played_ms: float):
+        """Client playback progress for one assistant message. Acks for dropped audio are ignored."""
+        if m_id not in self.sent_s:
+            return
+        self.acked = True
+        self.played_s[m_id] = max(self.played_s.get(m_id, 0.0), played_ms / 1000)
+        self._update_playing_until()
+
+    def _update_playing_until(self):
+        """
+        Unplayed audio per message, capped by the real time left until it would have ended. A message whose
+        last ack fell short of what was sent, or that played on through a soft pause, stops counting then.
+        """
+        now, unplayed = self._now(), 0.0
+        for m_id, sent in list(self.sent_s.items()):
+            left = min(max(0.0, sent - self.played_s.get(m_id, 0.0)), max(0.0, self.ends_s.get(m_id, now) - now))
+            if left == 0 and m_id in self.finished:
+                self._forget(m_id)  # Complete and played out: later acks for it are ignored
+            unplayed += left
+        self.playing_until = now + unplayed
+
+    def _forget(self, m_id: str):
+        self.sent_s.pop(m_id, None); self.played_s.pop(m_id, None); self.ends_s.pop(m_id, None)
+        self.finished.discard(m_id)
+
+    async def on_user_speech(self, text: str):
+        """Input transcription arrived: soft-pause audible bot output, and barge in once it is clearly speech."""
+        if self.state == "NORMAL":
+            await self.soft_pause(reason="User audio during playback")
+        if self.state == "PAUSED":
+            self.heard_words += len(text.split())
+            if self.heard_words >= BARGE_IN_WORDS:
+                await self.hard_interrupt(reason="User kept talking")
+
+    async def soft_pause(self, reason: str):
+        """Holds bot output for up to SOFT_PAUSE_S, then resumes unless hard_interrupt() was called."""
+        if self.state != "NORMAL" or not self.is_playing():
+            return
+        logger.info(f"Soft pause: {reason}")
+        self.state = "PAUSED"
+        self._unpaused.clear()
+        self.heard_words = 0
+        self.soft_pauses += 1
+        self._resume_task = asyncio.create_task(self._resume_after(SOFT_PAUSE_S))
+
+    async def _resume_after(self, delay_s: float):
+        await asyncio.sleep(delay_s)
+        self._resume_task = None
+        await self.resume()
+
+    async def resume(self):
+        """Ends a soft pause and flushes the held output in order."""
+        if self.state != "PAUSED":
+            return
+        self._cancel_resume()
+        self.state = "NORMAL"
+        self._unpaused.set()
+        self.resumes += 1
+        held, self.pause_buffer = self.pause_buffer, deque()
+        self.buffered_s = 0.0
+        logger.info(f"Soft pause ended without an interruption, flushing {len(held)} held messages.")
+        for payload, duration_s in held:
+            await self._send_now(payload, duration_s)
+
+    async def hard_interrupt(self, reason: str):
+        """Immediately stops all bot output until the turn completes."""
+        logger.info(f"Barge-in triggered: {reason}")
+        self._cancel_resume()
+        self.state = "MUTED"
+        self._unpaused.set()
+        # A turn that already completed keeps its FinalMessage, and the next turn must not start muted
+        finals = [payload for payload, _ in [*self.pause_buffer, *self.outbox] if payload.get("type") == "FinalMessage"]
+        self.pause_buffer.clear()
+        self.buffered_s = 0.0
+        # Paced audio that was never sent costs nothing; sent but unplayed audio is thrown away by the client
+        withheld = sum(len(payload.get("data", "")) * 3 // 4 for payload, duration_s in self.outbox if duration_s > 0)
+        discarded = int(self.lead_s() * self._bytes_per_s)
+        self.outbox.clear()  # The pacer exits on its own (no cancel mid-send)
+        self.stats["withheld_bytes"] += withheld
+        self.stats["discarded_bytes"] += discarded
+        logger.info(f"[Pacing] Barge-in discarded {discarded} sent audio bytes ({int(self.lead_s() * 1000)}ms), withheld {withheld} unsent bytes.")
+        self._log_turn()
+        # The client discards its queued audio on InterruptMessage
+        self.sent_s.clear(); self.played_s.clear(); self.ends_s.clear(); self.finished.clear()
+        self.playing_until = 0.0
+        try: await self.send({"source": "assistant", "type": "InterruptMessage", "ts": datetime.now(timezone.utc).isoformat()})
+        except Exception: pass
+        if finals:
+            self.state = "NORMAL"
+            for payload in finals:
+                try: await self.send(payload)
+                except Exception: pass
+
+    async def close(self):
+        """Connection ended: stop background tasks and log the pacing totals."""
+        self._cancel_resume()
+        if self._pacer_task is not None: self._pacer_task.cancel()
+        self.outbox.clear()
+        logger.info(f"[Pacing] Connection totals: {self.stats}")
+
+    def _cancel_resume(self):
+        if self._resume_task is not None and self._resume_task is not asyncio.current_task():
+            self._resume_task.cancel()
+        self._resume_task = None
@@ -0,0 +1,70 @@
+"""
+Live API session resumption across WebSocket reconnects.
+
+The Live API periodically sends a resumption handle for the running session. `handles` keeps the latest
+one per session (LRU, at most RESUME_MAX_SESSIONS, each valid for RESUME_TTL_S), keyed by user_id and
+session_id like the ADK session. When the same user reconnects with the same session_id, the new Live
+connection is opened with that handle. The model then
+carries on with the full conversation, including audio context, instead of starting over. If the handle
+is rejected, the gateway forgets it and connects fresh. The ADK session (text history) still survives
+because the session service is shared across connections.
+
+Time to resume (reconnect -> first message from the resumed Live session) is logged, and it is
+summarized with the other counters when the app shuts down.
+"""
+import os
+import time
+import logging
+from collections import OrderedDict, deque
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+RESUME_MAX_SESSIONS = int(os.getenv("ZIJUS_RESUME_MAX_SESSIONS", "1000"))
+RESUME_TTL_S = float(os.getenv("ZIJUS_RESUME_TTL_S", "7200"))  # The Live API keeps handles for 2 hours
+
+
+class ResumptionStore:
+    """Bounded session key -> (handle, stored_at) map, least recently used evicted first."""
+    def __init__(self, max_sessions: int = RESUME_MAX_SESSIONS, ttl_s: float = RESUME_TTL_S):
+        self.max_sessions = max_sessions
+        self.ttl_s = ttl_s
+        self._handles: OrderedDict = OrderedDict()
+        self.resume_s: deque = deque(maxlen=1000)
+        self.stats = {"stored": 0, "evicted": 0, "resumed": 0, "fallbacks": 0}
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._handles.get(key)
+        if entry is None:
+            return None
+        handle, stored_at = entry
+        if time.monotonic() - stored_at > self.ttl_s:
+            del self._handles[key]
+            return None
+        self._handles.move_to_end(key)
+        return handle
+
+    def put(self, key: str, handle: str):
+        if key not in self._handles:
+            self.stats["stored"] += 1
+        self._handles[key] = (handle, time.monotonic())
+        self._handles.move_to_end(key)
+        while len(self._handles) > self.max_sessions:
+            self._handles.popitem(last=False)
+            self.stats["evicted"] += 1
+
+    def drop(self, key: str):
+        self._handles.pop(key, None)
+
+    def record_resume(self, seconds: float):
+        self.stats["resumed"] += 1
+        self.resume_s.append(seconds)
+        logger.info(f"[Latency] Live session resumed in {int(seconds * 1000)}ms.")
+
+    def summary(self) -> dict:
+        ordered = sorted(self.resume_s)
+        pick = lambda q: int(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000) if ordered else None
+        return {**self.stats, "sessions": len(self._handles), "resume_ms": {"p50": pick(0.5), "p95": pick(0.95)}}
+
+
+handles = ResumptionStore()
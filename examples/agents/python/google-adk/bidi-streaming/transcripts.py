@@ -0,0 +1,222 @@
+"""
+Append-only transcript log for QA.
+
+Every WebSocket connection gets a SessionTranscript. tap() wraps the socket's send function, and
+inbound() is called with each client message. Together they record one compact JSON line per event:
+
+  start / end        connection opened (with user id) / closed
+  user               typed text (attachment type only, never its data), or the final voice transcription
+  widget_event       widget submission payload
+  assistant          one record per answer: the streamed deltas of one m_id merged, with ttft_ms / ms
+                     from the user's message and status final / interrupted / error / disconnected
+  widget             widget the agent rendered (type and fields)
+  interrupt, error, feedback
+
+e.g. {"ts":1760000000123,"s":"sess-1","k":"assistant","m":"5c1e...","text":"Hello!","status":"final","ttft_ms":412,"ms":1630}
+
+Recording costs the streaming path one list append per message. TranscriptLog gathers records from
+all sessions and writes them every TRANSCRIPT_FLUSH_MS on a dedicated thread: one write() and one
+fsync() per batch (group commit). Segments are JSON Lines files named
+transcript-<UTC start>-<pid>.jsonl in TRANSCRIPT_DIR. A new segment starts every TRANSCRIPT_SEGMENT_MB
+or TRANSCRIPT_SEGMENT_S. Files are only ever appended to, so offline tools (jq, pandas, the search
+indexer) can read them at any time: use read_segment(), or stop at the last newline.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIPT_DIR = os.getenv("ZIJUS_TRANSCRIPT_DIR", "")  # Empty (default) = don't record
+TRANSCRIPT_FLUSH_MS = int(os.getenv("ZIJUS_TRANSCRIPT_FLUSH_MS", "200"))  # Group fsync interval
+TRANSCRIPT_BATCH_SIZE = int(os.getenv("ZIJUS_TRANSCRIPT_BATCH_SIZE", "2000"))  # ...or sooner once this many records wait
+TRANSCRIPT_SEGMENT_MB = float(os.getenv("ZIJUS_TRANSCRIPT_SEGMENT_MB", "64"))
+TRANSCRIPT_SEGMENT_S = float(os.getenv("ZIJUS_TRANSCRIPT_SEGMENT_S", "3600"))
+TRANSCRIPT_MAX_PENDING = int(os.getenv("ZIJUS_TRANSCRIPT_MAX_PENDING", "200000"))  # Beyond this the oldest are dropped
+
+# Outbound messages that aren't part of the conversation text
+UNRECORDED = {"session", "AudioMessage", "ping"}
+
+
+def read_segment(path: str, offset: int = 0) -> Iterator[tuple[dict, int]]:
+    """(record, offset after it) for every complete line from `offset` on. A line still being written is
+    left for the next read. An unparsable line (torn by a crash) is skipped."""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                return
+            offset += len(line)
+            try: yield json.loads(line), offset
+            except ValueError: logger.warning(f"Skipping unreadable line in {path} before offset {offset}")
+
+
+class SessionTranscript:
+    """Recorder for one connection. Merges streamed deltas per m_id and times each answer."""
+    def __init__(self, log: "TranscriptLog", session_id: str, user_id: str):
+        self.log = log
+        self.session_id = session_id
+        self._turn_started: Optional[float] = None
+        self._answers: dict = {}  # m_id -> [delta list, first delta time]
+        self._heard: dict = {}  # m_id -> voice transcription so far (each update repeats the whole text)
+        self.write("start", user=user_id)
+
+    def write(self, kind: str, **fields):
+        self.log.append({"ts": int(time.time() * 1000), "s": self.session_id, "k": kind, **fields})
+
+    def tap(self, send: Callable[..., Awaitable[None]]) -> Callable[..., Awaitable[None]]:
+        async def recorded_send(msg: dict, *args, **kwargs):
+            self.outbound(msg)
+            await send(msg, *args, **kwargs)
+        return recorded_send
+
+    def inbound(self, msg: dict):
+        msg_type = msg.get("type")
+        if msg_type == "TextMessage":
+            self._turn_started = time.time()
+            attachment = msg.get("attachment")
+            self.write("user", m=msg.get("m_id"), text=msg.get("content", ""), **({"attachment": attachment.get("type")} if attachment else {}))
+        elif msg_type == "WidgetEvent":
+            self._turn_started = time.time()
+            self.write("widget_event", m=msg.get("m_id"), payload=msg.get("widgetEvent", {}).get("payload", {}))
+        elif msg_type == "feedback":
+            self.write("feedback", m=msg.get("m_id"), feedback=msg.get("feedback"))
+
+    def outbound(self, msg: dict):
+        msg_type = msg.get("type")
+        if msg_type in UNRECORDED:
+            return
+        m_id = msg.get("m_id", "")
+        if msg_type == "TextMessage":
+            if msg.get("source") == "user":
+                if m_id not in self._heard: self._turn_started = time.time()  # Voice turn: starts with the first words heard
+                self._heard[m_id] = msg.get("content", "")
+                return
+            answer = self._answers.get(m_id)
+            if answer is None:
+                self._answers[m_id] = answer = [[], time.time()]
+            answer[0].append(msg.get("content", ""))
+        elif msg_type == "FinalMessage":
+            self._end_turn("final", m_id)
+        elif msg_type == "InterruptMessage":
+            self._end_turn("interrupted")
+            self.write("interrupt")
+        elif msg_type == "error":
+            self._end_turn("error")
+            self.write("error", text=msg.get("content", ""))
+        else:
+            self.write("widget", type=msg_type, m=m_id, data={k: v for k, v in msg.items() if k not in ("type", "source", "m_id", "ts")})
+
+    def _end_turn(self, status: str, m_id: Optional[str] = None):
+        """Writes what the user said, then the answer(s): just m_id's for a FinalMessage, all open ones otherwise."""
+        for heard_id, text in self._heard.items():
+            self.write("user", m=heard_id, text=text, voice=True)
+        self._heard.clear()
+        now = time.time()
+        for answer_id in ([m_id] if m_id is not None else list(self._answers)):
+            answer = self._answers.pop(answer_id, None)
+            if answer is None: continue
+            timing = {"ttft_ms": int((answer[1] - self._turn_started) * 1000), "ms": int((now - self._turn_started) * 1000)} if self._turn_started else {}
+            self.write("assistant", m=answer_id, text="".join(answer[0]), status=status, **timing)
+        if not self._answers:
+            self._turn_started = None
+
+    def close(self):
+        self._end_turn("disconnected")
+        self.write("end")
+
+
+class TranscriptLog:
+    """Process-wide append-only writer. append() is O(1) and never awaits."""
+    def __init__(self, directory: str = TRANSCRIPT_DIR):
+        self.directory = directory
+        self.pending: list = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._closing = False
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="transcripts")  # Owns the segment file
+        self._file = None
+        self._segment_started = 0.0
+        self._segment_bytes = 0
+        self.stats = {"records": 0, "bytes": 0, "fsyncs": 0, "segments": 0, "dropped": 0, "failed_batches": 0}
+
+    def session(self, session_id: str, user_id: str = "anon") -> SessionTranscript:
+        return SessionTranscript(self, session_id, user_id)
+
+    def append(self, record: dict):
+        if not self.directory:
+            return
+        if self._flusher is None:
+            self._wakeup = asyncio.Event()
+            self._flusher = asyncio.create_task(self._run())
+        self.pending.append(record)
+        if len(self.pending) > TRANSCRIPT_MAX_PENDING:
+            overflow = len(self.pending) - TRANSCRIPT_MAX_PENDING
+            del self.pending[:overflow]
+            self.stats["dropped"] += overflow
+        if len(self.pending) >= TRANSCRIPT_BATCH_SIZE:
+            self._wakeup.set()  # type: ignore
+
+    async def _run(self):
+        while not self._closing:
+            try: await asyncio.wait_for(self._wakeup.wait(), timeout=TRANSCRIPT_FLUSH_MS / 1000)  # type: ignore
+            except asyncio.TimeoutError: pass
+            self._wakeup.clear()  # type: ignore
+            await self.flush()
+
+    async def flush(self):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._writer, self._write, batch)
+        except Exception as e:
+            self.stats["failed_batches"] += 1
+            logger.error(f"Transcript batch of {len(batch)} records failed, will retry: {e}")
+            self.pending[:0] = batch
+
+    def _write(self, batch: list):
+        """Writer thread: one write and one fsync for the whole batch."""
+        data = "".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in batch).encode()
+        if self._file is None or (self._segment_bytes and self._segment_bytes + len(data) > TRANSCRIPT_SEGMENT_MB * 1024 * 1024) \
+                or time.monotonic() - self._segment_started > TRANSCRIPT_SEGMENT_S:
+            self._rotate()
+        self._file.write(data)  # type: ignore
+        self._file.flush()  # type: ignore
+        os.fsync(self._file.fileno())  # type: ignore
+        self._segment_bytes += len(data)
+        self.stats["records"] += len(batch)
+        self.stats["bytes"] += len(data)
+        self.stats["fsyncs"] += 1
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"transcript-{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}-{os.getpid()}.jsonl"
+        self._file = open(os.path.join(self.directory, name), "ab")
+        self._segment_started = time.monotonic()
+        self._segment_bytes = 0
+        self.stats["segments"] += 1
+
+    async def close(self):
+        """App shutdown: write everything still pending and close the segment."""
+        if self._flusher is not None:
+            self._closing = True
+            self._wakeup.set()  # type: ignore
+            await self._flusher
+            self._flusher = None
+        await self.flush()
+        if self._file is not None:
+            await asyncio.get_running_loop().run_in_executor(self._writer, self._file.close)
+        self._writer.shutdown(wait=True)
+        if self.stats["records"]:
+            logger.info(f"Transcript log closed: {self.stats}")
+
+
+transcript_log = TranscriptLog()
@@ -3,14 +3,20 @@ import jwt
 from jwt.exceptions import InvalidTokenError
 import uuid
 import os
+import hmac
 from io import BytesIO
 from typing import Optional, Dict, Any
+from fastapi import Header, HTTPException
 
 from dotenv import load_dotenv
 load_dotenv()
 
+from feedback import feedback_sink
+
 # Force Pylance to recognize this as a strict string
 SECRET_KEY: str = str(os.getenv("JWT_SECRET_KEY", "your-default-secret-key-please-change"))
+# Admin endpoints (/admin/*) stay disabled unless this is set
+ADMIN_TOKEN: str = str(os.getenv("ZIJUS_ADMIN_TOKEN", ""))
 
 async def generate_jwt(session_id: Optional[str] = None) -> str:
     """Generates a secure JWT for the WebSocket session."""
@@ -33,6 +39,14 @@ async def validate_jwt(token: Optional[str]) -> Optional[Dict[str, Any]]:
     except InvalidTokenError:
         return None
 
+async def require_admin(authorization: Optional[str] = Header(None)) -> None:
+    """FastAPI dependency for /admin/* routes: expects `Authorization: Bearer <ZIJUS_ADMIN_TOKEN>`."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404)
+    supplied = (authorization or "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(supplied, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
 async def extract_text_from_attachment(file_obj: BytesIO, mime_type: Optional[str]) -> str:
     """Placeholder function to extract text from documents."""
     if mime_type in ["text/plain", "text/csv"]:
@@ -43,7 +57,7 @@ async def extract_text_from_attachment(file_obj: BytesIO, mime_type: Optional[st
 
     return f"[Simulated text extraction for file of type {mime_type}]"
 
-async def save_feedback() -> None: 
-    """ Placeholder function to save user feedback (thumbs up/down). Connect this to your database (PostgreSQL, MongoDB, etc.) """
-    pass
+async def save_feedback(payload: Dict[str, Any], session_id: str) -> None:
+    """Queues user feedback (thumbs up/down) for batched storage and returns at once. Sink and batching: see feedback.py."""
+    feedback_sink.submit(payload, session_id)
 
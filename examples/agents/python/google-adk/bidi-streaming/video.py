@@ -0,0 +1,118 @@
+"""
+Camera / screen-share frames for the Live agent.
+
+The client sends
+    {"type": "VideoFrame", "data": "<base64 JPEG/PNG/WebP>", "mimeType": "image/jpeg", "source": "screen"}
+as often as it likes. VideoIngest keeps only the newest frame per session and forwards at most
+VIDEO_MAX_FPS frames per second, which matches how often the Live API looks at video anyway. Decoding,
+downscaling to VIDEO_MAX_SIDE and JPEG re-encoding run in a worker thread. A frame that would decode to
+more than VIDEO_MAX_PIXELS (after JPEG draft scaling) is rejected from its header and counted as an
+error. A frame that barely differs from the last forwarded one is dropped: the metric is the mean
+absolute difference of 32x32 grayscale thumbnails, computed with NumPy. Screen shares are mostly static,
+so most frames are dropped there.
+
+Frames received / forwarded / dropped and worker CPU per frame are logged when the session ends.
+"""
+import io
+import os
+import time
+import base64
+import asyncio
+import logging
+from typing import Callable, Optional
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+VIDEO_MAX_FPS = float(os.getenv("ZIJUS_VIDEO_MAX_FPS", "1"))
+VIDEO_MAX_SIDE = int(os.getenv("ZIJUS_VIDEO_MAX_SIDE", "768"))
+VIDEO_DEDUPE_THRESHOLD = float(os.getenv("ZIJUS_VIDEO_DEDUPE_THRESHOLD", "0.02"))  # 0 = forward every frame
+VIDEO_MAX_PIXELS = 4 * VIDEO_MAX_SIDE ** 2  # Decoded size cap: a tiny PNG can expand to hundreds of MB
+VIDEO_JPEG_QUALITY = 80
+THUMB_SIZE = (32, 32)
+
+
+def frame_difference(a: np.ndarray, b: np.ndarray) -> float:
+    """Mean absolute difference of two grayscale thumbnails, 0 (identical) to 1."""
+    return float(np.mean(np.abs(a.astype(np.int16) - b))) / 255
+
+
+class VideoIngest:
+    """Per-session frame pipeline. push() never blocks; send(jpeg_bytes, mime_type) is LiveRequestQueue-like."""
+    def __init__(self, send: Callable[[bytes, str], None]):
+        self.send = send
+        self.interval_s = 1 / VIDEO_MAX_FPS if VIDEO_MAX_FPS > 0 else 0.0
+        self._latest: Optional[str] = None  # Newest base64 frame not yet processed
+        self._ready = asyncio.Event()
+        self._last_thumb: Optional[np.ndarray] = None
+        self._last_processed = 0.0
+        self.started = time.monotonic()
+        self.stats = {"received": 0, "forwarded": 0, "dropped_rate": 0, "dropped_duplicate": 0, "errors": 0, "cpu_s": 0.0}
+        self._worker = asyncio.create_task(self._run())
+
+    def push(self, frame_b64: str):
+        if not frame_b64:
+            return
+        self.stats["received"] += 1
+        if self._latest is not None:
+            self.stats["dropped_rate"] += 1  # Superseded before the worker got to it
+        self._latest = frame_b64
+        self._ready.set()
+
+    async def _run(self):
+        while True:
+            await self._ready.wait()
+            # Rate cap (on decoding too, so a static screen costs no more than a moving one):
+            # wait out the interval, then take whatever is newest by then
+            wait_s = self._last_processed + self.interval_s - time.monotonic()
+            if wait_s > 0:
+                await asyncio.sleep(wait_s)
+            frame_b64, self._latest = self._latest, None
+            self._ready.clear()
+            if frame_b64 is None:
+                continue
+            self._last_processed = time.monotonic()
+            try:
+                result, cpu_s = await asyncio.to_thread(self._process, frame_b64)
+                self.stats["cpu_s"] += cpu_s
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.warning(f"Dropping video frame (undecodable or too large): {e}")
+                continue
+            if result is None:
+                self.stats["dropped_duplicate"] += 1
+                continue
+            self.stats["forwarded"] += 1
+            self.send(result, "image/jpeg")
+
+    def _process(self, frame_b64: str) -> tuple[Optional[bytes], float]:
+        """Worker thread: decode, dedupe against the last forwarded frame, downscale, re-encode as JPEG.
+        Returns (JPEG bytes or None for a duplicate, CPU seconds spent)."""
+        cpu_start = time.thread_time()
+        image = Image.open(io.BytesIO(base64.b64decode(frame_b64)))
+        image.draft("RGB", (VIDEO_MAX_SIDE, VIDEO_MAX_SIDE))  # JPEG: let the decoder skip detail we'd throw away
+        if image.size[0] * image.size[1] > VIDEO_MAX_PIXELS:  # Checked on the header, before decoding
+            raise ValueError(f"{image.size[0]}x{image.size[1]} frame is over {VIDEO_MAX_PIXELS} pixels")
+        image = image.convert("RGB")
+        thumb = np.asarray(image.convert("L").resize(THUMB_SIZE, Image.Resampling.BILINEAR))
+        if self._last_thumb is not None and frame_difference(thumb, self._last_thumb) < VIDEO_DEDUPE_THRESHOLD:
+            return None, time.thread_time() - cpu_start
+        self._last_thumb = thumb
+        image.thumbnail((VIDEO_MAX_SIDE, VIDEO_MAX_SIDE), Image.Resampling.BILINEAR)
+        out = io.BytesIO()
+        image.save(out, format="JPEG", quality=VIDEO_JPEG_QUALITY)
+        return out.getvalue(), time.thread_time() - cpu_start
+
+    async def close(self):
+        self._worker.cancel()
+        try: await self._worker
+        except asyncio.CancelledError: pass
+        if self.stats["received"]:
+            stream_s = max(time.monotonic() - self.started, 1e-9)
+            logger.info(
+                f"[Video] {self.stats['forwarded']}/{self.stats['received']} frames forwarded "
+                f"({self.stats['dropped_rate']} over the fps cap, {self.stats['dropped_duplicate']} duplicates, {self.stats['errors']} errors), "
+                f"CPU {self.stats['cpu_s'] * 1000 / max(1, self.stats['forwarded'] + self.stats['dropped_duplicate']):.1f}ms per processed frame, {self.stats['cpu_s'] * 100 / stream_s:.2f}% of a core."
+            )
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
@@ -13,10 +13,23 @@ from my_agent.agent import root_agent
 import os
 import json
 import asyncio
+from contextlib import asynccontextmanager
 import uuid
 import logging
 import base64
-from utils import generate_jwt, validate_jwt, save_feedback, extract_text_from_attachment
+from utils import generate_jwt, validate_jwt, save_feedback, extract_text_from_attachment, require_admin
+from feedback import feedback_sink
+from transcripts import transcript_log
+from compression import WebSocketProtocol, deflate_stats
+from mux import serve_mux, mux_stats
+from drain import drain
+from heartbeat import reaper
+from memory import accountant
+from search import transcript_index
+from cancellation import cancel_turn, current_turn, upstream
+from metrics import metrics
+from vad import VoiceActivity
+from stt import build_transcriber
 from io import BytesIO
 from datetime import datetime, timezone
 from zijus_tools import set_websocket_sender
@@ -28,7 +41,18 @@ logger = logging.getLogger(__name__)
 from dotenv import load_dotenv
 load_dotenv()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await transcript_index.start()
+    drain.install()  # SIGTERM drains the sessions before the server shuts down
+    yield
+    await feedback_sink.close()
+    await transcript_log.close()
+    await transcript_index.close()
+    await reaper.close()
+    await drain.close()
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -56,8 +80,38 @@ async def read_root(request: Request):
         "zijus_javascript": ZIJUS_JAVASCRIPT
     })
 
+@app.get("/admin/metrics", dependencies=[Depends(require_admin)])
+async def admin_metrics():
+    return {**metrics.as_dict(), "transcripts": transcript_log.stats, "search": transcript_index.stats, "deflate": deflate_stats, "mux": mux_stats, "drain": drain.stats, "heartbeat": reaper.stats}
+
+@app.get("/admin/memory", dependencies=[Depends(require_admin)])
+async def admin_memory(top: int = 20, refresh: bool = False):
+    """Estimated memory retained per session and component (memory.py): totals and the `top` sessions."""
+    return await accountant.report(top, refresh)
+
+@app.post("/admin/drain", dependencies=[Depends(require_admin)])
+async def admin_drain():
+    """Graceful shutdown (drain.py) without stopping the process: no new sessions, running turns finish."""
+    drain.start("admin")
+    return drain.stats
+
+@app.get("/healthz")
+async def healthz():
+    if drain.draining: raise HTTPException(status_code=503, detail="draining")
+    return {"status": "ok"}
+
+@app.get("/admin/search", dependencies=[Depends(require_admin)])
+async def admin_search(q: str = "", user: str = "", kind: str = "", session: str = "", since: Optional[int] = None,
+                       until: Optional[int] = None, before: Optional[int] = None, limit: int = 50):
+    """Transcript search (search.py): newest first, pass next_before back as `before` for the next page."""
+    try:
+        return await transcript_index.search(q, user, kind, session, since, until, before, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
+    if drain.draining: return await drain.turn_away(websocket)  # Before any JWT or agent work
     # 1. Extract Query Params
     token = websocket.query_params.get("token", "")
     session_id = websocket.query_params.get("session_id", "")
@@ -70,6 +124,9 @@ async def websocket_endpoint(websocket: WebSocket):
     new_token = await generate_jwt(session_id) if not payload else token
 
     await websocket.accept()
+    # QA transcript (transcripts.py): everything sent on this socket, and client messages as they arrive
+    transcript = transcript_log.session(session_id, user_id)
+    websocket.send_json = transcript.tap(websocket.send_json)  # type: ignore
 
     # 3. Inject WebSocket Sender for Zijus Tools (Framework Agnostic UI Tools)
     async def sender(msg: dict):
@@ -96,7 +153,7 @@ async def websocket_endpoint(websocket: WebSocket):
         nonlocal current_ai_task
         if current_ai_task and not current_ai_task.done():
             logger.info(f"Interrupting AI generation: {reason}")
-            current_ai_task.cancel()
+            teardown = asyncio.create_task(cancel_turn(current_ai_task))
             try:
                 await websocket.send_json({
                     "source": "assistant",
@@ -104,45 +161,75 @@ async def websocket_endpoint(websocket: WebSocket):
                     "ts": datetime.now(timezone.utc).isoformat()
                 })
             except Exception: pass
+            # Wait (bounded) until the old run has closed its model stream before starting a new one
+            await teardown
+
+    # Barge-in only on sustained speech (see vad.py), not on every audio frame
+    async def on_user_speech() -> bool:
+        if current_ai_task and not current_ai_task.done():
+            await cancel_running_task(reason="User started speaking")
+            return True
+        return False
+    # Voice input (stt.py): a final transcript starts a turn just like a typed message
+    async def on_transcript(text: str, m_id: str):
+        nonlocal current_ai_task
+        voice.user_followed_up()
+        await cancel_running_task(reason="User finished speaking")
+        current_ai_task = asyncio.create_task(process_agent_request([types.Part(text=text)], m_id))
+    voice = VoiceActivity(on_user_speech, build_transcriber(websocket.send_json, on_transcript))
 
     async def process_agent_request(parts: list, m_id: str):
         """Background task to run the agent and stream results back."""
         response_m_id = str(uuid.uuid4())
         run_config = RunConfig(streaming_mode=StreamingMode.SSE, response_modalities=["TEXT"])
         
+        turn = current_turn()
+        
         try:
-            async for event in runner.run_async(user_id=user_id, session_id=session_id, new_message=types.Content(role="user", parts=parts), run_config=run_config): # type: ignore
+            # Closed explicitly so a cancelled run releases its Gemini stream right away
+            async with upstream(runner.run_async(user_id=user_id, session_id=session_id, new_message=types.Content(role="user", parts=parts), run_config=run_config)) as events: # type: ignore
+                async for event in events:
                 
-                event_parts = getattr(getattr(event, "content", None), "parts", []) or []
+                    event_parts = getattr(getattr(event, "content", None), "parts", []) or []
                 
-                # Stream Thoughts (if agent supports reasoning models)
-                thoughts = "\n".join(p.text for p in event_parts if getattr(p, "thought", False))
-                if thoughts:
-                    await websocket.send_json({
-                        "source": "assistant", "type": "ThoughtMessage", 
-                        "content": thoughts, "m_id": response_m_id, "ts": datetime.now(timezone.utc).isoformat()
-                    })
-
-                # Stream Standard Text Chunks
-                if getattr(event, "content", None):
-                    text_chunk = "".join(p.text for p in event_parts if p.text and not getattr(p, "thought", False))
-                    if text_chunk and getattr(event, 'partial', False):
+                    # Stream Thoughts (if agent supports reasoning models)
+                    thoughts = "\n".join(p.text for p in event_parts if getattr(p, "thought", False))
+                    if thoughts and turn.forward(thoughts):
                         await websocket.send_json({
-                            "source": "assistant", "type": "TextMessage",
-                            "content": text_chunk, "m_id": response_m_id, "ts": datetime.now(timezone.utc).isoformat()
+                            "source": "assistant", "type": "ThoughtMessage", 
+                            "content": thoughts, "m_id": response_m_id, "ts": datetime.now(timezone.utc).isoformat()
                         })
 
+                    # Stream Standard Text Chunks
+                    if getattr(event, "content", None):
+                        text_chunk = "".join(p.text for p in event_parts if p.text and not getattr(p, "thought", False))
+                        if text_chunk and getattr(event, 'partial', False) and turn.forward(text_chunk):
+                            await websocket.send_json({
+                                "source": "assistant", "type": "TextMessage",
+                                "content": text_chunk, "m_id": response_m_id, "ts": datetime.now(timezone.utc).isoformat()
+                            })
+
             # Signal the frontend that generation is complete
             await websocket.send_json({
                 "source": "assistant", "type": "FinalMessage", 
                 "m_id": response_m_id, "ts": datetime.now(timezone.utc).isoformat()
             })
+            turn.finish("completed")
 
         except asyncio.CancelledError:
             logger.info("Agent generation was successfully cancelled by the user.")
         except Exception as e:
+            turn.finish("failed")
             logger.error(f"Agent execution error: {e}")
 
+    # Graceful shutdown (drain.py): the running turn finishes, then the client reconnects
+    draining = drain.track(websocket, session_id, busy=lambda: bool(current_ai_task and not current_ai_task.done()),
+                           cancel=cancel_running_task)
+    # Heartbeat (heartbeat.py): pings the client, closes the session once it stops answering or sits idle
+    liveness = reaper.track(websocket, busy=lambda: bool(current_ai_task and not current_ai_task.done()))
+    # Memory accounting (memory.py): connection-scoped state, counted under this session
+    accounted = accountant.attach(session_id, voice=voice, adk_session=session_service)
+
     # 5. Main WebSocket Receive Loop
     try:
         while True:
@@ -153,6 +240,8 @@ async def websocket_endpoint(websocket: WebSocket):
 
             m_id = data_json.get('m_id', str(uuid.uuid4()))
             msg_type = data_json.get('type')
+            if liveness.inbound(msg_type): continue  # A pong
+            transcript.inbound(data_json)
             parts = []
 
             # Non-LLM Events
@@ -160,17 +249,20 @@ async def websocket_endpoint(websocket: WebSocket):
                 continue
             
             if msg_type == 'feedback':
-                await save_feedback() # Hook to your utils
+                await save_feedback(data_json, session_id) # Hook to your utils
                 continue
 
 
             # LLM Triggering Events
             if msg_type == 'AudioMessage':
-                await cancel_running_task(reason="User started speaking")
-                # Handle audio processing/STT here in production
+                if data_json.get('partial_audio', True):
+                    voice.feed(data_json.get('data', ''), data_json.get('mimeType', 'audio/pcm;rate=16000'))
+                else:
+                    await cancel_running_task(reason="User sent a voice message")
                 continue
 
             if msg_type == 'WidgetEvent':
+                voice.user_followed_up()
                 await cancel_running_task(reason="User interacted with a widget")
                 payload = data_json.get("widgetEvent", {}).get("payload", {})
                 text_content = "\n".join(f"{k}: {v}" for k, v in payload.items()).strip()
@@ -178,6 +270,7 @@ async def websocket_endpoint(websocket: WebSocket):
                     parts.append(types.Part(text=f"[User Submitted Form/Widget]:\n{text_content}"))
 
             if msg_type == 'TextMessage':
+                voice.user_followed_up()
                 await cancel_running_task(reason="User typed a message")
                 
                 text_content = data_json.get('content', '')
@@ -201,8 +294,20 @@ async def websocket_endpoint(websocket: WebSocket):
     except WebSocketDisconnect:
         logger.info(f"Session {session_id} disconnected.")
     finally:
-        pass
+        # Nobody is listening any more, so don't let the model keep generating
+        drain.untrack(draining)
+        reaper.untrack(liveness)
+        accountant.detach(accounted)
+        await voice.close()
+        if current_ai_task and not current_ai_task.done():
+            await cancel_turn(current_ai_task)
+        transcript.close()
+
+@app.websocket("/ws/mux")
+async def websocket_mux(websocket: WebSocket):
+    # Several sessions on one socket (mux.py): every channel runs websocket_endpoint like its own /ws connection
+    await serve_mux(websocket, websocket_endpoint)
 
 if __name__ == "__main__":
 	import uvicorn
-	uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+	uvicorn.run(app, host="0.0.0.0", port=8000, ws=WebSocketProtocol)  # Deflate policy (compression.py)
\ No newline at end of file
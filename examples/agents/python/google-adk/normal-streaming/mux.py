@@ -0,0 +1,172 @@
+"""
+Many chat sessions over one WebSocket (/ws/mux), for pages that embed several agents at once.
+
+Every embed on its own /ws pays for a TCP (and TLS) connection, an HTTP upgrade, deflate state and
+server buffers. On /ws/mux a page opens one socket and any number of channels on it. Each channel runs
+the normal /ws handler, so a channel is a full session: it has its own token / session_id (same rules
+as the /ws query string), agent run, transcript and barge-in.
+
+Every frame is the usual JSON message plus "ch", the channel ID the client picked. Client -> server:
+
+    {"ch": "a1", "type": "open", "session_id": "...", "token": "...", "window": 64}
+    {"ch": "a1", "type": "TextMessage", "content": "..."}     # anything else goes to the channel as is
+    {"ch": "a1", "type": "credit", "n": 32}                    # flow control, see below
+    {"ch": "a1", "type": "close"}                              # ends the session, cancelling its run
+
+Server -> client: the channel's messages with "ch" added, {"ch", "type": "closed"} when a channel has
+ended (either side closed it), and {"ch", "type": "error", "content"} for frames the mux rejects.
+
+Flow control is per channel, so a busy agent cannot hold up the others:
+  - Outbound (opt-in): with "window": N in the open frame, the channel may send N messages, and then
+    waits for the client to grant more with "credit". A dashboard can pause an agent that is off screen
+    without closing it. Without a window, a channel sends freely. Only conversation output (text, audio,
+    widgets) uses credit; control messages (UNMETERED_TYPES: ping, reconnect hints, interrupts, errors)
+    always go out, so a paused channel still answers heartbeats and drains.
+  - Inbound: each channel queues up to ZIJUS_MUX_CHANNEL_QUEUE messages. If its handler falls behind,
+    further messages for that channel are dropped (counted in mux_stats) instead of stalling the socket.
+"""
+import os
+import json
+import asyncio
+import logging
+from typing import Optional
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+logger = logging.getLogger(__name__)
+
+MUX_MAX_CHANNELS = int(os.getenv("ZIJUS_MUX_MAX_CHANNELS", "64"))
+MUX_CHANNEL_QUEUE = int(os.getenv("ZIJUS_MUX_CHANNEL_QUEUE", "64"))
+MUX_MAX_CHANNEL_ID = 64
+CONTROL_KEYS = ("ch", "type", "window")
+UNMETERED_TYPES = {"session", "ping", "pong", "reconnect", "InterruptMessage", "error", "closed"}
+
+mux_stats = {"sockets": 0, "channels_opened": 0, "channels_open": 0, "dropped": 0, "credit_waits": 0}
+
+
+class Channel:
+    """One logical session: the part of Starlette's WebSocket the /ws handlers use."""
+    def __init__(self, mux: "Mux", ch: str, params: dict, window: Optional[int]):
+        self.mux, self.ch = mux, ch
+        self.query_params = params
+        self.inbox: asyncio.Queue = asyncio.Queue(MUX_CHANNEL_QUEUE)
+        self.credit = window  # None = no outbound flow control
+        self.credit_granted = asyncio.Event()
+        self.ended = False
+        self.task: Optional[asyncio.Task] = None
+
+    async def accept(self, *args, **kwargs):
+        pass  # The mux socket is already accepted
+
+    async def receive_text(self) -> str:
+        text = await self.inbox.get()
+        if text is None: raise WebSocketDisconnect(code=1000)
+        return text
+
+    async def send_json(self, data: dict, mode: str = "text"):
+        if self.credit is not None and data.get("type") not in UNMETERED_TYPES:
+            while self.credit <= 0 and not self.ended:
+                mux_stats["credit_waits"] += 1
+                self.credit_granted.clear()
+                await self.credit_granted.wait()
+            self.credit -= 1
+        if self.ended: raise WebSocketDisconnect(code=1006)  # Like a send on a closed /ws
+        await self.mux.websocket.send_json({**data, "ch": self.ch})
+
+    async def close(self, code: int = 1000, reason: Optional[str] = None):
+        self.end()
+
+    def deliver(self, text: str):
+        try: self.inbox.put_nowait(text)
+        except asyncio.QueueFull: mux_stats["dropped"] += 1
+
+    def grant(self, n: int):
+        if self.credit is not None and n > 0:
+            self.credit += n
+            self.credit_granted.set()
+
+    def end(self):
+        """Make the handler see a disconnect; later sends fail, like on a closed socket."""
+        if self.ended: return
+        self.ended = True
+        self.credit_granted.set()
+        while True:  # Unread messages don't matter any more, the disconnect must get through
+            try: self.inbox.put_nowait(None); break
+            except asyncio.QueueFull: self.inbox.get_nowait()
+
+
+class Mux:
+    def __init__(self, websocket: WebSocket, handler):
+        self.websocket, self.handler = websocket, handler
+        self.channels: dict[str, Channel] = {}
+
+    async def error(self, ch, content: str):
+        try: await self.websocket.send_json({"ch": ch, "type": "error", "content": content})
+        except Exception: pass
+
+    async def route(self, text: str):
+        try: data = json.loads(text)
+        except Exception: return
+        if not isinstance(data, dict): return
+        ch = data.get("ch")
+        if not isinstance(ch, str) or not ch or len(ch) > MUX_MAX_CHANNEL_ID:
+            return await self.error(ch, "Missing or invalid channel ID")
+        msg_type = data.get("type")
+        channel = self.channels.get(ch)
+        if msg_type == "open":
+            if channel: return await self.error(ch, "Channel already open")
+            if len(self.channels) >= MUX_MAX_CHANNELS: return await self.error(ch, "Too many channels")
+            self.open(ch, data)
+        elif channel is None:
+            await self.error(ch, "Unknown channel")
+        elif msg_type == "close":
+            channel.end()
+        elif msg_type == "credit":
+            try: channel.grant(int(data.get("n", 0)))
+            except (TypeError, ValueError): pass
+        else:
+            channel.deliver(text)  # The handler ignores the extra "ch" key
+
+    def open(self, ch: str, data: dict):
+        params = {k: str(v) for k, v in data.items() if k not in CONTROL_KEYS and v is not None}
+        window = data.get("window")
+        channel = Channel(self, ch, params, int(window) if isinstance(window, (int, float)) and window > 0 else None)
+        self.channels[ch] = channel
+        mux_stats["channels_opened"] += 1
+        mux_stats["channels_open"] += 1
+        channel.task = asyncio.create_task(self.run(channel))
+
+    async def run(self, channel: Channel):
+        try:
+            await self.handler(channel)
+        except WebSocketDisconnect:
+            pass
+        except Exception as e:
+            logger.error(f"Mux channel {channel.ch} failed: {e}")
+        finally:
+            channel.end()
+            self.channels.pop(channel.ch, None)
+            mux_stats["channels_open"] -= 1
+            try: await self.websocket.send_json({"ch": channel.ch, "type": "closed"})
+            except Exception: pass
+
+    async def close(self):
+        """The socket is gone: end every channel and wait for their handlers to clean up."""
+        tasks = [channel.task for channel in self.channels.values() if channel.task]
+        for channel in list(self.channels.values()):
+            channel.end()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def serve_mux(websocket: WebSocket, handler):
+    """Run `handler` (the /ws endpoint) once per channel opened on this socket."""
+    await websocket.accept()
+    mux_stats["sockets"] += 1
+    mux = Mux(websocket, handler)
+    try:
+        while True:
+            await mux.route(await websocket.receive_text())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await mux.close()
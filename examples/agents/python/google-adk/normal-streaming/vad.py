@@ -0,0 +1,224 @@
+"""
+Server-side voice activity detection for barge-in.
+
+Every AudioMessage used to cancel the running turn, so background noise or the mic opening killed a paid
+generation. VoiceActivity analyses the audio in a per-connection worker (NumPy in a thread, batched) and
+only calls `on_speech` once speech has lasted VAD_MIN_SPEECH_MS. Short bursts are counted as rejected.
+
+Detectors (ZIJUS_VAD_MODEL):
+  energy     (default) frame energy above an adaptive noise floor, with a speech-like zero-crossing rate
+  webrtcvad  the WebRTC model, if `pip install webrtcvad` is available (falls back to energy otherwise)
+
+A barge-in that is not followed by a user message within VAD_FOLLOWUP_S is counted as a false interrupt
+(see GET /admin/metrics). With a Transcriber (stt.py) attached, the same frames and speech start/end
+events also drive speech-to-text.
+"""
+import os
+import re
+import time
+import base64
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+import numpy as np
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+VAD_MODEL = os.getenv("ZIJUS_VAD_MODEL", "energy").lower()
+VAD_MIN_SPEECH_MS = int(os.getenv("ZIJUS_VAD_MIN_SPEECH_MS", "240"))
+VAD_HANGOVER_MS = int(os.getenv("ZIJUS_VAD_HANGOVER_MS", "300"))
+VAD_FOLLOWUP_S = float(os.getenv("ZIJUS_VAD_FOLLOWUP_S", "8.0"))
+FRAME_MS = 20
+
+PARAM_RE = re.compile(r"(\w+)=([\w.]+)")
+SAMPLE_FORMATS = {"s16le": np.dtype("<i2"), "f32le": np.dtype("<f4")}
+
+
+def parse_audio_mime(mime_type: str) -> Optional[tuple[int, int, str]]:
+    """(rate, channels, format) of a raw PCM mime type such as 'audio/pcm;rate=48000;channels=2;format=f32le'."""
+    mime_type = (mime_type or "audio/pcm").lower()
+    if not mime_type.startswith(("audio/pcm", "audio/l16", "audio/raw")):
+        return None
+    params = dict(PARAM_RE.findall(mime_type))
+    sample_format = params.get("format", "s16le")
+    if sample_format not in SAMPLE_FORMATS:
+        return None
+    return int(float(params.get("rate", 16000))), int(params.get("channels", 1)), sample_format
+
+
+class EnergyModel:
+    """Vectorized energy + zero-crossing detector with an adaptive noise floor."""
+    def __init__(self, margin_db: float = 12.0, floor_dbfs: float = -50.0):
+        self.margin_db = margin_db
+        self.noise_db = floor_dbfs
+        self.floor_dbfs = floor_dbfs
+
+    def speech_frames(self, frames: np.ndarray, rate: int) -> np.ndarray:
+        """frames: (n, frame_len) float32 in [-1, 1]. Returns one bool per frame."""
+        rms = np.sqrt(np.mean(np.square(frames), axis=1)) + 1e-9
+        level_db = 20 * np.log10(rms)
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / frames.shape[1]
+        # Voiced speech sits well below white noise (~0.5) in zero crossings
+        speech = (level_db > max(self.noise_db, self.floor_dbfs) + self.margin_db) & (zcr > 0.01) & (zcr < 0.35)
+        quiet = level_db[~speech]
+        if quiet.size:
+            # Follow the background level: fast down, slow up
+            target = float(np.median(quiet))
+            self.noise_db += (target - self.noise_db) * (0.5 if target < self.noise_db else 0.05)
+        return speech
+
+
+class WebRtcModel:
+    """WebRTC VAD (optional dependency). Needs 16-bit mono at 8/16/32/48 kHz."""
+    def __init__(self, aggressiveness: int = 2):
+        import webrtcvad
+        self.vad = webrtcvad.Vad(aggressiveness)
+
+    def speech_frames(self, frames: np.ndarray, rate: int) -> np.ndarray:
+        pcm = (np.clip(frames, -1, 1) * 32767).astype("<i2")
+        return np.fromiter((self.vad.is_speech(row.tobytes(), rate) for row in pcm), dtype=bool, count=len(pcm))
+
+
+def build_model(rate: int):
+    if VAD_MODEL == "webrtcvad" and rate in (8000, 16000, 32000, 48000):
+        try: return WebRtcModel()
+        except ImportError: logger.warning("ZIJUS_VAD_MODEL=webrtcvad but webrtcvad is not installed; using energy VAD.")
+    return EnergyModel()
+
+
+class VoiceActivity:
+    """
+    Per-connection barge-in detector. feed() is cheap and never blocks the receive loop; the worker
+    decodes and analyses whatever has queued up since its last pass in one thread hop.
+
+    on_speech() is awaited when sustained speech starts and returns True if it interrupted a turn.
+    """
+    def __init__(self, on_speech: Callable[[], Awaitable[bool]], transcriber=None):
+        self.on_speech = on_speech
+        self.transcriber = transcriber
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=200)
+        self.model = None
+        self.source: Optional[tuple[int, int, str]] = None
+        self.rate = 16000
+        self._position = 0  # Samples analysed since the stream (format) started
+        self._leftover = np.zeros(0, dtype=np.float32)
+        self._speech_ms = 0
+        self._silence_ms = 0
+        self._triggered = False
+        self._pending_barge_in: Optional[asyncio.TimerHandle] = None
+        self._worker = asyncio.create_task(self._run())
+
+    def feed(self, audio_b64: str, mime_type: str):
+        if not audio_b64:
+            return  # e.g. a mic-open event with no samples
+        if self.queue.full():
+            self.queue.get_nowait()  # Drop the oldest chunk rather than fall behind real time
+        self.queue.put_nowait((audio_b64, mime_type))
+
+    def user_followed_up(self):
+        """Call on every user message: a barge-in followed by one was a real interruption."""
+        if self._pending_barge_in is not None:
+            self._pending_barge_in.cancel()
+            self._pending_barge_in = None
+
+    async def close(self):
+        self._worker.cancel()
+        try: await self._worker
+        except asyncio.CancelledError: pass
+        self.user_followed_up()
+        if self.transcriber: await self.transcriber.close()
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                events, rejected = await asyncio.to_thread(self._analyse, batch)
+            except Exception as e:
+                logger.error(f"VAD error: {e}")
+                continue
+            metrics.vad_rejected += rejected
+            now = time.perf_counter()
+            for kind, position in events:
+                if kind == "start":
+                    await self._barge_in()
+                    if self.transcriber: await self.transcriber.begin(position)
+                elif self.transcriber:
+                    # Backdate to when the last speech frame was captured
+                    await self.transcriber.end(position, now - (self._position - position) / self.rate)
+
+    def _analyse(self, batch: list) -> tuple[list, int]:
+        """Runs in a worker thread. Returns ([("start" | "end", sample position)], bursts rejected)."""
+        events, rejected = [], 0
+        for audio_b64, mime_type in batch:
+            source = parse_audio_mime(mime_type)
+            if source is None:
+                continue
+            rate, channels, sample_format = source
+            if source != self.source:
+                self.source, self.model, self.rate = source, build_model(rate), rate
+                self._leftover = np.zeros(0, dtype=np.float32)
+                self._position = 0
+                if self.transcriber: self.transcriber.reset(rate)
+
+            raw = base64.b64decode(audio_b64)
+            dtype = SAMPLE_FORMATS[sample_format]
+            samples = np.frombuffer(raw, dtype=dtype, count=len(raw) // (dtype.itemsize * channels) * channels)
+            mono = samples.reshape(-1, channels).mean(axis=1, dtype=np.float32)
+            if sample_format == "s16le":
+                mono *= 1 / 32768
+
+            frame_len = rate * FRAME_MS // 1000
+            audio = np.concatenate([self._leftover, mono]) if self._leftover.size else mono
+            usable = audio.size - audio.size % frame_len
+            self._leftover = audio[usable:].copy()
+            if not usable:
+                continue
+
+            if self.transcriber: self.transcriber.write(audio[:usable])
+            for is_speech in self.model.speech_frames(audio[:usable].reshape(-1, frame_len), rate):  # type: ignore
+                self._position += frame_len
+                event = self._step(bool(is_speech))
+                if event == "rejected":
+                    rejected += 1
+                elif event == "start":
+                    events.append((event, self._position - self._speech_ms * rate // 1000))
+                elif event == "end":
+                    events.append((event, self._position - self._silence_ms * rate // 1000))
+        return events, rejected
+
+    def _step(self, is_speech: bool) -> Optional[str]:
+        """Sustain/hangover logic for one frame: "start", "end", "rejected" (a burst too short to be speech) or None."""
+        if is_speech:
+            self._speech_ms += FRAME_MS
+            self._silence_ms = 0
+            if not self._triggered and self._speech_ms >= VAD_MIN_SPEECH_MS:
+                self._triggered = True
+                return "start"
+            return None
+
+        self._silence_ms += FRAME_MS
+        if self._silence_ms >= VAD_HANGOVER_MS and self._speech_ms:
+            triggered = self._triggered
+            self._speech_ms = 0
+            self._triggered = False
+            return "end" if triggered else "rejected"
+        return None
+
+    async def _barge_in(self):
+        metrics.vad_triggers += 1
+        if not await self.on_speech():
+            return
+        metrics.vad_barge_ins += 1
+        if self._pending_barge_in is not None: self._pending_barge_in.cancel()
+        self._pending_barge_in = asyncio.get_running_loop().call_later(VAD_FOLLOWUP_S, self._false_interrupt)
+
+    def _false_interrupt(self):
+        self._pending_barge_in = None
+        metrics.vad_false_interrupts += 1
+        logger.info("Barge-in was not followed by a user message; counted as a false interrupt.")
@@ -0,0 +1,148 @@
+"""
+Batched, non-blocking feedback storage.
+
+`utils.save_feedback()` used to be awaited inside the WebSocket receive loop, so a real database call
+would stall that session. Now submit() only appends to an in-memory batch. A background flusher writes a
+batch once it reaches FEEDBACK_BATCH_SIZE events or is FEEDBACK_FLUSH_MS old, in one transaction on a
+dedicated writer thread.
+
+Sinks (ZIJUS_FEEDBACK_SINK):
+  sqlite          (default) ZIJUS_FEEDBACK_DB, WAL mode, one executemany() per batch
+  package.module:Class  any class with write_batch(records: list[dict]) and close(), both synchronous
+
+Delivery is at-least-once. A failed batch is retried on the next flush, and close() (app shutdown)
+flushes everything still pending. Every record carries a unique id, so a sink can ignore replays
+(the SQLite sink uses INSERT OR IGNORE).
+"""
+import os
+import json
+import uuid
+import time
+import asyncio
+import logging
+import sqlite3
+import importlib
+from collections import deque
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+FEEDBACK_SINK = os.getenv("ZIJUS_FEEDBACK_SINK", "sqlite")
+FEEDBACK_DB = os.getenv("ZIJUS_FEEDBACK_DB", "feedback.db")
+FEEDBACK_BATCH_SIZE = int(os.getenv("ZIJUS_FEEDBACK_BATCH_SIZE", "500"))
+FEEDBACK_FLUSH_MS = int(os.getenv("ZIJUS_FEEDBACK_FLUSH_MS", "500"))
+FEEDBACK_MAX_PENDING = int(os.getenv("ZIJUS_FEEDBACK_MAX_PENDING", "100000"))  # Beyond this the oldest are dropped
+
+
+class SQLiteSink:
+    """Feedback table in a WAL-mode SQLite file. Only ever used from the sink's single writer thread."""
+    def __init__(self, path: str = FEEDBACK_DB):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")  # Durable at each WAL checkpoint, much faster than FULL
+        self.db.execute("""CREATE TABLE IF NOT EXISTS feedback (
+            id TEXT PRIMARY KEY, ts TEXT, session_id TEXT, m_id TEXT, feedback TEXT, payload TEXT)""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS feedback_m_id ON feedback (m_id)")
+
+    def write_batch(self, records: list):
+        with self.db:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO feedback (id, ts, session_id, m_id, feedback, payload) VALUES (?, ?, ?, ?, ?, ?)",
+                [(r["id"], r["ts"], r["session_id"], r["m_id"], r["feedback"], json.dumps(r["payload"])) for r in records],
+            )
+
+    def close(self):
+        self.db.close()
+
+
+def build_sink():
+    if FEEDBACK_SINK == "sqlite":
+        return SQLiteSink()
+    module_name, _, class_name = FEEDBACK_SINK.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+class FeedbackSink:
+    """Process-wide batcher in front of a sink. submit() is O(1) and never awaits."""
+    def __init__(self, sink_factory=build_sink):
+        self.sink_factory = sink_factory
+        self.sink = None
+        self.pending: list = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._closing = False
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="feedback")  # SQLite wants one writer
+        self.stats = {"submitted": 0, "written": 0, "batches": 0, "failed_batches": 0, "dropped": 0}
+        self.write_lag_s: deque = deque(maxlen=10000)  # Submit -> committed, per event
+
+    def submit(self, payload: dict, session_id: str) -> None:
+        if self._flusher is None:
+            self._wakeup = asyncio.Event()
+            self._flusher = asyncio.create_task(self._run())
+        self.pending.append({
+            "id": uuid.uuid4().hex, "ts": datetime.now(timezone.utc).isoformat(), "session_id": session_id,
+            "m_id": payload.get("m_id", ""), "feedback": str(payload.get("feedback", "")), "payload": payload,
+            "_t": time.perf_counter(),
+        })
+        self.stats["submitted"] += 1
+        if len(self.pending) > FEEDBACK_MAX_PENDING:
+            overflow = len(self.pending) - FEEDBACK_MAX_PENDING
+            del self.pending[:overflow]
+            self.stats["dropped"] += overflow
+        if len(self.pending) >= FEEDBACK_BATCH_SIZE:
+            self._wakeup.set()  # type: ignore
+
+    async def _run(self):
+        while not self._closing:
+            try: await asyncio.wait_for(self._wakeup.wait(), timeout=FEEDBACK_FLUSH_MS / 1000)  # type: ignore
+            except asyncio.TimeoutError: pass
+            self._wakeup.clear()  # type: ignore
+            await self.flush()
+
+    async def flush(self):
+        """Writes everything pending, one batch at a time. A failed batch goes back to the front of the queue."""
+        while self.pending:
+            taken, self.pending = self.pending, []
+            for start in range(0, len(taken), FEEDBACK_BATCH_SIZE):
+                batch = taken[start:start + FEEDBACK_BATCH_SIZE]
+                try:
+                    await asyncio.get_running_loop().run_in_executor(self._writer, self._write, batch)
+                except asyncio.CancelledError:
+                    self.pending[:0] = taken[start:]  # The batch may already be written; replays are ignored by id
+                    raise
+                except Exception as e:
+                    self.stats["failed_batches"] += 1
+                    logger.error(f"Feedback batch of {len(batch)} failed, will retry: {e}")
+                    self.pending[:0] = taken[start:]
+                    return
+                now = time.perf_counter()
+                self.write_lag_s.extend(now - r["_t"] for r in batch)
+                self.stats["written"] += len(batch)
+                self.stats["batches"] += 1
+
+    def _write(self, batch: list):
+        if self.sink is None:
+            self.sink = self.sink_factory()
+        self.sink.write_batch(batch)
+
+    async def close(self):
+        """App shutdown: stop the flusher, then deliver whatever is still pending (at-least-once)."""
+        if self._flusher is not None:
+            self._closing = True  # Not cancel(): wait_for() can swallow a cancel that races the wakeup
+            self._wakeup.set()  # type: ignore
+            await self._flusher
+            self._flusher = None
+        for _ in range(3):
+            await self.flush()
+            if not self.pending: break
+        if self.pending:
+            logger.error(f"{len(self.pending)} feedback events could not be written at shutdown.")
+        if self.sink is not None:
+            await asyncio.get_running_loop().run_in_executor(self._writer, self.sink.close)
+        self._writer.shutdown(wait=True)
+        logger.info(f"Feedback sink closed: {self.stats}")
+
+
+feedback_sink = FeedbackSink()
@@ -1,15 +1,18 @@
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import HumanMessage, SystemMessage, AIMessage, ToolMessage, messages_to_dict, messages_from_dict
 from langgraph.graph import StateGraph, END
 from langgraph.graph.message import add_messages
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.prebuilt import ToolNode, tools_condition
 from langchain_core.tools import tool
-from typing import Annotated, TypedDict, Union
+from typing import Annotated, Optional, TypedDict, Union
 from dotenv import load_dotenv
+import json
 
 # Import framework-agnostic UI tools
 from zijus_tools import SendSlots, SendSlider
+from workflow import Step, Workflow
+from widgets import widget_result
 
 load_dotenv()
 
@@ -50,15 +53,39 @@ STEP 4: Booking the Appointment
 async def send_slots_tool(slots: list[str]) -> str:
     """Renders clickable choice buttons (slots) in the chat UI."""
     await SendSlots(slots=slots)
-    return "UI rendered successfully. Stop generating and wait for the user."
+    return await widget_result()  # The answer itself with ZIJUS_INTERACTIVE_TOOLS (widgets.py)
 
 @tool
 async def send_slider_tool(content: str, min_value: int, max_value: int, default_value: int) -> str:
     """Renders an interactive range slider in the chat UI."""
     await SendSlider(content=content, min_value=min_value, max_value=max_value, default_value=default_value)
-    return "UI rendered successfully. Stop generating and wait for the user."
+    return await widget_result()
 # --------------------------------------
 
+# --- DETERMINISTIC FAST PATH (opt-in: ZIJUS_WORKFLOW_FASTPATH=true) ---
+# Steps 2-4 above are fixed transitions, so the gateway can answer widget clicks without an LLM round-trip.
+TERM_SLOTS = ["12 Months", "24 Months", "36 Months"]
+OFFICER_SLOTS = ["Yes", "No"]
+APPOINTMENT_SLOTS = ["Tomorrow 10:00 AM", "Tomorrow 2:00 PM", "Next Monday 11:00 AM"]
+ESTIMATE_APR = 0.079
+
+def _estimate(values: dict) -> str:
+    amount, months = values["amount"], int(values["term"].split()[0])
+    rate = ESTIMATE_APR / 12
+    payment = amount * rate / (1 - (1 + rate) ** -months)
+    return (f"Here is your estimate:\n\n| Amount | Term | APR | Monthly payment |\n|---|---|---|---|\n"
+            f"| ${amount:,.0f} | {months} months | {ESTIMATE_APR:.1%} | **${payment:,.2f}** |\n\n"
+            "Would you like to speak to a loan officer?")
+
+finny_workflow = Workflow([
+    Step("amount", answers="slider", reply="Great, a ${amount:,.0f} loan. How long would you like to take to pay it back?", slots=TERM_SLOTS),
+    Step("term", answers=TERM_SLOTS, reply=_estimate, slots=OFFICER_SLOTS),
+    Step("officer", answers=OFFICER_SLOTS, accepts=["Yes"], reply="Pick a time that suits you.", slots=APPOINTMENT_SLOTS),
+    Step("officer", answers=OFFICER_SLOTS, accepts=["No"], reply="No problem. Thanks for chatting with Zijus Bank, have a great day!"),
+    Step("appointment", answers=APPOINTMENT_SLOTS, reply="You're booked for {appointment}. A loan officer will call you then."),
+])
+# ----------------------------------------------------------------------
+
 # 1. Define the State dictionary for the graph
 class AgentState(TypedDict):
     messages: Annotated[list, add_messages]
@@ -97,6 +124,50 @@ graph_builder.add_edge("tools", "chatbot")
 checkpointer = MemorySaver()
 root_agent = graph_builder.compile(checkpointer=checkpointer)
 
+async def close_dangling_tool_calls(config: dict) -> int:
+    """
+    Answers tool calls that a cancelled run left without a ToolMessage.
+    OpenAI rejects a history where an assistant tool call has no result, which would break the thread's next turn.
+    """
+    snapshot = await root_agent.aget_state(config)
+    messages = (snapshot.values or {}).get("messages", []) if snapshot else []
+    last_ai = next((i for i in range(len(messages) - 1, -1, -1) if isinstance(messages[i], AIMessage)), None)
+    if last_ai is None or not messages[last_ai].tool_calls:
+        return 0
+
+    answered = {m.tool_call_id for m in messages[last_ai + 1:] if isinstance(m, ToolMessage)}
+    missing = [tc for tc in messages[last_ai].tool_calls if tc["id"] not in answered]
+    if missing:
+        await root_agent.aupdate_state(
+            config, {"messages": [ToolMessage(content="Cancelled by the user.", tool_call_id=tc["id"]) for tc in missing]}, as_node="tools"
+        )
+    return len(missing)
+
+async def export_thread(config: dict) -> Optional[bytes]:
+    """The thread's messages as JSON, for the worker that takes the session over (see drain.py)."""
+    snapshot = await root_agent.aget_state(config)
+    messages = (snapshot.values or {}).get("messages", []) if snapshot else []
+    return json.dumps(messages_to_dict(messages)).encode() if messages else None
+
+async def import_thread(config: dict, state: bytes):
+    """Recreates a thread exported by a draining worker. MemorySaver only lives in memory, so it starts empty here."""
+    await root_agent.aupdate_state(config, {"messages": messages_from_dict(json.loads(state))}, as_node="chatbot")
+
+async def release_thread(config: dict):
+    """Drops the thread's checkpoints from memory (after export_thread() saved it somewhere else)."""
+    await checkpointer.adelete_thread(config["configurable"]["thread_id"])
+
+def thread_memory() -> dict:
+    """
+    thread_id -> what MemorySaver holds for it, for memory.py: its checkpoints, pending writes and channel
+    blobs. Every new version of the messages channel is a blob of its own, so a thread grows with each turn.
+    """
+    threads = {thread_id: [checkpoints] for thread_id, checkpoints in list(getattr(checkpointer, "storage", {}).items())}
+    for table in (getattr(checkpointer, "writes", {}), getattr(checkpointer, "blobs", {})):
+        for key, value in list(table.items()):
+            if key[0] in threads: threads[key[0]].append(value)  # Keys start with the thread_id
+    return threads
+
 def build_message_payload(user_input: Union[str, dict]):
     """
     Creates the LangGraph input payload.
@@ -0,0 +1,210 @@
+"""
+Graceful draining for zero-downtime deploys.
+
+Stopping a worker used to cut every WebSocket at once. Running turns died mid-answer, and every client
+reconnected in the same second, so the remaining workers had to validate thousands of JWTs and build
+thousands of agents together. In drain mode (SIGTERM, or POST /admin/drain) a worker instead:
+
+  1. Turns new sessions away before any JWT or agent work, and answers 503 on GET /healthz so the load
+     balancer stops sending it traffic.
+  2. Lets every session's running turn finish, until ZIJUS_DRAIN_DEADLINE_S after the drain started.
+     A turn still running then is interrupted like a barge-in.
+  3. Saves session state that only lives in this process (ZIJUS_DRAIN_STATE_DB). The worker the client
+     reconnects to loads it with handoff.take(session_id), so the conversation carries on there.
+  4. Sends {"type": "reconnect", "retry_after_ms": 0, "reason": "draining"} and closes with 1012 (service
+     restart). Each session is released after a random delay from ZIJUS_DRAIN_RECONNECT_MS ("min,max"),
+     capped by the deadline, so idle clients don't all reconnect in the same second. The spreading is done
+     here because clients may ignore retry_after_ms (the shipped web client retries after a fixed 1 s).
+
+On SIGTERM the server's own shutdown starts once every session has been released.
+"""
+import os
+import time
+import random
+import signal
+import asyncio
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+DRAIN_DEADLINE_S = float(os.getenv("ZIJUS_DRAIN_DEADLINE_S", "25"))  # Leave room under the orchestrator's grace period
+DRAIN_RECONNECT_MS = [int(v) for v in os.getenv("ZIJUS_DRAIN_RECONNECT_MS", "500,10000").split(",")]
+DRAIN_STATE_DB = os.getenv("ZIJUS_DRAIN_STATE_DB", "session-state.db")  # Empty = don't hand off state
+DRAIN_STATE_TTL_S = float(os.getenv("ZIJUS_DRAIN_STATE_TTL_S", "3600"))
+DRAIN_POLL_S = 0.1
+DRAIN_SEND_TIMEOUT_S = 5.0  # A client that doesn't read (full buffer) must not hold up the drain
+
+
+class SessionHandoff:
+    """session_id -> state bytes in SQLite. A draining worker saves, the next worker takes (read once)."""
+    def __init__(self, path: str = DRAIN_STATE_DB):
+        self.path = path
+        self.db: Optional[sqlite3.Connection] = None
+        self._thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="handoff")
+        self._purged = False
+        self.stats = {"saved": 0, "restored": 0, "expired": 0, "errors": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.db is None:
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")  # Several workers can share the file
+            self.db.execute("CREATE TABLE IF NOT EXISTS handoff (session_id TEXT PRIMARY KEY, state BLOB, saved_at REAL)")
+        return self.db
+
+    def _save(self, session_id: str, state: bytes):
+        db = self._connect()
+        with db:
+            if not self._purged:  # Sessions that never came back, left by earlier drains
+                db.execute("DELETE FROM handoff WHERE saved_at < ?", (time.time() - DRAIN_STATE_TTL_S,))
+                self._purged = True
+            db.execute("INSERT OR REPLACE INTO handoff (session_id, state, saved_at) VALUES (?, ?, ?)", (session_id, state, time.time()))
+
+    def _take(self, session_id: str) -> Optional[bytes]:
+        if self.db is None and not os.path.exists(self.path):
+            return None  # No worker has handed anything off yet
+        db = self._connect()
+        with db:
+            row = db.execute("SELECT state, saved_at FROM handoff WHERE session_id = ?", (session_id,)).fetchone()
+            if row is None: return None
+            db.execute("DELETE FROM handoff WHERE session_id = ?", (session_id,))
+        if time.time() - row[1] > DRAIN_STATE_TTL_S:
+            self.stats["expired"] += 1
+            return None
+        return row[0]
+
+    async def save(self, session_id: str, state: bytes):
+        if not self.path: return
+        await asyncio.get_running_loop().run_in_executor(self._thread, self._save, session_id, state)
+        self.stats["saved"] += 1
+
+    async def take(self, session_id: str) -> Optional[bytes]:
+        """State a drained worker left for this session, if any. Errors only cost the handoff, never the session."""
+        if not self.path or not session_id: return None
+        try:
+            state = await asyncio.get_running_loop().run_in_executor(self._thread, self._take, session_id)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"Session handoff lookup failed for {session_id}: {e}")
+            return None
+        if state is not None: self.stats["restored"] += 1
+        return state
+
+    async def close(self):
+        if self.db is not None:
+            await asyncio.get_running_loop().run_in_executor(self._thread, self.db.close)
+            self.db = None
+        self._thread.shutdown(wait=True)
+
+
+class DrainingSession:
+    """What the drain needs from one /ws handler: is a turn running, how to stop it, how to export its state."""
+    def __init__(self, websocket, session_id: str, busy: Callable[[], bool],
+                 cancel: Optional[Callable[[str], Awaitable]], export: Optional[Callable[[], Awaitable[Optional[bytes]]]]):
+        self.websocket, self.session_id = websocket, session_id
+        self.busy, self.cancel, self.export = busy, cancel, export
+
+
+class Drain:
+    def __init__(self):
+        self.draining = False
+        self.deadline = 0.0
+        self.sessions: set = set()
+        self._task: Optional[asyncio.Task] = None
+        self._late: set = set()
+        self._exiting = False
+        self.stats = {"draining": False, "reason": "", "sessions": 0, "turned_away": 0, "drained": 0,
+                      "turns_finished": 0, "turns_cut": 0, "flushed": 0, "flush_errors": 0, "drain_s": None}
+
+    def track(self, websocket, session_id: str, busy: Callable[[], bool], cancel=None, export=None) -> DrainingSession:
+        session = DrainingSession(websocket, session_id, busy, cancel, export)
+        self.sessions.add(session)
+        self.stats["sessions"] = len(self.sessions)
+        if self.draining:  # Got past the check at the top of the handler just before the drain started
+            task = asyncio.create_task(self._release(session))
+            self._late.add(task)
+            task.add_done_callback(self._late.discard)
+        return session
+
+    def untrack(self, session: DrainingSession):
+        self.sessions.discard(session)
+        self.stats["sessions"] = len(self.sessions)
+
+    async def hint(self, websocket, retry_after_ms: Optional[int] = None):
+        """Reconnect hint (a jittered delay unless given), then close as a service restart."""
+        if retry_after_ms is None: retry_after_ms = random.randint(*DRAIN_RECONNECT_MS)
+        try:
+            await asyncio.wait_for(websocket.send_json({"type": "reconnect", "retry_after_ms": retry_after_ms, "reason": "draining"}), DRAIN_SEND_TIMEOUT_S)
+            await asyncio.wait_for(websocket.close(code=1012), DRAIN_SEND_TIMEOUT_S)
+        except Exception: pass
+
+    async def turn_away(self, websocket):
+        self.stats["turned_away"] += 1
+        try: await websocket.accept()
+        except Exception: return
+        await self.hint(websocket)
+
+    def start(self, reason: str) -> asyncio.Task:
+        """Starts draining (once) and returns the task, done when every session has been released."""
+        if self._task is None:
+            self.draining, self.deadline = True, time.monotonic() + DRAIN_DEADLINE_S
+            self.stats.update(draining=True, reason=reason)
+            self._task = asyncio.create_task(self._drain(reason))
+        return self._task
+
+    async def _drain(self, reason: str):
+        started = time.monotonic()
+        logger.warning(f"Draining ({reason}): {len(self.sessions)} sessions, turns get {DRAIN_DEADLINE_S:.0f}s to finish")
+        await asyncio.gather(*(self._release(session) for session in list(self.sessions)), return_exceptions=True)
+        self.stats["drain_s"] = round(time.monotonic() - started, 3)
+        logger.warning(f"Drain finished: {self.stats}")
+
+    async def _release(self, session: DrainingSession):
+        was_busy = session.busy()
+        # Stagger the reconnects here: a running turn keeps going meanwhile, an idle session just waits its turn
+        await asyncio.sleep(max(0.0, min(random.uniform(*DRAIN_RECONNECT_MS) / 1000, self.deadline - time.monotonic())))
+        was_busy = was_busy or session.busy()
+        while session.busy() and time.monotonic() < self.deadline:
+            await asyncio.sleep(DRAIN_POLL_S)
+        if session.busy():
+            self.stats["turns_cut"] += 1
+            if session.cancel: await session.cancel("Worker draining")
+        elif was_busy:
+            self.stats["turns_finished"] += 1
+        if session.export:
+            try:
+                state = await session.export()
+                if state is not None:
+                    await handoff.save(session.session_id, state)
+                    self.stats["flushed"] += 1
+            except Exception as e:
+                self.stats["flush_errors"] += 1
+                logger.error(f"Could not hand off session {session.session_id}: {e}")
+        await self.hint(session.websocket, retry_after_ms=0)  # Already spread out above
+        self.stats["drained"] += 1
+
+    def install(self):
+        """Drain on SIGTERM, then pass the signal on to the server (uvicorn) so it shuts down as usual."""
+        try:
+            previous = signal.getsignal(signal.SIGTERM)
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, self._on_sigterm, previous)
+        except (NotImplementedError, RuntimeError, ValueError): pass  # No signal handling here (Windows, not the main thread)
+
+    def _on_sigterm(self, previous):
+        if self._exiting: return
+        self._exiting = True
+        self.start("SIGTERM").add_done_callback(lambda _: self._exit(previous))
+
+    def _exit(self, previous):
+        asyncio.get_running_loop().remove_signal_handler(signal.SIGTERM)
+        signal.signal(signal.SIGTERM, previous if previous is not None else signal.SIG_DFL)
+        signal.raise_signal(signal.SIGTERM)
+
+    async def close(self):
+        await handoff.close()
+
+
+handoff = SessionHandoff()
+drain = Drain()
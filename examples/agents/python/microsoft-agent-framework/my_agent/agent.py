@@ -1,10 +1,15 @@
 from agent_framework import Agent, Message
 from agent_framework.openai import OpenAIChatClient
 from dotenv import load_dotenv
+from typing import Optional
 import os
+import json
 
 # Import framework-agnostic UI tools
 from zijus_tools import SendSlots, SendSlider
+from workflow import Step, Workflow
+from widgets import widget_result
+from cancellation import upstream
 
 load_dotenv()
 
@@ -46,14 +51,38 @@ STEP 4: Booking the Appointment
 async def send_slots_tool(slots: list[str]) -> str:
     """Renders clickable choice buttons (slots) in the chat UI."""
     await SendSlots(slots=slots)
-    return "UI rendered successfully. Stop generating and wait for the user."
+    return await widget_result()  # The answer itself with ZIJUS_INTERACTIVE_TOOLS (widgets.py)
 
 async def send_slider_tool(content: str, min_value: int, max_value: int, default_value: int) -> str:
     """Renders an interactive range slider in the chat UI."""
     await SendSlider(content=content, min_value=min_value, max_value=max_value, default_value=default_value)
-    return "UI rendered successfully. Stop generating and wait for the user."
+    return await widget_result()
 # ------------------------
 
+# --- DETERMINISTIC FAST PATH (opt-in: ZIJUS_WORKFLOW_FASTPATH=true) ---
+# Steps 2-4 above are fixed transitions, so the gateway can answer widget clicks without an LLM round-trip.
+TERM_SLOTS = ["12 Months", "24 Months", "36 Months"]
+OFFICER_SLOTS = ["Yes", "No"]
+APPOINTMENT_SLOTS = ["Tomorrow 10:00 AM", "Tomorrow 2:00 PM", "Next Monday 11:00 AM"]
+ESTIMATE_APR = 0.079
+
+def _estimate(values: dict) -> str:
+    amount, months = values["amount"], int(values["term"].split()[0])
+    rate = ESTIMATE_APR / 12
+    payment = amount * rate / (1 - (1 + rate) ** -months)
+    return (f"Here is your estimate:\n\n| Amount | Term | APR | Monthly payment |\n|---|---|---|---|\n"
+            f"| ${amount:,.0f} | {months} months | {ESTIMATE_APR:.1%} | **${payment:,.2f}** |\n\n"
+            "Would you like to speak to a loan officer?")
+
+finny_workflow = Workflow([
+    Step("amount", answers="slider", reply="Great, a ${amount:,.0f} loan. How long would you like to take to pay it back?", slots=TERM_SLOTS),
+    Step("term", answers=TERM_SLOTS, reply=_estimate, slots=OFFICER_SLOTS),
+    Step("officer", answers=OFFICER_SLOTS, accepts=["Yes"], reply="Pick a time that suits you.", slots=APPOINTMENT_SLOTS),
+    Step("officer", answers=OFFICER_SLOTS, accepts=["No"], reply="No problem. Thanks for chatting with Zijus Bank, have a great day!"),
+    Step("appointment", answers=APPOINTMENT_SLOTS, reply="You're booked for {appointment}. A loan officer will call you then."),
+])
+# ----------------------------------------------------------------------
+
 class RootAgent:
     def __init__(self):
         self.instructions = instructions
@@ -79,6 +108,17 @@ class RootAgent:
             self.conversation_histories[session_id] = []
         return self.conversation_histories[session_id]
 
+    async def export_session(self, session_id) -> Optional[bytes]:
+        """The session's history as JSON, for the worker that takes the session over (see drain.py)."""
+        history = self.conversation_histories.get(session_id)
+        return json.dumps([m.to_dict() for m in history]).encode() if history else None
+
+    async def import_session(self, session_id, state: bytes):
+        self.conversation_histories[session_id] = [Message.from_dict(m) for m in json.loads(state)]
+
+    async def release_session(self, session_id):
+        self.conversation_histories.pop(session_id, None)
+
     def _extract_text(self, chunk):
         if hasattr(chunk, 'text') and chunk.text: return chunk.text
         if hasattr(chunk, 'delta') and hasattr(chunk.delta, 'text') and chunk.delta.text: return chunk.delta.text
@@ -98,9 +138,11 @@ class RootAgent:
         
         # Run stream using the new v1.2.0 signature
         response_stream = await self.agent.run(messages=messages, stream=True)
-        async for chunk in response_stream: 
-            assistant_full_response += self._extract_text(chunk)
-            yield chunk
+        # Close the provider stream as soon as the caller stops iterating (e.g. on cancel)
+        async with upstream(response_stream) as stream:
+            async for chunk in stream: 
+                assistant_full_response += self._extract_text(chunk)
+                yield chunk
             
         if assistant_full_response:
             history.append(Message(role="assistant", contents=[assistant_full_response]))
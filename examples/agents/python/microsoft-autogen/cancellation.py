@@ -0,0 +1,84 @@
+"""
+Turn cancellation that waits for the agent run to actually stop.
+
+`task.cancel()` only *requests* cancellation. cancel_turn() also waits (up to CANCEL_DEADLINE_S) for the
+run to tear down, upstream() closes the framework/provider stream right away instead of at garbage
+collection (releasing the HTTP connection), and Turn.forward() drops and counts any output a framework
+still yields after the user cancelled.
+"""
+import os
+import time
+import asyncio
+import logging
+import weakref
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CANCEL_DEADLINE_S = float(os.getenv("ZIJUS_CANCEL_DEADLINE_S", "2.0"))
+
+
+class Turn:
+    """Bookkeeping for one agent run (one asyncio task)."""
+    def __init__(self):
+        self.cancelled_at: Optional[float] = None
+        self.outcome: Optional[str] = None
+        metrics.turns_started += 1
+
+    def forward(self, text: str) -> bool:
+        """True if a streamed chunk may go to the UI; output produced after a cancel is dropped and counted."""
+        if self.cancelled_at is None:
+            return True
+        metrics.chunks_after_cancel += 1
+        metrics.tokens_after_cancel += max(1, len(text or "") // 4)
+        return False
+
+    def finish(self, outcome: str):
+        """outcome: "completed", "failed" or "cancelled". Only the first call counts."""
+        if self.outcome: return
+        self.outcome = outcome
+        setattr(metrics, f"turns_{outcome}", getattr(metrics, f"turns_{outcome}") + 1)
+
+
+_turns: "weakref.WeakKeyDictionary[asyncio.Task, Turn]" = weakref.WeakKeyDictionary()
+
+
+def turn_for(task: asyncio.Task) -> Turn:
+    turn = _turns.get(task)
+    if turn is None:
+        turn = _turns[task] = Turn()
+    return turn
+
+
+def current_turn() -> Turn:
+    """The Turn of the running agent task (call from inside process_agent_request)."""
+    return turn_for(asyncio.current_task())  # type: ignore
+
+
+async def cancel_turn(task: asyncio.Task) -> bool:
+    """Cancels an agent task and waits for its teardown. Returns False if it missed the deadline."""
+    turn = turn_for(task)
+    turn.cancelled_at = time.perf_counter()
+    task.cancel()
+    done, _ = await asyncio.wait({task}, timeout=CANCEL_DEADLINE_S)
+    elapsed = time.perf_counter() - turn.cancelled_at
+    metrics.record_teardown(elapsed, timed_out=not done)
+    turn.finish("cancelled")
+    if not done:
+        logger.warning(f"Agent run still tearing down after {CANCEL_DEADLINE_S:.1f}s; continuing without it.")
+    return bool(done)
+
+
+@asynccontextmanager
+async def upstream(stream):
+    """Iterates a framework/provider async stream and always closes it on exit, including on cancel."""
+    try:
+        yield stream
+    finally:
+        aclose = getattr(stream, "aclose", None)
+        if aclose is not None:
+            try: await aclose()
+            except Exception as e: logger.debug(f"Upstream close error: {e!r}")
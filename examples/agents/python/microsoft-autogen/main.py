@@ -1,21 +1,22 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 
-from my_agent.agent import agent_manager
+from my_agent.agent import agent_manager, finny_workflow
 from autogen_agentchat.messages import (
     MultiModalMessage, 
     TextMessage, 
     ModelClientStreamingChunkEvent
 )
 from autogen_agentchat.base import TaskResult
-from autogen_core import Image as AGImage
+from autogen_core import Image as AGImage, CancellationToken
 from PIL import Image
 
 import os
 import json
 import asyncio
+from contextlib import asynccontextmanager
 import uuid
 import logging
 import base64
@@ -23,7 +24,21 @@ from io import BytesIO
 from datetime import datetime, timezone
 from typing import Optional
 
-from utils import generate_jwt, validate_jwt, save_feedback, send_email, extract_text_from_attachment
+from utils import generate_jwt, validate_jwt, save_feedback, send_email, extract_text_from_attachment, require_admin
+from feedback import feedback_sink
+from transcripts import transcript_log
+from compression import WebSocketProtocol, deflate_stats
+from mux import serve_mux, mux_stats
+from drain import drain, handoff
+from heartbeat import reaper
+from widgets import bind_answers, widget_stats
+from memory import accountant
+from search import transcript_index
+from mail import mail_queue
+from cancellation import cancel_turn, current_turn, upstream
+from metrics import metrics
+from vad import VoiceActivity
+from stt import build_transcriber
 from zijus_tools import set_websocket_sender
 
 logging.basicConfig(level=logging.WARNING)
@@ -32,7 +47,20 @@ logger = logging.getLogger(__name__)
 from dotenv import load_dotenv
 load_dotenv()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await mail_queue.start()  # Also picks up email left in the spool by the last run
+    await transcript_index.start()
+    drain.install()  # SIGTERM drains the sessions before the server shuts down
+    yield
+    await feedback_sink.close()
+    await transcript_log.close()
+    await transcript_index.close()
+    await mail_queue.close()
+    await reaper.close()
+    await drain.close()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
 templates = Jinja2Templates(directory="templates")
@@ -41,6 +69,9 @@ APP_NAME = os.getenv("APP_NAME", "ZijusAutoGenApp")
 ZIJUS_JAVASCRIPT = "https://cdn.jsdelivr.net/gh/zijus/zijus-chat-ui@main/dist/zijus-webclient-v0.1.0.js"
 ZIJUS_CONFIG_ENCODED = os.getenv("ZIJUS_CONFIG_ENCODED", "")
 
+# Memory accounting (memory.py): each agent's model context, not the model client and tools all agents share
+accountant.register("agent", lambda: {session_id: agent.model_context for session_id, agent in agent_manager.agents.items()})
+
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
     return templates.TemplateResponse(
@@ -49,24 +80,68 @@ async def read_root(request: Request):
         context={"agent_name": APP_NAME, "zijus_config": ZIJUS_CONFIG_ENCODED, "zijus_javascript": ZIJUS_JAVASCRIPT}
     )
 
+@app.get("/admin/metrics", dependencies=[Depends(require_admin)])
+async def admin_metrics():
+    return {**metrics.as_dict(), "mail": mail_queue.summary(), "transcripts": transcript_log.stats, "search": transcript_index.stats, "deflate": deflate_stats, "mux": mux_stats, "drain": drain.stats, "heartbeat": reaper.stats, "widgets": widget_stats}
+
+@app.get("/admin/memory", dependencies=[Depends(require_admin)])
+async def admin_memory(top: int = 20, refresh: bool = False):
+    """Estimated memory retained per session and component (memory.py): totals and the `top` sessions."""
+    return await accountant.report(top, refresh)
+
+@app.post("/admin/drain", dependencies=[Depends(require_admin)])
+async def admin_drain():
+    """Graceful shutdown (drain.py) without stopping the process: no new sessions, running turns finish."""
+    drain.start("admin")
+    return drain.stats
+
+@app.get("/healthz")
+async def healthz():
+    if drain.draining: raise HTTPException(status_code=503, detail="draining")
+    return {"status": "ok"}
+
+@app.get("/admin/search", dependencies=[Depends(require_admin)])
+async def admin_search(q: str = "", user: str = "", kind: str = "", session: str = "", since: Optional[int] = None,
+                       until: Optional[int] = None, before: Optional[int] = None, limit: int = 50):
+    """Transcript search (search.py): newest first, pass next_before back as `before` for the next page."""
+    try:
+        return await transcript_index.search(q, user, kind, session, since, until, before, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
+    if drain.draining: return await drain.turn_away(websocket)  # Before any JWT or agent work
     token = websocket.query_params.get("token", "")
     session_id = websocket.query_params.get("session_id", "")
 
     payload = await validate_jwt(token) if token else None
     user_id = payload.get("user_id", "anon") if payload else "anon"
+    user_email = payload.get("email") if payload else None  # Where send_email may mail to; never taken from the client
     session_id = session_id or (payload.get("session_id") if payload else f"sess-{uuid.uuid4()}")
     
     new_token = await generate_jwt(session_id) if not payload else token
 
     await websocket.accept()
+    # A draining worker may have handed this session over (drain.py)
+    state = await handoff.take(session_id)
+    if state:
+        try: await agent_manager.import_session(session_id, state)
+        except Exception as e: logger.error(f"Could not restore handed-off session {session_id}: {e}")
+
+    # QA transcript (transcripts.py): everything sent on this socket, and client messages as they arrive
+    transcript = transcript_log.session(session_id, user_id)
+    websocket.send_json = transcript.tap(websocket.send_json)  # type: ignore
     await websocket.send_json({"type": "session", "token": new_token})
 
-    # 1. Inject Zijus Tools WebSockets Sender
+    # 1. Inject Zijus Tools WebSockets Sender (the workflow watches which widget is on screen)
+    flow = finny_workflow.session()
     async def sender(msg: dict):
+        flow.observe(msg)
         await websocket.send_json(msg)
     set_websocket_sender(sender)
+    # Interactive widget tools (widgets.py): a widget tool waiting for the user gets the WidgetEvent as its result
+    answers = bind_answers(websocket.send_json)
 
     # 2. State tracking for Barge-in Interruption
     current_ai_task: Optional[asyncio.Task] = None
@@ -75,7 +150,7 @@ async def websocket_endpoint(websocket: WebSocket):
         nonlocal current_ai_task
         if current_ai_task and not current_ai_task.done():
             logger.info(f"Interrupting AI generation: {reason}")
-            current_ai_task.cancel()
+            teardown = asyncio.create_task(cancel_turn(current_ai_task))
             try:
                 await websocket.send_json({
                     "source": "assistant",
@@ -83,40 +158,75 @@ async def websocket_endpoint(websocket: WebSocket):
                     "ts": datetime.now(timezone.utc).isoformat()
                 })
             except Exception: pass
+            # Wait (bounded) until the old run has closed its model stream before starting a new one
+            await teardown
+
+    # Barge-in only on sustained speech (see vad.py), not on every audio frame
+    async def on_user_speech() -> bool:
+        if current_ai_task and not current_ai_task.done():
+            await cancel_running_task(reason="User started speaking")
+            return True
+        return False
+    # Voice input (stt.py): a final transcript starts a turn just like a typed message
+    async def on_transcript(text: str, m_id: str):
+        nonlocal current_ai_task
+        voice.user_followed_up()
+        await cancel_running_task(reason="User finished speaking")
+        if await flow.try_handle(text, websocket.send_json): return
+        current_ai_task = asyncio.create_task(process_agent_request(TextMessage(content=flow.agent_context(text), source="user"), m_id))
+    voice = VoiceActivity(on_user_speech, build_transcriber(websocket.send_json, on_transcript))
 
     # 3. Background AutoGen Execution Task
     async def process_agent_request(request_message, m_id: str):
         response_m_id = str(uuid.uuid4())
+        turn = current_turn()
+        # AutoGen's own cancellation signal, passed down to the model client and tool calls
+        cancellation_token = CancellationToken()
         try:
             # Fetch the isolated AutoGen agent for this specific session
             agent = agent_manager.get_agent(session_id)
             
-            async for message in agent.run_stream(task=request_message):
-                if isinstance(message, TaskResult):
-                    continue
+            async with upstream(agent.run_stream(task=request_message, cancellation_token=cancellation_token)) as stream:
+                async for message in stream:
+                    if isinstance(message, TaskResult):
+                        continue
                 
-                # Render streaming text chunks directly to the UI
-                if isinstance(message, ModelClientStreamingChunkEvent):
-                    if message.content:
-                        await websocket.send_json({
-                            "source": "assistant",
-                            "content": message.content,
-                            "m_id": response_m_id,
-                            "type": "TextMessage", 
-                            "ts": datetime.now(timezone.utc).isoformat()
-                        })
+                    # Render streaming text chunks directly to the UI
+                    if isinstance(message, ModelClientStreamingChunkEvent):
+                        if message.content and turn.forward(message.content):
+                            await websocket.send_json({
+                                "source": "assistant",
+                                "content": message.content,
+                                "m_id": answers.reply_id(response_m_id),
+                                "type": "TextMessage", 
+                                "ts": datetime.now(timezone.utc).isoformat()
+                            })
 
             await websocket.send_json({
                 "source": "assistant", "type": "FinalMessage", 
-                "m_id": response_m_id, "ts": datetime.now(timezone.utc).isoformat()
+                "m_id": answers.reply_id(response_m_id, final=True), "ts": datetime.now(timezone.utc).isoformat()
             })
+            turn.finish("completed")
 
         except asyncio.CancelledError:
             logger.info("AutoGen run cancelled by user interruption.")
+            cancellation_token.cancel()
+            # A cancel between the model's tool call and its result would break the next request
+            try: await agent_manager.close_dangling_tool_calls(session_id)
+            except Exception as e: logger.error(f"AutoGen context repair failed: {e}")
         except Exception as e:
+            turn.finish("failed")
             logger.error(f"AutoGen execution error: {e}")
             await websocket.send_json({"source": "assistant", "type": "error", "content": "Error processing request."})
 
+    # Graceful shutdown (drain.py): the running turn finishes, the history is handed off, then the client reconnects
+    draining = drain.track(websocket, session_id, busy=lambda: bool(current_ai_task and not current_ai_task.done()),
+                           cancel=cancel_running_task, export=lambda: agent_manager.export_session(session_id))
+    # Heartbeat (heartbeat.py): pings the client, closes the session once it stops answering or sits idle
+    liveness = reaper.track(websocket, busy=lambda: bool(current_ai_task and not current_ai_task.done()))
+    # Memory accounting (memory.py): connection-scoped state, counted under this session
+    accounted = accountant.attach(session_id, voice=voice)
+
     # 4. Main Event Loop
     try:
         while True:
@@ -125,31 +235,42 @@ async def websocket_endpoint(websocket: WebSocket):
             except json.JSONDecodeError: continue
 
             msg_type = data_json.get('type')
+            if liveness.inbound(msg_type): continue  # A pong
+            transcript.inbound(data_json)
             m_id = data_json.get('m_id', str(uuid.uuid4()))
 
             if msg_type in ['session', None]: continue
-            if msg_type == 'feedback': await save_feedback(); continue
-            if msg_type == 'send_email': await send_email(); continue
+            if msg_type == 'feedback': await save_feedback(data_json, session_id); continue
+            if msg_type == 'send_email': await send_email(data_json, session_id, user_email); continue
 
             # Handle Audio Barge-in
             if msg_type == 'AudioMessage':
-                await cancel_running_task(reason="User started speaking")
+                if data_json.get('partial_audio', True):
+                    voice.feed(data_json.get('data', ''), data_json.get('mimeType', 'audio/pcm;rate=16000'))
+                else:
+                    await cancel_running_task(reason="User sent a voice message")
                 continue
 
             # Handle UI Widget Events (Form Submissions, Button Clicks)
             if msg_type == "WidgetEvent":
-                await cancel_running_task(reason="User interacted with a widget")
+                voice.user_followed_up()
                 payload = data_json.get("widgetEvent", {}).get("payload", {})
+                if answers.resolve(payload): continue  # A widget tool was waiting for this: its run carries on
+                await cancel_running_task(reason="User interacted with a widget")
+                if await flow.try_handle(payload, websocket.send_json): continue
                 text_content = "\n".join(f"{k}: {v}" for k, v in payload.items()).strip()
                 if text_content:
-                    request_message = TextMessage(content=f"[User Submitted Widget]:\n{text_content}", source="user")
+                    request_message = TextMessage(content=flow.agent_context(f"[User Submitted Widget]:\n{text_content}"), source="user")
                     current_ai_task = asyncio.create_task(process_agent_request(request_message, m_id))
                 continue
 
             # Handle Text & Multimodal Attachments
             if msg_type == 'TextMessage':
+                voice.user_followed_up()
                 await cancel_running_task(reason="User typed a message")
                 content_text = data_json.get('content', '')
+                if 'attachment' not in data_json and await flow.try_handle(content_text, websocket.send_json): continue
+                content_text = flow.agent_context(content_text) if content_text else content_text
                 request_message = None
 
                 if 'attachment' in data_json:
@@ -174,4 +295,24 @@ async def websocket_endpoint(websocket: WebSocket):
                     current_ai_task = asyncio.create_task(process_agent_request(request_message, m_id))
 
     except WebSocketDisconnect:
-        logger.info(f"Client disconnected: {session_id}")
\ No newline at end of file
+        logger.info(f"Client disconnected: {session_id}")
+    finally:
+        # Nobody is listening any more, so don't let the model keep generating
+        drain.untrack(draining)
+        reaper.untrack(liveness)
+        accountant.detach(accounted)
+        await voice.close()
+        if current_ai_task and not current_ai_task.done():
+            await cancel_turn(current_ai_task)
+        if liveness.reaped:  # Dead or idle: move the session's state out of memory until it comes back
+            await reaper.hibernate(session_id, export=lambda: agent_manager.export_session(session_id), release=lambda: agent_manager.release_session(session_id))
+        transcript.close()
+
+@app.websocket("/ws/mux")
+async def websocket_mux(websocket: WebSocket):
+    # Several sessions on one socket (mux.py): every channel runs websocket_endpoint like its own /ws connection
+    await serve_mux(websocket, websocket_endpoint)
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=8000, ws=WebSocketProtocol)  # Deflate policy (compression.py)
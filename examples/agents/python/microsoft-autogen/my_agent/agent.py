@@ -1,10 +1,15 @@
 import os
+import json
+from typing import Optional
 from autogen_agentchat.agents import AssistantAgent
 from autogen_ext.models.openai import OpenAIChatCompletionClient
+from autogen_core.models import AssistantMessage, FunctionExecutionResult, FunctionExecutionResultMessage
 from dotenv import load_dotenv
 
 # Import framework-agnostic UI tools
 from zijus_tools import SendSlots, SendSlider
+from workflow import Step, Workflow
+from widgets import widget_result
 
 load_dotenv()
 
@@ -46,14 +51,38 @@ STEP 4: Booking the Appointment
 async def send_slots_tool(slots: list[str]) -> str:
     """Renders clickable choice buttons (slots) in the chat UI."""
     await SendSlots(slots=slots)
-    return "UI rendered successfully. Stop generating and wait for the user."
+    return await widget_result()  # The answer itself with ZIJUS_INTERACTIVE_TOOLS (widgets.py)
 
 async def send_slider_tool(content: str, min_value: int, max_value: int, default_value: int) -> str:
     """Renders an interactive range slider in the chat UI."""
     await SendSlider(content=content, min_value=min_value, max_value=max_value, default_value=default_value)
-    return "UI rendered successfully. Stop generating and wait for the user."
+    return await widget_result()
 # ------------------------
 
+# --- DETERMINISTIC FAST PATH (opt-in: ZIJUS_WORKFLOW_FASTPATH=true) ---
+# Steps 2-4 above are fixed transitions, so the gateway can answer widget clicks without an LLM round-trip.
+TERM_SLOTS = ["12 Months", "24 Months", "36 Months"]
+OFFICER_SLOTS = ["Yes", "No"]
+APPOINTMENT_SLOTS = ["Tomorrow 10:00 AM", "Tomorrow 2:00 PM", "Next Monday 11:00 AM"]
+ESTIMATE_APR = 0.079
+
+def _estimate(values: dict) -> str:
+    amount, months = values["amount"], int(values["term"].split()[0])
+    rate = ESTIMATE_APR / 12
+    payment = amount * rate / (1 - (1 + rate) ** -months)
+    return (f"Here is your estimate:\n\n| Amount | Term | APR | Monthly payment |\n|---|---|---|---|\n"
+            f"| ${amount:,.0f} | {months} months | {ESTIMATE_APR:.1%} | **${payment:,.2f}** |\n\n"
+            "Would you like to speak to a loan officer?")
+
+finny_workflow = Workflow([
+    Step("amount", answers="slider", reply="Great, a ${amount:,.0f} loan. How long would you like to take to pay it back?", slots=TERM_SLOTS),
+    Step("term", answers=TERM_SLOTS, reply=_estimate, slots=OFFICER_SLOTS),
+    Step("officer", answers=OFFICER_SLOTS, accepts=["Yes"], reply="Pick a time that suits you.", slots=APPOINTMENT_SLOTS),
+    Step("officer", answers=OFFICER_SLOTS, accepts=["No"], reply="No problem. Thanks for chatting with Zijus Bank, have a great day!"),
+    Step("appointment", answers=APPOINTMENT_SLOTS, reply="You're booked for {appointment}. A loan officer will call you then."),
+])
+# ----------------------------------------------------------------------
+
 
 class AgentManager:
     """Manages isolated AutoGen AssistantAgents per WebSocket session."""
@@ -75,5 +104,34 @@ class AgentManager:
             )
         return self.agents[session_id]
 
+    async def export_session(self, session_id: str) -> Optional[bytes]:
+        """The agent's state (model context) as JSON, for the worker that takes the session over (see drain.py)."""
+        agent = self.agents.get(session_id)
+        return json.dumps(await agent.save_state()).encode() if agent else None
+
+    async def import_session(self, session_id: str, state: bytes):
+        await self.get_agent(session_id).load_state(json.loads(state))
+
+    async def release_session(self, session_id: str):
+        self.agents.pop(session_id, None)
+
+    async def close_dangling_tool_calls(self, session_id: str) -> int:
+        """
+        Answers tool calls left open by a cancelled run, so the next request doesn't send the model
+        an assistant tool call without its result. Returns the number of calls closed.
+        """
+        agent = self.agents.get(session_id)
+        if agent is None:
+            return 0
+        messages = await agent.model_context.get_messages()
+        if not messages or not isinstance(messages[-1], AssistantMessage) or not isinstance(messages[-1].content, list):
+            return 0
+        calls = messages[-1].content
+        await agent.model_context.add_message(FunctionExecutionResultMessage(content=[
+            FunctionExecutionResult(content="Cancelled by the user.", call_id=call.id, name=call.name, is_error=True)
+            for call in calls
+        ]))
+        return len(calls)
+
 # Export a global instance
 agent_manager = AgentManager()
\ No newline at end of file
@@ -0,0 +1,107 @@
+"""
+Interactive widget tools (opt-in: ZIJUS_INTERACTIVE_TOOLS=true).
+
+By default send_slots_tool / send_slider_tool render the widget and return "wait for the user", so the run
+ends. The user's WidgetEvent then starts a new turn, which is one more full model call that re-reads the
+whole history. In interactive mode the tool instead waits for the answer. The /ws handler resolves it
+with the matching WidgetEvent, and the answer becomes the tool result, so the same run carries on.
+
+  - Each connection has one WidgetAnswers, bound with bind_answers() and found by the tools through a ContextVar
+    (agent runs are tasks started by the handler, so they inherit it).
+  - A WidgetEvent answers the oldest widget still waiting. With no widget waiting it is handled as
+    before (fast path or a new turn).
+  - After ZIJUS_WIDGET_TIMEOUT_S without an answer the tool returns the usual "wait for the user" and
+    the run ends. A later answer then starts a new turn, as in the default mode.
+  - A new message or a barge-in cancels the waiting run like any other.
+
+Text the model streams after an answer is sent under a new m_id (reply_id()), so it appears below the
+widget instead of being appended to the message above it.
+"""
+import os
+import asyncio
+import logging
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE_TOOLS = os.getenv("ZIJUS_INTERACTIVE_TOOLS", "false").lower() == "true"
+WIDGET_TIMEOUT_S = float(os.getenv("ZIJUS_WIDGET_TIMEOUT_S", "120"))
+RENDERED = "UI rendered successfully. Stop generating and wait for the user."
+
+widget_stats = {"waits": 0, "answered": 0, "timed_out": 0, "cancelled": 0}
+
+
+def answer_text(payload: dict) -> str:
+    return "\n".join(f"{k}: {v}" for k, v in payload.items()).strip()
+
+
+class WidgetAnswers:
+    """Per-connection: widget tools waiting for the user, and the m_id of the reply being streamed."""
+    def __init__(self, send: Callable[[dict], Awaitable[None]]):
+        self.send = send
+        self.waiting: deque = deque()
+        self.answered = 0
+        self.reply: Optional[str] = None
+
+    def reply_id(self, m_id: str, final: bool = False) -> str:
+        """The m_id to send the run's output under. Each answered widget starts a new message."""
+        reply = f"{m_id}-{self.answered}" if self.answered else m_id
+        self.reply = None if final else reply
+        return reply
+
+    def resolve(self, payload: dict) -> bool:
+        """Hands a WidgetEvent to the oldest waiting tool. False if no tool was waiting for one."""
+        if not answer_text(payload): return False
+        while self.waiting:
+            future = self.waiting.popleft()
+            if not future.done():
+                future.set_result(payload)
+                self.answered += 1
+                widget_stats["answered"] += 1
+                return True
+        return False
+
+    async def wait(self) -> Optional[dict]:
+        """The user's answer to the widget just rendered, or None after WIDGET_TIMEOUT_S."""
+        if self.reply:  # Close the text streamed before the widget
+            try: await self.send({"source": "assistant", "type": "FinalMessage", "m_id": self.reply, "ts": datetime.now(timezone.utc).isoformat()})
+            except Exception: pass
+            self.reply = None
+        future = asyncio.get_running_loop().create_future()
+        self.waiting.append(future)
+        widget_stats["waits"] += 1
+        try:
+            return await asyncio.wait_for(future, WIDGET_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            widget_stats["timed_out"] += 1
+            return None
+        except asyncio.CancelledError:
+            widget_stats["cancelled"] += 1
+            raise
+        finally:
+            try: self.waiting.remove(future)
+            except ValueError: pass
+
+
+_answers: ContextVar[Optional[WidgetAnswers]] = ContextVar("widget_answers", default=None)
+
+
+def bind_answers(send: Callable[[dict], Awaitable[None]]) -> WidgetAnswers:
+    """Call in the /ws handler before starting agent runs; the runs' widget tools then wait on this connection."""
+    answers = WidgetAnswers(send)
+    _answers.set(answers)
+    return answers
+
+
+async def widget_result() -> str:
+    """What a widget tool returns once the widget is on screen: the user's answer in interactive mode."""
+    answers = _answers.get()
+    if not INTERACTIVE_TOOLS or answers is None:
+        return RENDERED
+    payload = await answers.wait()
+    if payload is None:
+        return RENDERED  # No answer in time: end the run, the answer will start a new turn
+    return f"The user answered:\n{answer_text(payload)}"
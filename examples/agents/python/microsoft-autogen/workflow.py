@@ -0,0 +1,136 @@
+"""
+Optional deterministic fast path for scripted widget flows.
+
+A Workflow is a list of Steps declared next to the agent (see my_agent/agent.py). When the user answers
+a widget that is on screen and a Step matches the answer, the gateway sends the reply and the next widget
+itself, with no LLM round-trip. Free text, attachments and anything off-script go to the agent as before.
+
+Enable with ZIJUS_WORKFLOW_FASTPATH=true.
+"""
+import os
+import re
+import uuid
+import logging
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Optional, Union
+
+from zijus_tools import SendSlots, SendSlider
+
+logger = logging.getLogger(__name__)
+
+WORKFLOW_FASTPATH = os.getenv("ZIJUS_WORKFLOW_FASTPATH", "false").lower() in ("1", "true", "yes")
+
+NUMBER_RE = re.compile(r"\$?\s*(\d[\d,]*(?:\.\d+)?)")
+
+
+class Step:
+    """
+    One scripted transition.
+
+    answers: "slider", or the slot values of the widget this step answers (order/case ignored)
+    accepts: slot values that take this branch (e.g. ["Yes"]); None accepts any answer
+    reply:   text formatted with the answers collected so far, or a callable(values) -> text
+    slots / slider: the next widget to render (slider is SendSlider kwargs)
+    """
+    def __init__(self, name: str, answers: Union[str, list[str]], reply: Union[str, Callable[[dict], str]],
+                 accepts: Optional[list[str]] = None, slots: Optional[list[str]] = None, slider: Optional[dict] = None):
+        self.name = name
+        self.answers = answers if answers == "slider" else {a.lower() for a in answers}
+        self.accepts = {a.lower() for a in accepts} if accepts else None
+        self.reply = reply
+        self.slots = slots
+        self.slider = slider
+
+    def render(self, values: dict) -> str:
+        return self.reply(values) if callable(self.reply) else self.reply.format(**values)
+
+
+class Workflow:
+    """The declared steps; create one WorkflowSession per WebSocket connection."""
+    def __init__(self, steps: list[Step], enabled: bool = WORKFLOW_FASTPATH):
+        self.steps = steps
+        self.enabled = enabled
+
+    def session(self) -> "WorkflowSession":
+        return WorkflowSession(self)
+
+
+class WorkflowSession:
+    """Per-connection state: the widget currently on screen and the answers collected so far."""
+    def __init__(self, workflow: Workflow):
+        self.workflow = workflow
+        self.offered: Optional[tuple[str, Union[dict, list]]] = None
+        self.values: dict = {}
+        self.unseen: list[str] = []  # Fast-path exchanges the agent's own memory does not contain
+
+    def observe(self, msg: dict):
+        """Called with every message the Zijus tools send, so we know which widget the user is looking at."""
+        if msg.get("type") == "SliderMessage":
+            self.offered = ("slider", msg.get("slider", {}))
+        elif msg.get("type") == "SlotMessage":
+            self.offered = ("slots", [str(s.get("value", "")) for s in msg.get("slots", [])])
+
+    def _parse(self, answer: Union[str, dict]) -> Optional[Union[str, float]]:
+        """Turns a TextMessage/WidgetEvent answer into a value for the widget on screen, or None if it does not fit."""
+        if isinstance(answer, dict):
+            # Multi-field forms are left to the agent
+            if len(answer) != 1: return None
+            answer = next(iter(answer.values()))
+        text = str(answer).strip()
+
+        kind, widget = self.offered
+        if kind == "slider":
+            match = NUMBER_RE.fullmatch(text)
+            if not match: return None
+            value = float(match.group(1).replace(",", ""))
+            value = int(value) if value.is_integer() else value
+            return value if widget.get("min_value", value) <= value <= widget.get("max_value", value) else None
+        return next((slot for slot in widget if slot.lower() == text.lower()), None)
+
+    def _match(self, value) -> Optional[Step]:
+        kind, widget = self.offered
+        for step in self.workflow.steps:
+            if kind == "slider" and step.answers != "slider": continue
+            if kind == "slots" and (step.answers == "slider" or step.answers != {w.lower() for w in widget}): continue
+            if step.accepts is not None and str(value).lower() not in step.accepts: continue
+            return step
+        return None
+
+    async def try_handle(self, answer: Union[str, dict], send: Callable[[dict], Awaitable[None]]) -> bool:
+        """Answers a known step without the LLM. Returns False when the agent should handle the message."""
+        if not self.workflow.enabled or self.offered is None:
+            return False
+        value = self._parse(answer)
+        step = self._match(value) if value is not None else None
+        if step is None:
+            return False
+        try:
+            text = step.render({**self.values, step.name: value})
+        except (KeyError, ValueError, TypeError) as e:
+            # e.g. the agent skipped an earlier step, so we lack a value the reply needs
+            logger.info(f"Workflow step '{step.name}' deferred to the agent: {e!r}")
+            return False
+
+        self.values[step.name] = value
+        self.offered = None
+        response_m_id = str(uuid.uuid4())
+        if text:
+            await send({"source": "assistant", "content": text, "m_id": response_m_id, "type": "TextMessage", "ts": datetime.now(timezone.utc).isoformat()})
+        # The text is already on screen, so the widget needs no display delay
+        if step.slots:
+            await SendSlots(slots=step.slots, delay=0)
+        elif step.slider:
+            await SendSlider(**step.slider, delay=0)
+        await send({"source": "assistant", "type": "FinalMessage", "m_id": response_m_id, "ts": datetime.now(timezone.utc).isoformat()})
+
+        shown = f" Then showed slots {step.slots}." if step.slots else (" Then showed a slider." if step.slider else "")
+        self.unseen.append(f"User chose '{value}'. Assistant replied: {text!r}.{shown}")
+        return True
+
+    def agent_context(self, text: str) -> str:
+        """Prefixes the exchanges the fast path handled, so the agent's next answer stays consistent with the chat."""
+        if not self.unseen:
+            return text
+        note = "[Steps already completed by the workflow (shown to the user)]:\n" + "\n".join(f"- {u}" for u in self.unseen)
+        self.unseen = []
+        return f"{note}\n\n{text}"
@@ -0,0 +1,200 @@
+"""
+Voice pipeline CPU benchmark.
+
+--stage normalize (default): streams synthetic microphone audio through an example's audio.py in realistic
+chunk sizes and reports the real-time factor (CPU seconds per second of audio, on one core) and how many
+concurrent voice streams one core can sustain.
+
+--stage aggregate: replays the upstream path for tiny client chunks (json.loads, base64 decode, then either
+normalize + queue send per chunk, or audio.py's FrameAggregator at each --frame-ms), including the upstream
+message encoding each queue send costs, and reports CPU per second of audio and Live queue operations per second.
+
+--stage opus: encodes synthetic 24 kHz bot speech with the example's codec.py at each --bitrates value and
+reports CPU per stream plus egress bytes/s against raw PCM (both before and after base64). Needs opuslib.
+
+Use it to size voice workers and decide whether Opus pays off for a deployment.
+"""
+import os
+import sys
+import json
+import time
+import base64
+import asyncio
+import argparse
+import platform
+import importlib.util
+from datetime import datetime, timezone
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_APP_DIR = os.path.normpath(os.path.join(HERE, "..", "..", "..", "agents", "python", "google-adk", "bidi-streaming"))
+
+# name: (mime type the client would send, sample rate, channels, sample dtype)
+FORMATS = {
+    "48k-stereo-f32": ("audio/pcm;rate=48000;channels=2;format=f32le", 48000, 2, "<f4"),
+    "48k-mono-f32": ("audio/pcm;rate=48000;channels=1;format=f32le", 48000, 1, "<f4"),
+    "44k1-mono-s16": ("audio/pcm;rate=44100", 44100, 1, "<i2"),
+    "16k-mono-s16": ("audio/pcm;rate=16000", 16000, 1, "<i2"),
+}
+
+
+def load_module(app_dir: str, filename: str):
+    spec = importlib.util.spec_from_file_location(f"bench_{filename[:-3]}_module", os.path.join(app_dir, filename))
+    module = importlib.util.module_from_spec(spec)  # type: ignore
+    spec.loader.exec_module(module)  # type: ignore
+    return module
+
+
+def synth_speech(seconds: float, rate: int, channels: int, dtype: str, seed: int = 0) -> bytes:
+    """Voiced harmonics with a syllable-rate envelope plus a noise floor; close enough to speech for CPU timing."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * rate)) / rate
+    voiced = sum(np.sin(2 * np.pi * f * t) / (i + 1) for i, f in enumerate((140, 280, 420, 840, 1700)))
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t)
+    signal = 0.3 * voiced * envelope / 2.3 + 0.01 * rng.standard_normal(t.size)
+    frames = np.repeat(signal[:, None], channels, axis=1).ravel()
+    if dtype == "<i2":
+        return (np.clip(frames, -1, 1) * 32767).astype("<i2").tobytes()
+    return frames.astype("<f4").tobytes()
+
+
+def bench_format(audio, name: str, seconds: float, chunk_ms: int) -> dict:
+    mime, rate, channels, dtype = FORMATS[name]
+    data = synth_speech(seconds, rate, channels, dtype)
+    chunk_bytes = int(rate * chunk_ms / 1000) * channels * np.dtype(dtype).itemsize
+    chunks = [data[i:i + chunk_bytes] for i in range(0, len(data), chunk_bytes)]
+
+    normalizer = audio.AudioNormalizer()
+    normalizer.normalize(chunks[0], mime)  # Warm-up: sizes the scratch buffers
+
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    produced = 0
+    for chunk in chunks:
+        produced += len(normalizer.normalize(chunk, mime) or b"")
+    cpu_s, wall_s = time.process_time() - cpu_start, time.perf_counter() - wall_start
+
+    rtf = cpu_s / seconds
+    return {
+        "format": name, "chunk_ms": chunk_ms, "audio_s": seconds,
+        "cpu_ms": round(cpu_s * 1000, 2), "wall_ms": round(wall_s * 1000, 2),
+        "rtf": rtf, "streams_per_core": round(1 / rtf) if rtf > 0 else None,
+        "us_per_chunk": round(cpu_s / len(chunks) * 1e6, 2),
+        "output_s": produced / 2 / audio.TARGET_RATE,
+    }
+
+
+def bench_aggregate(audio, name: str, seconds: float, chunk_ms: int, frame_ms: int) -> dict:
+    """frame_ms 0 = no aggregation (one normalize + send per client chunk, the old behaviour)."""
+    mime, rate, channels, dtype = FORMATS[name]
+    data = synth_speech(seconds, rate, channels, dtype)
+    chunk_bytes = max(1, int(rate * chunk_ms / 1000)) * channels * np.dtype(dtype).itemsize
+    messages = [json.dumps({"type": "AudioMessage", "mimeType": mime, "partial_audio": True, "data": base64.b64encode(data[i:i + chunk_bytes]).decode()})
+                for i in range(0, len(data), chunk_bytes)]
+    queue = []  # Stands in for LiveRequestQueue: every send becomes one base64 JSON realtimeInput message upstream
+    def send(pcm: bytes, mime_type: str):
+        queue.append((json.dumps({"realtimeInput": {"audio": {"mimeType": mime_type, "data": base64.b64encode(pcm).decode()}}}), pcm))
+
+    async def run() -> float:
+        normalizer = audio.AudioNormalizer()
+        aggregator = audio.FrameAggregator(send, normalizer, frame_ms) if frame_ms else None
+        cpu_start = time.process_time()
+        for raw in messages:
+            msg = json.loads(raw)
+            chunk = base64.b64decode(msg["data"])
+            if aggregator:
+                aggregator.push(chunk, msg["mimeType"])
+            else:
+                pcm = normalizer.normalize(chunk, msg["mimeType"])
+                if pcm: send(pcm, audio.TARGET_MIME)
+        if aggregator: aggregator.flush()
+        return time.process_time() - cpu_start
+
+    cpu_s = asyncio.run(run())
+    return {
+        "format": name, "chunk_ms": chunk_ms, "frame_ms": frame_ms, "audio_s": seconds, "chunks": len(messages),
+        "cpu_ms_per_audio_s": round(cpu_s * 1000 / seconds, 3), "queue_ops_per_s": round(len(queue) / seconds, 1),
+        "output_s": sum(len(pcm) for _, pcm in queue) / 2 / audio.TARGET_RATE,
+    }
+
+
+def bench_opus(codec, bitrate: int, seconds: float, chunk_ms: int, rate: int = 24000) -> dict:
+    data = synth_speech(seconds, rate, 1, "<i2")
+    chunk_bytes = int(rate * chunk_ms / 1000) * 2
+    chunks = [data[i:i + chunk_bytes] for i in range(0, len(data), chunk_bytes)]
+
+    codec.OPUS_BITRATE = bitrate  # Read when the stream opens its encoder
+    stream = codec.OpusStream()
+    stream.encode_sync(chunks[0], rate)  # Warm-up: creates the encoder
+
+    cpu_start = time.process_time()
+    encoded = 0
+    for chunk in chunks:
+        encoded += len(stream.encode_sync(chunk, rate)[0])
+    encoded += len(stream.encode_sync(b"", rate, flush=True)[0])
+    cpu_s = time.process_time() - cpu_start
+
+    rtf = cpu_s / seconds
+    pcm_bps, opus_bps = len(data) / seconds, encoded / seconds
+    return {
+        "bitrate": bitrate, "chunk_ms": chunk_ms, "audio_s": seconds, "cpu_ms": round(cpu_s * 1000, 2),
+        "rtf": rtf, "streams_per_core": round(1 / rtf) if rtf > 0 else None,
+        "pcm_bytes_per_s": round(pcm_bps), "pcm_b64_bytes_per_s": round(pcm_bps * 4 / 3),
+        "opus_bytes_per_s": round(opus_bps), "opus_b64_bytes_per_s": round(opus_bps * 4 / 3),
+        "reduction": round(pcm_bps / opus_bps, 1) if opus_bps else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Real-time factor of the server-side voice pipeline.")
+    parser.add_argument("--stage", choices=["normalize", "aggregate", "opus"], default="normalize", help="Mic normalization, mic frame aggregation (audio.py) or bot audio Opus encoding (codec.py)")
+    parser.add_argument("--app-dir", default=DEFAULT_APP_DIR, help="Example directory containing audio.py / codec.py")
+    parser.add_argument("--formats", default=",".join(FORMATS), help=f"Comma-separated subset of: {', '.join(FORMATS)}")
+    parser.add_argument("--seconds", type=float, default=60.0, help="Audio duration per format")
+    parser.add_argument("--chunk-ms", type=int, default=20, help="Chunk size (browsers typically send 20-100 ms)")
+    parser.add_argument("--frame-ms", default="20,40,60", help="Aggregation frame sizes to compare with per-chunk sends (--stage aggregate)")
+    parser.add_argument("--bitrates", default="16000,24000,32000", help="Opus bitrates to compare (--stage opus)")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    if args.stage == "opus":
+        codec = load_module(args.app_dir, "codec.py")
+        if codec.opuslib is None:
+            sys.exit("opuslib (and the libopus system library) is required for --stage opus: pip install opuslib")
+        results = [bench_opus(codec, int(b), args.seconds, args.chunk_ms) for b in args.bitrates.split(",") if b.strip()]
+
+        print(f"\n{'bitrate':>8} {'cpu ms':>9} {'RTF':>10} {'streams/core':>13} {'PCM B/s':>9} {'Opus B/s':>9} {'as JSON':>15} {'saving':>7}")
+        for r in results:
+            json_bps = f"{r['pcm_b64_bytes_per_s']}->{r['opus_b64_bytes_per_s']}"
+            print(f"{r['bitrate']:>8} {r['cpu_ms']:>9.1f} {r['rtf']:>10.6f} {str(r['streams_per_core']):>13} {r['pcm_bytes_per_s']:>9} {r['opus_bytes_per_s']:>9} {json_bps:>15} {str(r['reduction']) + 'x':>7}")
+    elif args.stage == "aggregate":
+        audio = load_module(args.app_dir, "audio.py")
+        frame_sizes = [0] + [int(f) for f in args.frame_ms.split(",") if f.strip()]
+        results = [bench_aggregate(audio, name.strip(), args.seconds, args.chunk_ms, frame_ms)
+                   for name in args.formats.split(",") if name.strip() for frame_ms in frame_sizes]
+
+        print(f"\n{'format':<16} {'chunk':>6} {'frames':>9} {'cpu ms/audio s':>15} {'queue ops/s':>12}")
+        for r in results:
+            frames = f"{r['frame_ms']}ms" if r["frame_ms"] else "per-chunk"
+            print(f"{r['format']:<16} {r['chunk_ms']:>4}ms {frames:>9} {r['cpu_ms_per_audio_s']:>15.2f} {r['queue_ops_per_s']:>12.1f}")
+    else:
+        audio = load_module(args.app_dir, "audio.py")
+        results = [bench_format(audio, name.strip(), args.seconds, args.chunk_ms) for name in args.formats.split(",") if name.strip()]
+
+        print(f"\n{'format':<16} {'chunk':>6} {'cpu ms':>9} {'RTF':>10} {'streams/core':>13} {'us/chunk':>9}")
+        for r in results:
+            print(f"{r['format']:<16} {r['chunk_ms']:>4}ms {r['cpu_ms']:>9.1f} {r['rtf']:>10.6f} {str(r['streams_per_core']):>13} {r['us_per_chunk']:>9.1f}")
+
+    if args.json:
+        report = {
+            "ts": datetime.now(timezone.utc).isoformat(),
+            "host": {"python": sys.version.split()[0], "numpy": np.__version__, "machine": platform.machine(), "cpus": os.cpu_count()},
+            "stage": args.stage, "results": results,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
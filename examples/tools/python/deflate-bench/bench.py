@@ -0,0 +1,195 @@
+"""
+WebSocket compression benchmark: CPU vs. bytes saved, per compression policy and message class.
+
+Replays synthetic gateway traffic frame by frame through the permessage-deflate extension the way a
+connection would (one extension per session, so context takeover behaves as on the wire):
+
+  text   a streamed chat: small TextMessage deltas, FinalMessages, widgets, occasional long messages
+         (a pasted document, a long answer, a transcript export)
+  voice  a bidi voice session: bot AudioMessages (24 kHz PCM in 40 ms chunks), transcription deltas and,
+         upstream, mic AudioMessages (16 kHz PCM in 40 ms chunks) that the browser compresses once
+         deflate is negotiated and the gateway has to inflate
+
+Policies: off, uvicorn's default (every frame, zlib level 6, 32 KB window), every frame at level 1 with
+a 4 KB window, and an example's compression.py (SelectiveDeflate) at each --min-bytes. The bench
+reports server CPU per message (deflate out, inflate in), bytes saved and zlib memory per connection.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import base64
+import random
+import argparse
+import platform
+import importlib.util
+from datetime import datetime, timezone
+
+import numpy as np
+from websockets.extensions.permessage_deflate import PerMessageDeflate
+from websockets.frames import Frame, Opcode
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_APP_DIR = os.path.normpath(os.path.join(HERE, "..", "..", "..", "agents", "python", "langchain"))
+
+WORDS = ("the your loan monthly payment is rate interest term years we can schedule an appointment with officer "
+         "for estimate based on a of to and in that this would be about per month total balance deposit").split()
+
+
+def load_module(app_dir: str, filename: str):
+    sys.path.insert(0, app_dir)
+    spec = importlib.util.spec_from_file_location(f"bench_{filename[:-3]}_module", os.path.join(app_dir, filename))
+    module = importlib.util.module_from_spec(spec)  # type: ignore
+    spec.loader.exec_module(module)  # type: ignore
+    return module
+
+
+def dumps(msg: dict) -> bytes:
+    return json.dumps(msg, separators=(",", ":"), ensure_ascii=False).encode()  # What Starlette's send_json writes
+
+
+def ts() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def synth_speech(seconds: float, rate: int, seed: int) -> bytes:
+    """Voiced harmonics with a syllable-rate envelope plus a noise floor, as 16-bit PCM."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * rate)) / rate
+    voiced = sum(np.sin(2 * np.pi * f * t) / (i + 1) for i, f in enumerate((140, 280, 420, 840, 1700)))
+    signal = 0.3 * voiced * (0.5 + 0.5 * np.sin(2 * np.pi * 4 * t)) / 2.3 + 0.01 * rng.standard_normal(t.size)
+    return (np.clip(signal, -1, 1) * 32767).astype("<i2").tobytes()
+
+
+def text_session(turns: int, seed: int = 0) -> list:
+    """(class, direction, payload) for a streamed text chat."""
+    rng = random.Random(seed)
+    sentence = lambda n: " ".join(rng.choice(WORDS) for _ in range(n))
+    out = [("session", "down", dumps({"type": "session", "token": "eyJhbGciOiJIUzI1NiJ9." + "x" * 120}))]
+    for _ in range(turns):
+        m_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        for _ in range(rng.randint(20, 60)):
+            out.append(("delta", "down", dumps({"source": "assistant", "content": sentence(rng.randint(1, 3)) + " ", "m_id": m_id, "type": "TextMessage", "ts": ts()})))
+        if rng.random() < 0.05:  # A long answer or export in one message
+            out.append(("large", "down", dumps({"source": "assistant", "content": sentence(rng.randint(1500, 5000)), "m_id": m_id, "type": "TextMessage", "ts": ts()})))
+        out.append(("final", "down", dumps({"source": "assistant", "type": "FinalMessage", "m_id": m_id, "ts": ts()})))
+        if rng.random() < 0.2:
+            out.append(("widget", "down", dumps({"source": "assistant", "type": "FormWidget", "m_id": m_id, "ts": ts(), "title": "Book an appointment", "fields": [
+                {"name": f, "label": f.title(), "type": "select", "options": [sentence(2) for _ in range(5)]} for f in ("term", "officer", "contact", "date")]})))
+    return out
+
+
+def voice_session(seconds: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    bot, mic = synth_speech(seconds, 24000, seed), synth_speech(seconds, 16000, seed + 1)
+    bot_chunk, mic_chunk = 24000 * 2 * 40 // 1000, 16000 * 2 * 40 // 1000
+    out = [("session", "down", dumps({"type": "session", "token": "eyJhbGciOiJIUzI1NiJ9." + "x" * 120, "audio_codec": "pcm"}))]
+    m_id = str(uuid.UUID(int=rng.getrandbits(128)))
+    for i in range(seconds * 25):
+        out.append(("mic audio", "up", dumps({"type": "AudioMessage", "mimeType": "audio/pcm;rate=16000", "partial_audio": True, "data": base64.b64encode(mic[i * mic_chunk:(i + 1) * mic_chunk]).decode()})))
+        out.append(("audio", "down", dumps({"source": "assistant", "type": "AudioMessage", "data": base64.b64encode(bot[i * bot_chunk:(i + 1) * bot_chunk]).decode(),
+                                            "mime_type": "audio/pcm;rate=24000", "m_id": m_id, "ts": ts()})))
+        if i % 8 == 0:  # Output transcription, ~3 per second
+            out.append(("delta", "down", dumps({"source": "assistant", "content": " ".join(rng.choice(WORDS) for _ in range(3)) + " ", "m_id": m_id, "type": "TextMessage", "ts": ts()})))
+        if i % 250 == 249:
+            out.append(("final", "down", dumps({"source": "assistant", "type": "FinalMessage", "m_id": m_id, "ts": ts()})))
+            m_id = str(uuid.UUID(int=rng.getrandbits(128)))
+    return out
+
+
+def zlib_memory(window_bits: int, mem_level: int) -> int:
+    """zlib's documented state size: deflate (1 << (windowBits + 2)) + (1 << (memLevel + 9)), inflate 1 << windowBits, ~7 KB each on top."""
+    return (1 << (window_bits + 2)) + (1 << (mem_level + 9)) + (1 << window_bits) + 14 * 1024
+
+
+def run(traffic: list, policy: dict, compression) -> dict:
+    """Server-side cost of one session's traffic under `policy`."""
+    negotiated = policy["negotiate"]
+    if negotiated:
+        settings = {"level": policy["level"], "memLevel": policy["mem_level"]}
+        wbits = policy["window_bits"]
+        server_cls = compression.SelectiveDeflate if policy["selective"] else PerMessageDeflate
+        server = server_cls(False, False, wbits, wbits, settings)
+        browser = PerMessageDeflate(False, False, wbits, wbits)  # Browsers compress everything they send
+    classes: dict = {}
+    for cls, direction, payload in traffic:
+        row = classes.setdefault(cls, {"messages": 0, "bytes": 0, "wire_bytes": 0, "cpu_ns": 0})
+        row["messages"] += 1
+        row["bytes"] += len(payload)
+        if not negotiated:
+            row["wire_bytes"] += len(payload)
+            continue
+        frame = Frame(Opcode.TEXT, payload)
+        if direction == "down":
+            t = time.perf_counter_ns()
+            sent = server.encode(frame)
+            row["cpu_ns"] += time.perf_counter_ns() - t
+        else:
+            sent = browser.encode(frame)  # Client CPU, not timed
+            t = time.perf_counter_ns()
+            server.decode(sent)
+            row["cpu_ns"] += time.perf_counter_ns() - t
+        row["wire_bytes"] += len(sent.data)
+    for row in classes.values():
+        row["us_per_msg"] = round(row["cpu_ns"] / row["messages"] / 1000, 2)
+        row["saved_pct"] = round(100 * (1 - row["wire_bytes"] / row["bytes"]), 1)
+    total = {k: sum(r[k] for r in classes.values()) for k in ("messages", "bytes", "wire_bytes", "cpu_ns")}
+    return {
+        "policy": policy["name"], "messages": total["messages"], "bytes": total["bytes"], "wire_bytes": total["wire_bytes"],
+        "saved_pct": round(100 * (1 - total["wire_bytes"] / total["bytes"]), 1), "cpu_ms": round(total["cpu_ns"] / 1e6, 1),
+        "us_per_kb_saved": round(total["cpu_ns"] / 1000 / max(1, (total["bytes"] - total["wire_bytes"]) / 1024), 2) if negotiated else None,
+        "zlib_kb_per_conn": round(zlib_memory(policy["window_bits"], policy["mem_level"]) / 1024) if negotiated else 0,
+        "classes": classes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU vs. bytes saved by permessage-deflate policies, per message class.")
+    parser.add_argument("--app-dir", default=DEFAULT_APP_DIR, help="Example directory containing compression.py")
+    parser.add_argument("--sessions", default="text,voice", help="Comma-separated subset of: text, voice")
+    parser.add_argument("--turns", type=int, default=300, help="Answers in the text session")
+    parser.add_argument("--seconds", type=int, default=120, help="Length of the voice session")
+    parser.add_argument("--min-bytes", default="0,96,256,1024", help="ZIJUS_WS_DEFLATE_MIN_BYTES values to compare for the selective policy")
+    parser.add_argument("--level", type=int, default=1, help="zlib level for the tuned policies (ZIJUS_WS_DEFLATE_LEVEL)")
+    parser.add_argument("--window-bits", type=int, default=12, help="Window for the tuned policies (ZIJUS_WS_DEFLATE_WINDOW_BITS)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per policy; the fastest is reported")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    compression = load_module(args.app_dir, "compression.py")
+    tuned = {"negotiate": True, "level": args.level, "window_bits": args.window_bits, "mem_level": 5}
+    policies = [
+        {"name": "off", "negotiate": False, "selective": False, "level": 0, "window_bits": 15, "mem_level": 8},
+        {"name": "uvicorn default", "negotiate": True, "selective": False, "level": -1, "window_bits": 15, "mem_level": 8},
+        {"name": f"all, l{args.level} w{args.window_bits}", "selective": False, **tuned},
+        *({"name": f"selective >= {m}", "selective": True, "min_bytes": m, **tuned} for m in map(int, args.min_bytes.split(","))),
+    ]
+    traffic = {"text": lambda: text_session(args.turns), "voice": lambda: voice_session(args.seconds)}
+    results = []
+    for session in args.sessions.split(","):
+        messages = traffic[session]()
+        for policy in policies:
+            compression.WS_DEFLATE_MIN_BYTES = policy.get("min_bytes", 0)
+            runs = [run(messages, policy, compression) for _ in range(args.repeat)]
+            results.append({"session": session, **min(runs, key=lambda r: r["cpu_ms"])})  # Least disturbed run
+
+    print(f"\n{'session':<8} {'policy':<18} {'messages':>9} {'MB':>8} {'wire MB':>8} {'saved':>7} {'CPU ms':>8} {'us/KB saved':>12} {'zlib KB/conn':>13}")
+    for r in results:
+        print(f"{r['session']:<8} {r['policy']:<18} {r['messages']:>9} {r['bytes'] / 1e6:>8.2f} {r['wire_bytes'] / 1e6:>8.2f} {r['saved_pct']:>6}% {r['cpu_ms']:>8} "
+              f"{str(r['us_per_kb_saved'] if r['us_per_kb_saved'] is not None else '-'):>12} {r['zlib_kb_per_conn']:>13}")
+    print(f"\n{'session':<8} {'policy':<18} {'class':<10} {'messages':>9} {'avg B':>7} {'saved':>7} {'us/msg':>8}")
+    for r in results:
+        if r["policy"] == "off": continue
+        for cls, c in r["classes"].items():
+            print(f"{r['session']:<8} {r['policy']:<18} {cls:<10} {c['messages']:>9} {c['bytes'] // c['messages']:>7} {c['saved_pct']:>6}% {c['us_per_msg']:>8}")
+
+    if args.json:
+        report = {"ts": datetime.now(timezone.utc).isoformat(), "host": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()}, "results": results}
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
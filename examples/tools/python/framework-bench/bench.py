@@ -0,0 +1,334 @@
+"""
+Cross-framework overhead benchmark.
+
+Runs the same scripted conversation through every example backend against the local mock model server,
+then reports what each framework adds on top of the (identical, deterministic) model:
+
+  * framework_ms_per_turn   turn latency minus the time the mock spent producing tokens
+  * cpu_ms_per_token        gateway + framework CPU time divided by tokens the mock streamed
+  * retained_kb_per_session traced Python memory still held after sessions closed (--trace-allocations)
+  * rss_kb_per_session      RSS growth while --hold-sessions sessions are connected at once
+"""
+import os
+import sys
+import ssl
+import json
+import time
+import socket
+import asyncio
+import logging
+import argparse
+import platform
+import tempfile
+import subprocess
+import urllib.request
+from datetime import datetime, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+EXAMPLES_DIR = os.path.normpath(os.path.join(HERE, "..", "..", "..", "agents", "python"))
+MOCK_DIR = os.path.normpath(os.path.join(HERE, "..", "mock-model-server"))
+sys.path.insert(0, os.path.normpath(os.path.join(HERE, "..", "loadtest")))
+
+from main import run_session  # noqa: E402  (loadtest)
+from scenarios import SCENARIOS  # noqa: E402
+from stats import summarize  # noqa: E402
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+# name: (example directory, model provider, default scenario)
+FRAMEWORKS = {
+    "langchain": ("langchain", "openai", "finny"),
+    "agno": ("agno", "openai", "finny"),
+    "strands": ("aws-strands", "openai", "finny"),
+    "autogen": ("microsoft-autogen", "openai", "finny"),
+    "agent-framework": ("microsoft-agent-framework", "openai", "finny"),
+    "adk": ("google-adk/normal-streaming", "gemini", "finny"),
+    # The mock Live API does not call tools, so the bidi example gets a widget-free script
+    "adk-bidi": ("google-adk/bidi-streaming", "gemini", "small-talk"),
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _http(url: str, method: str = "GET", body: dict = None, context=None) -> dict:
+    data = json.dumps(body).encode() if body is not None else (b"" if method == "POST" else None)
+    request = urllib.request.Request(url, data=data, method=method, headers={"content-type": "application/json"})
+    with urllib.request.urlopen(request, timeout=10, context=context) as response:
+        return json.loads(response.read())
+
+
+def _wait_ready(url: str, proc: subprocess.Popen, timeout: float, context=None):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"process exited with code {proc.returncode} before becoming ready")
+        try:
+            return _http(url, context=context)
+        except Exception:
+            time.sleep(0.2)
+    raise TimeoutError(f"{url} not ready after {timeout:.0f}s")
+
+
+def _self_signed_cert(directory: str) -> tuple[str, str]:
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=localhost",
+                    "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1", "-keyout", key, "-out", cert],
+                   check=True, capture_output=True)
+    return cert, key
+
+
+class MockServer:
+    """The mock model server in a subprocess, plain HTTP for OpenAI or TLS for Gemini."""
+    def __init__(self, args, cert: str = None, key: str = None):
+        self.port = _free_port()
+        self.cert = cert
+        scheme = "https" if cert else "http"
+        self.base_url = f"{scheme}://localhost:{self.port}"
+        self.context = ssl.create_default_context(cafile=cert) if cert else None
+        cmd = [sys.executable, "main.py", "--port", str(self.port), "--ttft-ms", str(args.mock_ttft_ms),
+               "--tokens-per-s", str(args.mock_tokens_per_s), "--seed", str(args.seed)]
+        if cert: cmd += ["--ssl-certfile", cert, "--ssl-keyfile", key]
+        self.proc = subprocess.Popen(cmd, cwd=MOCK_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        _wait_ready(f"{self.base_url}/mock/config", self.proc, 20, self.context)
+
+    def call(self, path: str, method: str = "GET") -> dict:
+        return _http(f"{self.base_url}{path}", method, context=self.context)
+
+    def env(self, provider: str) -> dict:
+        if provider == "openai":
+            return {"OPENAI_BASE_URL": f"{self.base_url}/v1", "OPENAI_API_KEY": "mock"}
+        return {"GOOGLE_GEMINI_BASE_URL": self.base_url, "GOOGLE_API_KEY": "mock", "SSL_CERT_FILE": self.cert,
+                "GOOGLE_GENAI_USE_VERTEXAI": "FALSE"}
+
+    def stop(self):
+        self.proc.terminate()
+        try: self.proc.wait(timeout=5)
+        except Exception: self.proc.kill()
+
+
+def _session_args(args) -> argparse.Namespace:
+    return argparse.Namespace(connect_timeout=args.connect_timeout, iterations=1, turn_timeout=args.turn_timeout,
+                              audio_chunk_ms=40, think_time=0.0)
+
+
+async def _run_sessions(url: str, scenario: list, count: int, concurrency: int, args) -> list:
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def one():
+        async with semaphore:
+            return await run_session(url, scenario, _session_args(args))
+
+    return list(await asyncio.gather(*(one() for _ in range(count))))
+
+
+async def _measure_hold(url: str, base: str, args) -> tuple[int, int]:
+    """Opens --hold-sessions sessions that each finish one turn, reads RSS while they are all connected, then closes them."""
+    from zijus_client import ZijusClient, TurnResult
+    clients = []
+
+    async def open_one():
+        client = ZijusClient(url, open_timeout=args.connect_timeout)
+        try:
+            await client.connect()
+            await client.send_text("Hello!")
+            await client.collect_turn(TurnResult("hold"), timeout=args.turn_timeout)
+            clients.append(client)
+        except Exception as e:
+            logger.warning(f"Hold session failed: {type(e).__name__}")
+            await client.close()
+
+    try:
+        await asyncio.gather(*(open_one() for _ in range(args.hold_sessions)))
+        stats = await asyncio.to_thread(_http, f"{base}/__bench__/reset", "POST")
+        return len(clients), stats["rss_bytes"]
+    finally:
+        await asyncio.gather(*(c.close() for c in clients), return_exceptions=True)
+
+
+def bench_framework(name: str, mock: MockServer, args) -> dict:
+    directory, provider, default_scenario = FRAMEWORKS[name]
+    scenario_name = args.scenario or default_scenario
+    scenario = SCENARIOS[scenario_name]
+    python = args.python_for.get(name, sys.executable)
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    url = f"ws://127.0.0.1:{port}/ws"
+
+    env = {**os.environ, "JWT_SECRET_KEY": os.getenv("JWT_SECRET_KEY", "bench-secret"), **mock.env(provider)}
+    cmd = [python, os.path.join(HERE, "harness.py"), os.path.join(EXAMPLES_DIR, directory), "--port", str(port)]
+    if args.trace_allocations: cmd.append("--trace-allocations")
+    # A file rather than a pipe, so a chatty app can never block on a full pipe buffer
+    log = tempfile.TemporaryFile()
+    proc = subprocess.Popen(cmd, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    try:
+        idle = _wait_ready(f"{base}/__bench__/stats", proc, args.startup_timeout)
+
+        # 1. Warm-up: imports, first model client, lazy caches
+        asyncio.run(_run_sessions(url, scenario, args.warmup, 1, args))
+
+        # 2. Latency / CPU phase
+        mock.call("/mock/stats/reset", "POST")
+        before = _http(f"{base}/__bench__/reset", "POST")
+        sessions = asyncio.run(_run_sessions(url, scenario, args.sessions, args.concurrency, args))
+        after = _http(f"{base}/__bench__/reset", "POST")
+        model = mock.call("/mock/stats")
+
+        turns = [t for s in sessions for t in s["turns"] if not t["error"] and t["completed_s"] is not None]
+        errors = sum(1 for s in sessions for t in s["turns"] if t["error"]) + sum(1 for s in sessions if s["connect_error"])
+        turn_total_s = sum(t["completed_s"] for t in turns)
+        cpu_s = after["cpu_s"] - before["cpu_s"]
+        tokens = model["tokens_sent"]
+
+        result = {
+            "example": directory, "provider": provider, "scenario": scenario_name,
+            "sessions": len(sessions), "sessions_completed": sum(1 for s in sessions if s["completed"]),
+            "turns": len(turns), "errors": errors, "model_requests": model["requests"], "model_tokens": tokens,
+            "turn_ms": summarize([t["completed_s"] for t in turns], 1000),
+            "ttft_ms": summarize([t["first_token_s"] for t in turns if t["first_token_s"] is not None], 1000),
+            "model_ms_per_turn": model["model_time_s"] / len(turns) * 1000 if turns else None,
+            "framework_ms_per_turn": (turn_total_s - model["model_time_s"]) / len(turns) * 1000 if turns else None,
+            "cpu_ms_per_turn": cpu_s / len(turns) * 1000 if turns else None,
+            "cpu_ms_per_token": cpu_s / tokens * 1000 if tokens else None,
+            "gc_collections": after["gc_collections"] - before["gc_collections"],
+            "rss_idle_kb": idle["rss_bytes"] / 1024,
+        }
+        if after.get("tracing_allocations"):
+            result["traced_peak_kb"] = after["traced_peak_bytes"] / 1024
+            result["retained_kb_per_session"] = (after["traced_current_bytes"] - before["traced_current_bytes"]) / 1024 / max(1, len(sessions))
+
+        # 3. Memory phase: RSS growth with N live sessions
+        if args.hold_sessions > 0:
+            rss_before = _http(f"{base}/__bench__/reset", "POST")["rss_bytes"]
+            held, rss_held = asyncio.run(_measure_hold(url, base, args))
+            result["hold_sessions"] = held
+            result["rss_kb_per_session"] = (rss_held - rss_before) / 1024 / held if held else None
+        return result
+    except Exception:
+        log.seek(0)
+        logger.warning(f"{name} output (tail):\n{log.read().decode(errors='replace')[-2000:]}")
+        raise
+    finally:
+        proc.terminate()
+        try: proc.wait(timeout=10)
+        except Exception: proc.kill()
+        log.close()
+
+
+COLUMNS = [
+    ("framework_ms_per_turn", "fw ms/turn", "{:.1f}"), ("cpu_ms_per_token", "cpu ms/tok", "{:.3f}"),
+    ("cpu_ms_per_turn", "cpu ms/turn", "{:.1f}"), ("rss_kb_per_session", "rss KB/sess", "{:.0f}"),
+    ("retained_kb_per_session", "kept KB/sess", "{:.1f}"), ("rss_idle_kb", "idle RSS KB", "{:.0f}"),
+    ("errors", "errors", "{}"),
+]
+
+
+def format_table(results: dict, baseline: dict = None) -> str:
+    header = f"{'framework':<17}" + "".join(f"{title:>14}" for _, title, _ in COLUMNS)
+    lines = [header, "-" * len(header)]
+    for name, result in results.items():
+        if "error" in result:
+            lines.append(f"{name:<17}  failed: {result['error']}")
+            continue
+        cells = []
+        for key, _, fmt in COLUMNS:
+            value = result.get(key)
+            cell = fmt.format(value) if value is not None else "-"
+            old = (baseline or {}).get(name, {}).get(key)
+            if value is not None and old:
+                cell += f" ({(value - old) / old:+.0%})"
+            cells.append(f"{cell:>14}")
+        lines.append(f"{name:<17}" + "".join(cells))
+    return "\n".join(lines)
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Measure per-turn framework overhead of every example backend against the mock model.")
+    parser.add_argument("--frameworks", default=",".join(FRAMEWORKS), help=f"Comma-separated subset of: {', '.join(FRAMEWORKS)}")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), help="Override the per-framework default scenario")
+    parser.add_argument("--sessions", type=int, default=20, help="Measured sessions per framework")
+    parser.add_argument("--concurrency", type=int, default=1, help="Sessions in flight at once during the latency phase")
+    parser.add_argument("--warmup", type=int, default=2, help="Unmeasured sessions run first")
+    parser.add_argument("--hold-sessions", type=int, default=50, help="Concurrent idle sessions for the RSS phase (0 = skip)")
+    parser.add_argument("--trace-allocations", action="store_true", help="Run apps under tracemalloc to report retained memory per session")
+    parser.add_argument("--mock-ttft-ms", type=float, default=100.0)
+    parser.add_argument("--mock-tokens-per-s", type=float, default=200.0)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--python-for", action="append", default=[], metavar="NAME=PYTHON",
+                        help="Interpreter (e.g. that example's venv) to run NAME with; repeatable")
+    parser.add_argument("--ssl-certfile", help="Certificate for the Gemini mock (generated with openssl if omitted)")
+    parser.add_argument("--ssl-keyfile")
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--turn-timeout", type=float, default=60.0)
+    parser.add_argument("--connect-timeout", type=float, default=10.0)
+    parser.add_argument("--compare", help="Previous JSON report to show relative changes against")
+    parser.add_argument("--json", dest="json_path", help="Write the full machine-readable report to this path")
+    args = parser.parse_args(argv)
+    args.python_for = dict(item.split("=", 1) for item in args.python_for)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    names = [n.strip() for n in args.frameworks.split(",") if n.strip()]
+    unknown = [n for n in names if n not in FRAMEWORKS]
+    if unknown:
+        raise SystemExit(f"Unknown framework(s): {', '.join(unknown)}")
+
+    providers = {FRAMEWORKS[n][1] for n in names}
+    mocks = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            if "openai" in providers:
+                mocks["openai"] = MockServer(args)
+            if "gemini" in providers:
+                cert, key = (args.ssl_certfile, args.ssl_keyfile) if args.ssl_certfile else _self_signed_cert(tmp)
+                mocks["gemini"] = MockServer(args, cert, key)
+
+            results = {}
+            for name in names:
+                print(f"Benchmarking {name}...", file=sys.stderr)
+                try:
+                    results[name] = bench_framework(name, mocks[FRAMEWORKS[name][1]], args)
+                except Exception as e:
+                    results[name] = {"error": f"{type(e).__name__}: {e}"}
+            mock_config = next(iter(mocks.values())).call("/mock/config")
+        finally:
+            for mock in mocks.values(): mock.stop()
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(), "revision": _git_revision(),
+            "python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count(),
+            "mock": mock_config, "config": {k: v for k, v in vars(args).items() if k not in ("json_path", "compare")},
+        },
+        "results": results,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f).get("results")
+    print(format_table(results, baseline))
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    report = main()
+    sys.exit(0 if all("error" not in r for r in report["results"].values()) else 1)
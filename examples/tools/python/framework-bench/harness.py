@@ -0,0 +1,72 @@
+"""
+Boots one example app (`<app_dir>/main.py:app`) in this process and adds `/__bench__/*` endpoints that
+report the process's own CPU time, RSS and (optionally) traced Python allocations.
+
+Run by bench.py as a subprocess; each example keeps its own virtualenv via --python-for.
+"""
+import os
+import gc
+import sys
+import time
+import argparse
+import resource
+import tracemalloc
+
+
+def current_rss_bytes() -> int:
+    """Resident set size right now (Linux /proc), falling back to the peak on other platforms."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def process_stats() -> dict:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    stats = {
+        "cpu_user_s": usage.ru_utime, "cpu_system_s": usage.ru_stime, "cpu_s": usage.ru_utime + usage.ru_stime,
+        "rss_bytes": current_rss_bytes(), "gc_collections": sum(s["collections"] for s in gc.get_stats()),
+        "wall_s": time.perf_counter(), "tracing_allocations": tracemalloc.is_tracing(),
+    }
+    if tracemalloc.is_tracing():
+        stats["traced_current_bytes"], stats["traced_peak_bytes"] = tracemalloc.get_traced_memory()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an example app with benchmark probes.")
+    parser.add_argument("app_dir")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--trace-allocations", action="store_true", help="Enable tracemalloc (slows the app down noticeably)")
+    args = parser.parse_args()
+
+    # Examples import their siblings (utils, zijus_tools, my_agent) and read .env/templates relative to cwd
+    app_dir = os.path.abspath(args.app_dir)
+    os.chdir(app_dir)
+    sys.path.insert(0, app_dir)
+
+    if args.trace_allocations:
+        tracemalloc.start()
+
+    import uvicorn
+    import main as example
+
+    @example.app.get("/__bench__/stats")
+    async def bench_stats():
+        return process_stats()
+
+    @example.app.post("/__bench__/reset")
+    async def bench_reset():
+        """Collects garbage and restarts the traced peak so the next phase is measured on its own."""
+        gc.collect()
+        if tracemalloc.is_tracing(): tracemalloc.reset_peak()
+        return process_stats()
+
+    uvicorn.run(example.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import os
+import sys
+import json
+import time
+import base64
+import asyncio
+import logging
+import argparse
+import multiprocessing
+
+from zijus_client import ZijusClient, TurnResult, answer_for_widget, synth_pcm
+from scenarios import SCENARIOS
+from stats import build_report, format_report
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+SAMPLE_ATTACHMENT = "date,description,amount\n2026-01-03,Rent,-1450.00\n2026-01-05,Salary,4200.00\n2026-01-09,Groceries,-86.40\n"
+
+
+def _turn_sample(turn: TurnResult) -> dict:
+    return {
+        "label": turn.label, "first_token_s": turn.first_token_s, "first_audio_s": turn.first_audio_s, "completed_s": turn.completed_s,
+        "chunks": turn.chunks, "est_tokens": turn.est_tokens, "tokens_per_s": turn.tokens_per_s,
+        "audio_bytes": turn.audio_bytes, "widgets": len(turn.widgets), "interrupted": turn.interrupted, "error": turn.error,
+    }
+
+
+async def run_session(url: str, scenario: list, args) -> dict:
+    """Connects one simulated user and replays the scenario, returning raw timing samples."""
+    client = ZijusClient(url, open_timeout=args.connect_timeout)
+    result = {"connect_s": None, "handshake_s": None, "connect_error": None, "turns": [], "completed": False}
+
+    try:
+        await client.connect()
+        result["connect_s"], result["handshake_s"] = client.connect_s, client.handshake_s
+    except Exception as e:
+        result["connect_error"] = f"connect: {type(e).__name__}"
+        return result
+
+    try:
+        for _ in range(args.iterations):
+            for index, step in enumerate(scenario):
+                label = f"{index + 1}:{next(k for k in step if k != 'wait')}"
+                turn = TurnResult(label)
+
+                if "think" in step:
+                    await asyncio.sleep(step["think"])
+                    continue
+
+                if "speak" in step:
+                    # Barge-in audio: text-mode backends only cancel, bidi backends answer
+                    await client.send_audio(synth_pcm(step["speak"]), chunk_ms=args.audio_chunk_ms, realtime=True)
+                    continue
+
+                if "answer_widget" in step:
+                    answer = answer_for_widget(client.last_widget, step["answer_widget"])
+                    if answer is None:
+                        turn.error = "no_widget"
+                        result["turns"].append(_turn_sample(turn))
+                        return result
+                    turn.sent_at = time.perf_counter()
+                    await client.send_text(answer)
+                elif "widget_event" in step:
+                    turn.sent_at = time.perf_counter()
+                    await client.send_widget_event(step["widget_event"])
+                elif "attach" in step:
+                    attachment = {"name": "statement.csv", "type": step["attach"], "data": base64.b64encode(SAMPLE_ATTACHMENT.encode()).decode("utf-8")}
+                    turn.sent_at = time.perf_counter()
+                    await client.send_text(step.get("say", ""), attachment=attachment)
+                else:
+                    turn.sent_at = time.perf_counter()
+                    await client.send_text(step["say"])
+
+                if step.get("wait", True) is False:
+                    continue
+
+                await client.collect_turn(turn, timeout=args.turn_timeout)
+                result["turns"].append(_turn_sample(turn))
+                if turn.error and turn.error.startswith("disconnect"):
+                    return result
+                if args.think_time > 0:
+                    await asyncio.sleep(args.think_time)
+        result["completed"] = True
+    finally:
+        await client.close()
+    return result
+
+
+async def run_worker(url: str, scenario: list, sessions: int, ramp_rate: float, args) -> tuple[list, float]:
+    """Starts `sessions` clients at `ramp_rate` per second and waits for all of them to finish."""
+    tasks = []
+    t0 = time.perf_counter()
+    for i in range(sessions):
+        tasks.append(asyncio.create_task(run_session(url, scenario, args)))
+        if ramp_rate > 0 and i < sessions - 1:
+            await asyncio.sleep(1 / ramp_rate)
+    ramp_s = time.perf_counter() - t0
+    return list(await asyncio.gather(*tasks)), ramp_s
+
+
+def _worker_entry(url: str, scenario_name: str, sessions: int, ramp_rate: float, args) -> tuple[list, float]:
+    return asyncio.run(run_worker(url, SCENARIOS[scenario_name], sessions, ramp_rate, args))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Drive N concurrent Zijus chat sessions against a local example app.")
+    parser.add_argument("--url", default=os.getenv("ZIJUS_LOADTEST_URL", "ws://localhost:8000/ws"), help="WebSocket endpoint of the example app")
+    parser.add_argument("--scenario", default="finny", choices=sorted(SCENARIOS), help="Scripted conversation to replay")
+    parser.add_argument("--sessions", type=int, default=100, help="Total concurrent sessions to open")
+    parser.add_argument("--ramp-rate", type=float, default=50.0, help="New sessions per second (0 = all at once)")
+    parser.add_argument("--workers", type=int, default=1, help="Client processes (use >1 for thousands of sessions)")
+    parser.add_argument("--iterations", type=int, default=1, help="Times each session replays the scenario")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Pause after each completed turn (seconds)")
+    parser.add_argument("--turn-timeout", type=float, default=60.0, help="Seconds to wait for FinalMessage")
+    parser.add_argument("--connect-timeout", type=float, default=10.0, help="Seconds to wait for the session handshake")
+    parser.add_argument("--audio-chunk-ms", type=int, default=40, help="Mic chunk size for voice steps")
+    parser.add_argument("--json", dest="json_path", help="Also write the full report as JSON to this path")
+    return parser.parse_args(argv)
+
+
+def passed(report: dict) -> bool:
+    """The exit status: no connect or turn errors, and every session got through its scenario."""
+    return not report["errors"] and report["sessions"]["completed_scenario"] == report["sessions"]["attempted"]
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    t0 = time.perf_counter()
+
+    if args.workers <= 1:
+        sessions, ramp_s = asyncio.run(run_worker(args.url, SCENARIOS[args.scenario], args.sessions, args.ramp_rate, args))
+    else:
+        # Split sessions evenly; each process ramps its share so the aggregate rate stays the same
+        shares = [args.sessions // args.workers + (1 if i < args.sessions % args.workers else 0) for i in range(args.workers)]
+        rate = args.ramp_rate / args.workers if args.ramp_rate > 0 else 0
+        with multiprocessing.Pool(args.workers) as pool:
+            results = pool.starmap(_worker_entry, [(args.url, args.scenario, share, rate, args) for share in shares if share])
+        sessions = [s for worker_sessions, _ in results for s in worker_sessions]
+        ramp_s = max(r for _, r in results)
+
+    report = build_report(sessions, wall_s=time.perf_counter() - t0, ramp_s=ramp_s)
+    report["config"] = {k: v for k, v in vars(args).items() if k != "json_path"}
+    print(format_report(report))
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    sys.exit(0 if passed(main()) else 1)
@@ -0,0 +1,53 @@
+"""
+Scripted conversations replayed by every simulated session.
+
+Each step is a dict with one action:
+  - {"say": "..."}                          TextMessage (add "wait": False to move on before FinalMessage)
+  - {"answer_widget": "24 Months"}          Click the slot / submit the slider the bot last rendered
+                                            (sent as a TextMessage, exactly like the browser bundle does)
+  - {"widget_event": {...payload...}}       WidgetEvent with the given payload
+  - {"speak": 1.5}                          Stream N seconds of PCM16 mic audio (AudioMessage chunks)
+  - {"attach": "text/plain", "say": "..."}  TextMessage with a small generated attachment
+  - {"think": 0.5}                          Client-side pause between turns (seconds)
+"""
+
+FINNY_LOAN_FLOW = [
+    {"say": "Hi, I'd like to apply for a personal loan."},
+    {"answer_widget": "20000"},
+    {"answer_widget": "24 Months"},
+    {"answer_widget": "Yes"},
+    {"answer_widget": "Tomorrow 10:00 AM"},
+]
+
+FINNY_WIDGET_EVENTS = [
+    {"say": "Hi, I'd like to apply for a personal loan."},
+    {"widget_event": {"amount": 20000}},
+    {"widget_event": {"term": "24 Months"}},
+    {"widget_event": {"officer": "No"}},
+]
+
+SMALL_TALK = [
+    {"say": "Hello! What can you help me with?"},
+    {"think": 0.5},
+    {"say": "Can you summarise that in one sentence?"},
+]
+
+ATTACHMENT_UPLOAD = [
+    {"attach": "text/plain", "say": "Please summarise the attached statement."},
+    {"say": "Thanks, what was the largest item?"},
+]
+
+VOICE_BARGE_IN = [
+    {"say": "Tell me about your loan products in detail.", "wait": False},
+    {"think": 0.3},
+    {"speak": 1.0},
+    {"say": "Sorry, just the interest rates please."},
+]
+
+SCENARIOS = {
+    "finny": FINNY_LOAN_FLOW,
+    "finny-widget-events": FINNY_WIDGET_EVENTS,
+    "small-talk": SMALL_TALK,
+    "attachment": ATTACHMENT_UPLOAD,
+    "voice-barge-in": VOICE_BARGE_IN,
+}
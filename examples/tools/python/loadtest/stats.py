@@ -0,0 +1,89 @@
+import math
+from typing import Iterable, Optional
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(sorted_values: list, pct: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values: return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(values: Iterable[Optional[float]], scale: float = 1.0) -> dict:
+    """Count/min/mean/max and the standard percentiles, skipping missing samples."""
+    data = sorted(v * scale for v in values if v is not None)
+    if not data:
+        return {"count": 0}
+    summary = {"count": len(data), "min": data[0], "mean": sum(data) / len(data), "max": data[-1]}
+    for pct in PERCENTILES:
+        summary[f"p{pct}"] = percentile(data, pct)
+    return summary
+
+
+def build_report(sessions: list[dict], wall_s: float, ramp_s: float) -> dict:
+    """Aggregates raw per-session samples (as produced by main.run_session) into the final report."""
+    connected = [s for s in sessions if s["connect_s"] is not None]
+    turns = [t for s in sessions for t in s["turns"]]
+    ok_turns = [t for t in turns if t["error"] is None]
+    errors: dict[str, int] = {}
+    for s in sessions:
+        if s["connect_error"]: errors[s["connect_error"]] = errors.get(s["connect_error"], 0) + 1
+    for t in turns:
+        if t["error"]: errors[t["error"]] = errors.get(t["error"], 0) + 1
+
+    return {
+        "sessions": {
+            "attempted": len(sessions),
+            "connected": len(connected),
+            "connect_rate_per_s": len(connected) / ramp_s if ramp_s > 0 else None,
+            "connect_error_rate": 1 - len(connected) / len(sessions) if sessions else 0.0,
+            "completed_scenario": sum(1 for s in sessions if s["completed"]),
+        },
+        "connect_ms": summarize((s["connect_s"] for s in connected), 1000),
+        "handshake_ms": summarize((s["handshake_s"] for s in connected), 1000),
+        "turns": {
+            "total": len(turns),
+            "ok": len(ok_turns),
+            "error_rate": 1 - len(ok_turns) / len(turns) if turns else 0.0,
+            "interrupted": sum(1 for t in turns if t["interrupted"]),
+        },
+        "ttft_ms": summarize((t["first_token_s"] for t in ok_turns), 1000),
+        "first_audio_ms": summarize((t["first_audio_s"] for t in ok_turns), 1000),
+        "turn_ms": summarize((t["completed_s"] for t in ok_turns), 1000),
+        "tokens_per_s": summarize(t["tokens_per_s"] for t in ok_turns),
+        "per_step_ttft_ms": {
+            label: summarize((t["first_token_s"] for t in ok_turns if t["label"] == label), 1000)
+            for label in sorted({t["label"] for t in ok_turns})
+        },
+        "errors": errors,
+        "wall_s": wall_s,
+    }
+
+
+def format_report(report: dict) -> str:
+    """Human readable table of the main latency/throughput figures."""
+    def row(name: str, summary: dict, unit: str) -> str:
+        if not summary.get("count"): return f"  {name:<22} (no samples)"
+        cells = "  ".join(f"p{p}={summary[f'p{p}']:.1f}" for p in PERCENTILES)
+        return f"  {name:<22} n={summary['count']:<6} {cells} {unit}"
+
+    s, t = report["sessions"], report["turns"]
+    rate = f"{s['connect_rate_per_s']:.1f}/s" if s["connect_rate_per_s"] else "n/a"
+    lines = [
+        f"Sessions: {s['connected']}/{s['attempted']} connected ({rate}), {s['completed_scenario']} completed the scenario",
+        f"Turns:    {t['ok']}/{t['total']} ok, error rate {t['error_rate']:.2%}, {t['interrupted']} interrupted",
+        row("connect", report["connect_ms"], "ms"),
+        row("handshake", report["handshake_ms"], "ms"),
+        row("ttft", report["ttft_ms"], "ms"),
+        row("first audio", report["first_audio_ms"], "ms"),
+        row("turn", report["turn_ms"], "ms"),
+        row("tokens/s", report["tokens_per_s"], "tok/s"),
+    ]
+    for label, summary in report["per_step_ttft_ms"].items():
+        lines.append(row(f"ttft[{label}]"[:22], summary, "ms"))
+    if report["errors"]:
+        lines.append("Errors:   " + ", ".join(f"{k}={v}" for k, v in sorted(report["errors"].items())))
+    lines.append(f"Wall time: {report['wall_s']:.1f}s")
+    return "\n".join(lines)
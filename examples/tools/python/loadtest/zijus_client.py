@@ -0,0 +1,184 @@
+import json
+import time
+import uuid
+import base64
+import asyncio
+import math
+from datetime import datetime, timezone
+from typing import Optional
+from urllib.parse import urlencode
+
+from websockets.asyncio.client import connect
+
+# Assistant message types that count as "the bot has started answering"
+FIRST_TOKEN_TYPES = {"TextMessage", "AudioMessage", "SlotMessage", "SliderMessage", "DatePickerMessage", "MCQMessage", "ThoughtMessage"}
+WIDGET_TYPES = {"SlotMessage", "SliderMessage", "DatePickerMessage", "MCQMessage"}
+
+
+class TurnResult:
+    """Timings and counters collected for a single user turn."""
+    def __init__(self, label: str):
+        self.label = label
+        self.sent_at = time.perf_counter()
+        self.first_token_s: Optional[float] = None
+        self.first_audio_s: Optional[float] = None
+        self.completed_s: Optional[float] = None
+        self.chunks = 0
+        self.chars = 0
+        self.audio_bytes = 0
+        self.widgets: list[dict] = []
+        self.interrupted = False
+        self.error: Optional[str] = None
+
+    @property
+    def est_tokens(self) -> int:
+        # ~4 characters per token for English text; good enough for relative comparisons
+        return math.ceil(self.chars / 4)
+
+    @property
+    def tokens_per_s(self) -> Optional[float]:
+        if self.first_token_s is None or self.completed_s is None: return None
+        streaming_s = self.completed_s - self.first_token_s
+        return self.est_tokens / streaming_s if streaming_s > 0 else None
+
+
+class ZijusClient:
+    """Minimal Zijus Chat UI protocol client (the same frames the browser bundle sends)."""
+    def __init__(self, url: str, session_id: Optional[str] = None, token: Optional[str] = None, open_timeout: float = 10.0):
+        self.url = url
+        self.session_id = session_id or f"load-{uuid.uuid4()}"
+        self.token = token
+        self.open_timeout = open_timeout
+        self.ws = None
+        self.connect_s: Optional[float] = None
+        self.handshake_s: Optional[float] = None
+        self.last_widget: Optional[dict] = None
+
+    async def connect(self):
+        params = {"session_id": self.session_id}
+        if self.token: params["token"] = self.token
+        t0 = time.perf_counter()
+        self.ws = await connect(f"{self.url}?{urlencode(params)}", open_timeout=self.open_timeout, max_size=None, compression=None)
+        self.connect_s = time.perf_counter() - t0
+
+        # The server always opens with {"type": "session", "token": ...}
+        while True:
+            msg = json.loads(await asyncio.wait_for(self.ws.recv(), timeout=self.open_timeout))
+            if msg.get("type") == "session":
+                self.token = msg.get("token") or self.token
+                break
+        self.handshake_s = time.perf_counter() - t0
+
+    async def close(self):
+        if self.ws is not None:
+            try: await self.ws.close()
+            except Exception: pass
+
+    async def _send(self, msg: dict):
+        await self.ws.send(json.dumps(msg)) # type: ignore
+
+    # --- Outbound frames ---
+    async def send_text(self, content: str, attachment: Optional[dict] = None) -> str:
+        m_id = str(uuid.uuid4())
+        msg = {"source": "user", "type": "TextMessage", "content": content, "search": False, "m_id": m_id}
+        if attachment: msg["attachment"] = attachment
+        await self._send(msg)
+        return m_id
+
+    async def send_widget_event(self, payload: dict, widget_id: str = "loadtest-widget", event_name: str = "submit") -> str:
+        m_id = str(uuid.uuid4())
+        await self._send({
+            "type": "WidgetEvent", "source": "user", "m_id": m_id,
+            "widgetEvent": {
+                "widgetId": widget_id, "eventName": event_name, "payload": payload,
+                "eventType": "FLOW_EVENT", "ts": datetime.now(timezone.utc).isoformat()
+            }
+        })
+        return m_id
+
+    async def send_audio(self, pcm: bytes, mime_type: str = "audio/pcm;rate=16000", chunk_ms: int = 40, realtime: bool = True, partial: bool = True):
+        """Streams PCM16 mono audio in browser-sized chunks, optionally paced at real time."""
+        rate = int(mime_type.split("rate=")[-1]) if "rate=" in mime_type else 16000
+        chunk_bytes = max(2, int(rate * 2 * chunk_ms / 1000))
+        m_id = str(uuid.uuid4())
+        for offset in range(0, len(pcm), chunk_bytes):
+            await self._send({
+                "source": "user", "type": "AudioMessage", "mimeType": mime_type, "m_id": m_id,
+                "partial_audio": partial, "data": base64.b64encode(pcm[offset:offset + chunk_bytes]).decode("utf-8")
+            })
+            if realtime: await asyncio.sleep(chunk_ms / 1000)
+        return m_id
+
+    async def send_feedback(self, m_id: str, feedback: str = "positive"):
+        await self._send({"type": "feedback", "m_id": m_id, "feedback": feedback})
+
+    # --- Inbound ---
+    async def collect_turn(self, turn: TurnResult, timeout: float) -> TurnResult:
+        """Reads server frames until the bot signals FinalMessage, an error, or the timeout expires."""
+        deadline = time.perf_counter() + timeout
+        try:
+            while True:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    turn.error = "timeout"
+                    break
+                msg = json.loads(await asyncio.wait_for(self.ws.recv(), timeout=remaining)) # type: ignore
+                msg_type = msg.get("type")
+                now = time.perf_counter() - turn.sent_at
+
+                if msg.get("source") == "assistant" and msg_type in FIRST_TOKEN_TYPES and turn.first_token_s is None:
+                    turn.first_token_s = now
+
+                if msg_type == "TextMessage" and msg.get("source") == "assistant":
+                    turn.chunks += 1
+                    turn.chars += len(msg.get("content") or "")
+                elif msg_type == "AudioMessage" and msg.get("source") == "assistant":
+                    turn.chunks += 1
+                    turn.audio_bytes += len(msg.get("data") or "") * 3 // 4
+                    if turn.first_audio_s is None: turn.first_audio_s = now
+                elif msg_type in WIDGET_TYPES:
+                    turn.widgets.append(msg)
+                    self.last_widget = msg
+                elif msg_type == "InterruptMessage":
+                    turn.interrupted = True
+                elif msg_type == "error":
+                    turn.error = "server_error"
+                    turn.completed_s = now
+                    break
+                elif msg_type == "FinalMessage":
+                    turn.completed_s = now
+                    break
+        except asyncio.TimeoutError:
+            turn.error = "timeout"
+        except Exception as e:
+            turn.error = f"disconnect: {type(e).__name__}"
+        if turn.completed_s is None and turn.error is None:
+            turn.completed_s = time.perf_counter() - turn.sent_at
+        return turn
+
+
+def answer_for_widget(widget: Optional[dict], prefer: Optional[str] = None) -> Optional[str]:
+    """Returns the text the browser bundle would send for a slot click or slider submit."""
+    if not widget: return None
+    if widget.get("slots"):
+        values = [s.get("value") or s.get("label") for s in widget["slots"]]
+        if prefer and prefer in values: return prefer
+        return values[0]
+    if widget.get("slider"):
+        slider = widget["slider"]
+        if prefer is not None:
+            try:
+                value = int(prefer)
+                return str(min(max(value, slider.get("min_value", value)), slider.get("max_value", value)))
+            except ValueError: pass
+        return str(slider.get("default_value", slider.get("min_value", 0)))
+    if widget.get("options"):
+        return widget["options"][0].get("value")
+    return prefer
+
+
+def synth_pcm(duration_s: float, rate: int = 16000, freq_hz: float = 220.0, amplitude: int = 6000) -> bytes:
+    """Generates a PCM16 mono tone so voice scenarios need no fixture files."""
+    import array
+    samples = array.array("h", (int(amplitude * math.sin(2 * math.pi * freq_hz * i / rate)) for i in range(int(duration_s * rate))))
+    return samples.tobytes()
@@ -0,0 +1,285 @@
+import json
+import math
+import time
+import uuid
+import array
+import base64
+import asyncio
+import logging
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional
+
+from fastapi import APIRouter, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from pacing import Pacer, InjectedDisconnect, config, stats
+from policy import respond, tokenize
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+OUTPUT_AUDIO_RATE = 24000
+SPEECH_RMS_THRESHOLD = 500
+END_OF_SPEECH_MS = 600
+MAX_RESUMABLE_SESSIONS = 1000
+
+# Resumption handle -> history of the session it belongs to (shared list, so later turns are included)
+_resumable: OrderedDict = OrderedDict()
+
+
+def _normalize(body: dict) -> tuple[list[dict], dict]:
+    """Maps Gemini `contents`/`tools` onto the provider-neutral shape used by policy.respond."""
+    messages = []
+    for content in body.get("contents", []):
+        parts = content.get("parts", [])
+        if any("functionResponse" in p for p in parts):
+            messages.append({"role": "tool", "content": json.dumps([p["functionResponse"] for p in parts if "functionResponse" in p])})
+            continue
+        text = "".join(p.get("text", "") for p in parts if not p.get("thought"))
+        messages.append({"role": "assistant" if content.get("role") == "model" else "user", "content": text})
+
+    tools = {}
+    for tool in body.get("tools") or []:
+        for decl in tool.get("functionDeclarations", []) or tool.get("function_declarations", []):
+            tools[decl["name"]] = decl.get("parameters") or decl.get("parametersJsonSchema") or {}
+    return messages, tools
+
+
+def _candidate(parts: list, finish_reason: Optional[str] = None) -> dict:
+    candidate = {"content": {"role": "model", "parts": parts}, "index": 0}
+    if finish_reason: candidate["finishReason"] = finish_reason
+    return candidate
+
+
+@router.post("/{version}/models/{model_action}")
+async def generate_content(version: str, model_action: str, request: Request):
+    """Serves both `:generateContent` and `:streamGenerateContent?alt=sse`."""
+    model, _, action = model_action.partition(":")
+    body = await request.json()
+    stats.requests += 1
+    messages, tools = _normalize(body)
+    reply = respond(messages, tools, config.reply_tokens)
+    pacer = Pacer(config)
+
+    if pacer.failure in ("error", "rate_limit"):
+        stats.failures_injected += 1
+        code = 500 if pacer.failure == "error" else 429
+        return JSONResponse({"error": {"code": code, "message": "Injected mock failure", "status": "INTERNAL" if code == 500 else "RESOURCE_EXHAUSTED"}}, status_code=code)
+
+    text_tokens = tokenize(reply.text)
+    prompt_tokens = sum(len(tokenize(m["content"])) for m in messages)
+    usage = {"promptTokenCount": prompt_tokens, "candidatesTokenCount": len(text_tokens) + (1 if reply.tool_name else 0)}
+    usage["totalTokenCount"] = usage["promptTokenCount"] + usage["candidatesTokenCount"]
+    call_part = {"functionCall": {"id": f"call-{uuid.uuid4().hex[:12]}", "name": reply.tool_name, "args": reply.tool_args}} if reply.tool_name else None
+
+    if action == "generateContent":
+        t0 = time.perf_counter()
+        await pacer.before_token(0)
+        await asyncio.sleep((len(text_tokens) - 1) / config.tokens_per_s if config.tokens_per_s > 0 and len(text_tokens) > 1 else 0)
+        stats.model_time_s += time.perf_counter() - t0
+        stats.tokens_sent += usage["candidatesTokenCount"]
+        stats.streams_completed += 1
+        parts = ([{"text": reply.text}] if reply.text else []) + ([call_part] if call_part else [])
+        if call_part: stats.tool_calls += 1
+        return {"candidates": [_candidate(parts, "STOP")], "usageMetadata": usage, "modelVersion": model}
+
+    def event(payload: dict) -> str:
+        return "data: " + json.dumps(payload) + "\r\n\r\n"
+
+    async def stream():
+        t0 = time.perf_counter()
+        sent = 0
+        pacer.plan_midstream_failure(len(text_tokens) + (1 if call_part else 0))
+        try:
+            for token in text_tokens:
+                await pacer.before_token(sent)
+                yield event({"candidates": [_candidate([{"text": token}])], "modelVersion": model})
+                sent += 1
+            if call_part:
+                stats.tool_calls += 1
+                await pacer.before_token(sent)
+                yield event({"candidates": [_candidate([call_part])], "modelVersion": model})
+                sent += 1
+            yield event({"candidates": [_candidate([{"text": ""}], "STOP")], "usageMetadata": usage, "modelVersion": model})
+            stats.streams_completed += 1
+        except InjectedDisconnect:
+            logger.info("Injected mid-stream disconnect.")
+            raise
+        except asyncio.CancelledError:
+            stats.streams_cancelled += 1
+            stats.tokens_unsent_on_cancel += max(0, usage["candidatesTokenCount"] - sent)
+            raise
+        finally:
+            stats.tokens_sent += sent
+            stats.model_time_s += time.perf_counter() - t0
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+# --- LIVE API (BidiGenerateContent over WebSocket) ---
+
+def _rms(pcm: bytes) -> float:
+    samples = array.array("h", pcm[: len(pcm) - len(pcm) % 2])
+    if not samples: return 0.0
+    return math.sqrt(sum(s * s for s in samples) / len(samples))
+
+
+@lru_cache(maxsize=8)
+def _tone_b64(duration_ms: float, freq_hz: float = 180.0) -> str:
+    """Base64 PCM16 24 kHz tone standing in for synthesized speech."""
+    n = int(OUTPUT_AUDIO_RATE * duration_ms / 1000)
+    pcm = array.array("h", (int(3000 * math.sin(2 * math.pi * freq_hz * i / OUTPUT_AUDIO_RATE)) for i in range(n))).tobytes()
+    return base64.b64encode(pcm).decode("utf-8")
+
+
+class LiveSession:
+    """One mock Live session: collects user turns, answers with paced transcription + PCM audio."""
+    def __init__(self, websocket: WebSocket, setup: dict):
+        self.ws = websocket
+        self.setup = setup
+        self.history: list[dict] = []
+        self.responder: Optional[asyncio.Task] = None
+        self.speech_ms = 0.0
+        self.last_speech_t: Optional[float] = None
+        modalities = (setup.get("generationConfig") or {}).get("responseModalities") or ["AUDIO"]
+        self.audio_out = "AUDIO" in [m.upper() for m in modalities]
+        self.resumable = setup.get("sessionResumption") is not None
+
+    async def send_resumption_update(self):
+        """Like the real Live API: a fresh handle after setup and after every completed turn."""
+        if not self.resumable: return
+        handle = f"mock-handle-{uuid.uuid4().hex}"
+        _resumable[handle] = self.history
+        while len(_resumable) > MAX_RESUMABLE_SESSIONS:
+            _resumable.popitem(last=False)
+        await self.send({"sessionResumptionUpdate": {"newHandle": handle, "resumable": True}})
+
+    async def send(self, payload: dict):
+        await self.ws.send_text(json.dumps(payload))
+
+    async def interrupt(self):
+        if self.responder and not self.responder.done():
+            self.responder.cancel()
+            stats.live_interruptions += 1
+            try: await self.send({"serverContent": {"interrupted": True}})
+            except Exception: pass
+
+    async def start_turn(self, user_text: str):
+        await self.interrupt()
+        self.history.append({"role": "user", "content": user_text})
+        self.responder = asyncio.create_task(self.respond())
+
+    async def respond(self):
+        stats.live_turns += 1
+        reply = respond(self.history, {}, config.reply_tokens)
+        tokens = tokenize(reply.text)
+        pacer = Pacer(config)
+        t0 = time.perf_counter()
+        sent = 0
+        try:
+            for token in tokens:
+                await pacer.before_token(sent)
+                content: dict = {"outputTranscription": {"text": token}}
+                if self.audio_out:
+                    content["modelTurn"] = {"parts": [{"inlineData": {"mimeType": f"audio/pcm;rate={OUTPUT_AUDIO_RATE}", "data": _tone_b64(config.audio_ms_per_token)}}]}
+                else:
+                    content["modelTurn"] = {"parts": [{"text": token}]}
+                await self.send({"serverContent": content})
+                sent += 1
+            self.history.append({"role": "assistant", "content": reply.text})
+            await self.send({"serverContent": {"generationComplete": True}})
+            await self.send({"serverContent": {"turnComplete": True}, "usageMetadata": {"responseTokenCount": sent}})
+            await self.send_resumption_update()
+        except asyncio.CancelledError:
+            stats.tokens_unsent_on_cancel += len(tokens) - sent
+            raise
+        finally:
+            stats.tokens_sent += sent
+            stats.model_time_s += time.perf_counter() - t0
+
+    async def on_audio(self, pcm: bytes, rate: int):
+        """Tiny energy VAD: speech barges in on a running answer, END_OF_SPEECH_MS of quiet ends the user turn."""
+        now = time.perf_counter()
+        duration_ms = len(pcm) / 2 / rate * 1000
+        if _rms(pcm) >= SPEECH_RMS_THRESHOLD:
+            if self.speech_ms == 0:
+                await self.interrupt()
+            self.speech_ms += duration_ms
+            self.last_speech_t = now
+        elif self.last_speech_t and (now - self.last_speech_t) * 1000 >= END_OF_SPEECH_MS:
+            await self.end_of_speech()
+
+    async def end_of_speech(self):
+        if self.speech_ms <= 0: return
+        transcript = f"(mock transcript of {self.speech_ms / 1000:.1f}s of speech)"
+        self.speech_ms, self.last_speech_t = 0.0, None
+        if self.setup.get("inputAudioTranscription") is not None:
+            await self.send({"serverContent": {"inputTranscription": {"text": transcript}}})
+        await self.start_turn(transcript)
+
+
+async def _live_endpoint(websocket: WebSocket):
+    await websocket.accept()
+    pacer = Pacer(config)
+    try:
+        setup = json.loads(await websocket.receive_text()).get("setup", {})
+    except Exception:
+        await websocket.close(code=1007)
+        return
+
+    if pacer.failure in ("error", "rate_limit"):
+        stats.failures_injected += 1
+        await websocket.close(code=1011, reason="Internal error encountered.")
+        return
+
+    handle = (setup.get("sessionResumption") or {}).get("handle")
+    if handle and handle not in _resumable:
+        stats.live_resume_rejected += 1
+        await websocket.close(code=1008, reason="Invalid session resumption handle.")
+        return
+
+    stats.live_sessions += 1
+    session = LiveSession(websocket, setup)
+    if handle:
+        stats.live_resumed += 1
+        session.history = _resumable[handle]
+    if config.live_setup_ms > 0:
+        await asyncio.sleep(config.live_setup_ms / 1000)  # Real Live sessions take a while to set up
+    await session.send({"setupComplete": {}})
+    await session.send_resumption_update()
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message.get("type") == "websocket.disconnect": break
+            raw = message.get("text") or message.get("bytes")
+            if not raw: continue
+            data = json.loads(raw)
+
+            if "clientContent" in data:
+                turns = data["clientContent"].get("turns", [])
+                text = " ".join(p.get("text", "") for t in turns for p in t.get("parts", []) if p.get("text"))
+                if text and data["clientContent"].get("turnComplete", True):
+                    await session.start_turn(text)
+            elif "realtimeInput" in data:
+                rt = data["realtimeInput"]
+                chunks = ([rt["audio"]] if "audio" in rt else []) + rt.get("mediaChunks", [])
+                for chunk in chunks:
+                    mime = chunk.get("mimeType", "audio/pcm;rate=16000")
+                    if not mime.startswith("audio/"): continue
+                    rate = int(mime.split("rate=")[-1]) if "rate=" in mime else 16000
+                    await session.on_audio(base64.b64decode(chunk.get("data", "")), rate)
+                if rt.get("text"):
+                    await session.start_turn(rt["text"])
+                if rt.get("activityEnd") is not None or rt.get("audioStreamEnd"):
+                    await session.end_of_speech()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if session.responder: session.responder.cancel()
+
+
+for _version in ("v1alpha", "v1beta"):
+    router.add_api_websocket_route(f"/ws/google.ai.generativelanguage.{_version}.GenerativeService.BidiGenerateContent", _live_endpoint)
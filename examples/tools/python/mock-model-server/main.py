@@ -0,0 +1,64 @@
+import os
+import logging
+import argparse
+
+from fastapi import FastAPI, HTTPException, Request
+
+from pacing import config, stats
+from openai_compat import router as openai_router
+from gemini_compat import router as gemini_router
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+app = FastAPI(title="Zijus Mock Model Server")
+app.include_router(openai_router)
+app.include_router(gemini_router)
+
+
+@app.get("/mock/config")
+async def get_config():
+    return config.as_dict()
+
+
+@app.post("/mock/config")
+async def update_config(request: Request):
+    """Changes pacing/failure injection at runtime, e.g. {"ttft_ms": 0, "tokens_per_s": 0}."""
+    try:
+        return config.update(await request.json())
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/mock/stats")
+async def get_stats():
+    return stats.as_dict()
+
+
+@app.post("/mock/stats/reset")
+async def reset_stats():
+    stats.reset()
+    return stats.as_dict()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible and Gemini (REST + Live) stand-in server.")
+    parser.add_argument("--host", default=os.getenv("MOCK_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("MOCK_PORT", "9000")))
+    parser.add_argument("--ttft-ms", type=float, default=config.ttft_ms)
+    parser.add_argument("--tokens-per-s", type=float, default=config.tokens_per_s)
+    parser.add_argument("--jitter-ms", type=float, default=config.jitter_ms)
+    parser.add_argument("--failure-rate", type=float, default=config.failure_rate)
+    parser.add_argument("--failure-mode", default=config.failure_mode)
+    parser.add_argument("--seed", type=int, default=config.seed)
+    parser.add_argument("--live-setup-ms", type=float, default=config.live_setup_ms, help="Delay before a Live session's setupComplete")
+    parser.add_argument("--ssl-certfile", default=os.getenv("MOCK_SSL_CERTFILE"), help="Serve HTTPS/WSS (required by the Gemini SDKs)")
+    parser.add_argument("--ssl-keyfile", default=os.getenv("MOCK_SSL_KEYFILE"))
+    args = parser.parse_args()
+
+    config.update({"ttft_ms": args.ttft_ms, "tokens_per_s": args.tokens_per_s, "jitter_ms": args.jitter_ms,
+                   "failure_rate": args.failure_rate, "failure_mode": args.failure_mode, "seed": args.seed,
+                   "live_setup_ms": args.live_setup_ms})
+    uvicorn.run(app, host=args.host, port=args.port, ssl_certfile=args.ssl_certfile, ssl_keyfile=args.ssl_keyfile)
@@ -0,0 +1,128 @@
+import json
+import time
+import uuid
+import asyncio
+import logging
+
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from pacing import Pacer, InjectedDisconnect, config, stats
+from policy import respond, tokenize
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+def _text_of(content) -> str:
+    """Flattens OpenAI message content (string or list of parts) to plain text."""
+    if isinstance(content, str): return content
+    if isinstance(content, list):
+        return "".join(p.get("text", "") for p in content if isinstance(p, dict) and p.get("type") in ("text", "input_text"))
+    return ""
+
+
+def _normalize(body: dict) -> tuple[list[dict], dict]:
+    messages = [{"role": m.get("role", "user"), "content": _text_of(m.get("content"))} for m in body.get("messages", [])]
+    tools = {}
+    for tool in body.get("tools") or []:
+        fn = tool.get("function", {})
+        if fn.get("name"): tools[fn["name"]] = fn.get("parameters") or {}
+    return messages, tools
+
+
+def _failure_response(pacer: Pacer):
+    if pacer.failure == "error":
+        stats.failures_injected += 1
+        return JSONResponse({"error": {"message": "Injected mock failure", "type": "server_error"}}, status_code=500)
+    if pacer.failure == "rate_limit":
+        stats.failures_injected += 1
+        return JSONResponse({"error": {"message": "Injected rate limit", "type": "rate_limit_error"}}, status_code=429, headers={"retry-after": "1"})
+    return None
+
+
+@router.get("/v1/models")
+async def list_models():
+    return {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "zijus-mock"}]}
+
+
+@router.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats.requests += 1
+    messages, tools = _normalize(body)
+    reply = respond(messages, tools, config.reply_tokens)
+    pacer = Pacer(config)
+
+    failed = _failure_response(pacer)
+    if failed: return failed
+
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    model = body.get("model", "mock")
+    created = int(time.time())
+    call_id = f"call_{uuid.uuid4().hex[:24]}"
+    arguments = json.dumps(reply.tool_args)
+    text_tokens = tokenize(reply.text)
+    prompt_tokens = sum(len(tokenize(m["content"])) for m in messages)
+    completion_tokens = len(text_tokens) + (len(tokenize(arguments)) if reply.tool_name else 0)
+    usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+    finish_reason = "tool_calls" if reply.tool_name else "stop"
+
+    if not body.get("stream"):
+        # Mid-stream failure modes only apply to streaming requests
+        t0 = time.perf_counter()
+        await pacer.before_token(0)
+        await asyncio.sleep((completion_tokens - 1) / config.tokens_per_s if config.tokens_per_s > 0 and completion_tokens > 1 else 0)
+        stats.model_time_s += time.perf_counter() - t0
+        stats.tokens_sent += completion_tokens
+        stats.streams_completed += 1
+        message = {"role": "assistant", "content": reply.text or None}
+        if reply.tool_name:
+            stats.tool_calls += 1
+            message["tool_calls"] = [{"id": call_id, "type": "function", "function": {"name": reply.tool_name, "arguments": arguments}}]
+        return {"id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}], "usage": usage}
+
+    def chunk(delta: dict, finish=None) -> str:
+        return "data: " + json.dumps({"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                                      "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}) + "\n\n"
+
+    async def stream():
+        t0 = time.perf_counter()
+        sent = 0
+        # Tool arguments are streamed in small fragments, the way real providers do
+        arg_fragments = [arguments[i:i + 8] for i in range(0, len(arguments), 8)] if reply.tool_name else []
+        pacer.plan_midstream_failure(len(text_tokens) + len(arg_fragments))
+        try:
+            yield chunk({"role": "assistant", "content": ""})
+            for token in text_tokens:
+                await pacer.before_token(sent)
+                yield chunk({"content": token})
+                sent += 1
+            if reply.tool_name:
+                stats.tool_calls += 1
+                await pacer.before_token(sent)
+                yield chunk({"tool_calls": [{"index": 0, "id": call_id, "type": "function", "function": {"name": reply.tool_name, "arguments": ""}}]})
+                for fragment in arg_fragments:
+                    await pacer.before_token(sent)
+                    yield chunk({"tool_calls": [{"index": 0, "function": {"arguments": fragment}}]})
+                    sent += 1
+            yield chunk({}, finish_reason)
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield "data: " + json.dumps({"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model, "choices": [], "usage": usage}) + "\n\n"
+            yield "data: [DONE]\n\n"
+            stats.streams_completed += 1
+        except InjectedDisconnect:
+            logger.info("Injected mid-stream disconnect.")
+            raise
+        except asyncio.CancelledError:
+            # Client closed the HTTP stream (e.g. the gateway cancelled the turn)
+            stats.streams_cancelled += 1
+            stats.tokens_unsent_on_cancel += max(0, len(text_tokens) + len(arg_fragments) - sent)
+            raise
+        finally:
+            stats.tokens_sent += sent
+            stats.model_time_s += time.perf_counter() - t0
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
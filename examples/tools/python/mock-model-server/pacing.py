@@ -0,0 +1,99 @@
+import os
+import random
+import asyncio
+import itertools
+from typing import Optional
+
+FAILURE_MODES = ("error", "rate_limit", "disconnect", "stall")
+
+
+class InjectedDisconnect(Exception):
+    """Raised inside a streaming generator to drop the connection mid-response."""
+
+
+class PacingConfig:
+    """Token pacing and failure injection shared by every endpoint. Mutable at runtime via /mock/config."""
+    def __init__(self):
+        self.ttft_ms = float(os.getenv("MOCK_TTFT_MS", "300"))
+        self.tokens_per_s = float(os.getenv("MOCK_TOKENS_PER_S", "60"))
+        self.jitter_ms = float(os.getenv("MOCK_JITTER_MS", "0"))
+        self.failure_rate = float(os.getenv("MOCK_FAILURE_RATE", "0"))
+        self.failure_mode = os.getenv("MOCK_FAILURE_MODE", "error")
+        self.stall_ms = float(os.getenv("MOCK_STALL_MS", "5000"))
+        self.reply_tokens = int(os.getenv("MOCK_REPLY_TOKENS", "40"))
+        self.audio_ms_per_token = float(os.getenv("MOCK_AUDIO_MS_PER_TOKEN", "250"))
+        self.live_setup_ms = float(os.getenv("MOCK_LIVE_SETUP_MS", "0"))
+        self.seed = int(os.getenv("MOCK_SEED", "1234"))
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+    def update(self, values: dict) -> dict:
+        for key, value in values.items():
+            if key not in vars(self):
+                raise ValueError(f"Unknown pacing option: {key}")
+            if key == "failure_mode" and value not in FAILURE_MODES:
+                raise ValueError(f"failure_mode must be one of {FAILURE_MODES}")
+            setattr(self, key, type(getattr(self, key))(value))
+        return self.as_dict()
+
+
+class MockStats:
+    """Counters exposed on /mock/stats so benchmarks can separate model time from framework time."""
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.streams_completed = 0
+        self.streams_cancelled = 0
+        self.failures_injected = 0
+        self.tokens_sent = 0
+        self.tokens_unsent_on_cancel = 0
+        self.tool_calls = 0
+        self.live_sessions = 0
+        self.live_turns = 0
+        self.live_interruptions = 0
+        self.live_resumed = 0
+        self.live_resume_rejected = 0
+        self.model_time_s = 0.0
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+
+config = PacingConfig()
+stats = MockStats()
+_request_counter = itertools.count()
+
+
+class Pacer:
+    """Per-request pacing: sleeps for TTFT before the first token, then 1/tokens_per_s between tokens."""
+    def __init__(self, cfg: PacingConfig):
+        self.cfg = cfg
+        # Derive the per-request RNG from the seed so a run replays the same jitter and failures
+        self.rng = random.Random(cfg.seed * 1_000_003 + next(_request_counter))
+        self.started = False
+        self.failure: Optional[str] = cfg.failure_mode if self.rng.random() < cfg.failure_rate else None
+        self.fail_at_token: Optional[int] = None
+
+    def _jitter(self) -> float:
+        return self.rng.uniform(-self.cfg.jitter_ms, self.cfg.jitter_ms) / 1000 if self.cfg.jitter_ms else 0.0
+
+    def plan_midstream_failure(self, total_tokens: int):
+        if self.failure in ("disconnect", "stall"):
+            self.fail_at_token = max(1, total_tokens // 2)
+
+    async def before_token(self, index: int):
+        if not self.started:
+            self.started = True
+            await asyncio.sleep(max(0.0, self.cfg.ttft_ms / 1000 + self._jitter()))
+        elif self.cfg.tokens_per_s > 0:
+            await asyncio.sleep(max(0.0, 1 / self.cfg.tokens_per_s + self._jitter()))
+
+        if self.fail_at_token is not None and index == self.fail_at_token:
+            stats.failures_injected += 1
+            if self.failure == "stall":
+                await asyncio.sleep(self.cfg.stall_ms / 1000)
+            else:
+                raise InjectedDisconnect()
@@ -0,0 +1,134 @@
+"""
+Deterministic "model" behind every mock endpoint.
+
+It plays the Finny loan pre-approval script used by the example agents (slider -> term slots ->
+calculation + Yes/No slots -> appointment slots) and answers anything else with filler text of a
+configurable length. The same conversation therefore always produces the same tokens and tool calls,
+whichever framework or provider dialect asked for it.
+"""
+import re
+import json
+from typing import Optional
+
+TERM_SLOTS = ["12 Months", "24 Months", "36 Months"]
+OFFICER_SLOTS = ["Yes", "No"]
+APPOINTMENT_SLOTS = ["Tomorrow 10:00 AM", "Tomorrow 2:00 PM", "Next Monday 11:00 AM"]
+MOCK_APR = 0.079
+
+ANSWERED = "The user answered:"  # How widgets.py returns a widget answer as the tool result (ZIJUS_INTERACTIVE_TOOLS)
+
+FILLER = ("Zijus Bank offers flexible personal loans with clear terms and no hidden fees and our team is "
+          "happy to walk you through every option that fits your budget and timeline today").split()
+
+
+class Reply:
+    """What the mock model says: optional text followed by an optional single tool call."""
+    def __init__(self, text: str = "", tool_name: Optional[str] = None, tool_args: Optional[dict] = None):
+        self.text = text
+        self.tool_name = tool_name
+        self.tool_args = tool_args or {}
+
+
+def tokenize(text: str) -> list[str]:
+    """Splits text into word-sized streaming tokens that concatenate back to the original."""
+    return re.findall(r"\S+\s*|\s+", text)
+
+
+def filler_text(n_tokens: int) -> str:
+    return " ".join(FILLER[i % len(FILLER)] for i in range(max(1, n_tokens))) + "."
+
+
+def _find_tool(tools: dict[str, dict], keyword: str) -> Optional[str]:
+    for name in tools:
+        if keyword in name.lower():
+            return name
+    return None
+
+
+def _slider_args(schema: dict) -> dict:
+    props = schema.get("properties", {})
+    args = {"min_value": 1000, "max_value": 50000, "default_value": 10000}
+    if "content" in props or not props: args["content"] = "Desired Loan Amount"
+    return {k: v for k, v in args.items() if not props or k in props}
+
+
+def _slots_call(tools: dict[str, dict], slots: list[str]) -> tuple[Optional[str], dict]:
+    name = _find_tool(tools, "slot")
+    return name, ({"slots": slots} if name else {})
+
+
+def _monthly_payment(amount: float, months: int) -> float:
+    rate = MOCK_APR / 12
+    return amount * rate / (1 - (1 + rate) ** -months)
+
+
+def _tool_answer(content: str) -> Optional[str]:
+    """The widget answer in a tool result, or None for "wait for the user". Gemini results arrive as JSON."""
+    if content.startswith(ANSWERED): return content
+    try: found = [json.loads(content)]
+    except ValueError: return None
+    while found:
+        value = found.pop()
+        if isinstance(value, str) and value.startswith(ANSWERED): return value
+        if isinstance(value, dict): found.extend(value.values())
+        elif isinstance(value, list): found.extend(value)
+    return None
+
+
+def _user_value(text: str) -> str:
+    """Strips the '[User Submitted Widget]:' / 'The user answered:' wrapper and returns the submitted value."""
+    if text.startswith(("[User Submitted", ANSWERED)):
+        values = [line.split(":", 1)[-1].strip() for line in text.splitlines()[1:] if line.strip()]
+        return values[-1] if values else ""
+    return text.strip()
+
+
+def respond(messages: list[dict], tools: dict[str, dict], reply_tokens: int) -> Reply:
+    """
+    messages: [{"role": "user"|"assistant"|"tool"|"system", "content": str}] oldest first.
+    tools:    {tool_name: json_schema_of_parameters}
+    """
+    last = messages[-1] if messages else {"role": "user", "content": ""}
+    answers = {i: _tool_answer(m.get("content") or "") for i, m in enumerate(messages) if m["role"] == "tool"}
+    if last["role"] == "tool" and not answers[len(messages) - 1]:
+        # The widget tools tell the model to stop and wait for the user
+        return Reply(text="Please choose an option above.")
+
+    # In interactive mode the widget answer comes back as the tool result; route it like a widget submission
+    user_text = _user_value(answers.get(len(messages) - 1) or last.get("content") or "")
+    lowered = user_text.lower()
+    history = " ".join(answers.get(i) or m.get("content") or "" for i, m in enumerate(messages) if m["role"] == "user" or answers.get(i))
+
+    amount_match = re.fullmatch(r"\$?\s*([\d,]+)(\.\d+)?", user_text)
+    term_match = re.fullmatch(r"(\d+)\s+months?", lowered)
+
+    if term_match:
+        amounts = re.findall(r"(?<![\w.])\$?(\d{4,6})(?![\w])", history.replace(",", ""))
+        amount = float(amounts[-1]) if amounts else 10000.0
+        months = int(term_match.group(1))
+        payment = _monthly_payment(amount, months)
+        text = (f"Here is your estimate:\n\n| Amount | Term | APR | Monthly payment |\n|---|---|---|---|\n"
+                f"| ${amount:,.0f} | {months} months | {MOCK_APR:.1%} | **${payment:,.2f}** |\n\n"
+                f"Would you like to speak to a loan officer?")
+        name, args = _slots_call(tools, OFFICER_SLOTS)
+        return Reply(text, name, args)
+
+    if amount_match:
+        name, args = _slots_call(tools, TERM_SLOTS)
+        return Reply(f"Great, a ${float(amount_match.group(1).replace(',', '')):,.0f} loan. How long would you like to take to pay it back?", name, args)
+
+    if user_text == "Yes":
+        name, args = _slots_call(tools, APPOINTMENT_SLOTS)
+        return Reply("Pick a time that suits you.", name, args)
+
+    if user_text == "No":
+        return Reply("No problem. Thanks for chatting with Zijus Bank, have a great day!")
+
+    if user_text in APPOINTMENT_SLOTS:
+        return Reply(f"You're booked for {user_text}. A loan officer will call you then.")
+
+    if "loan" in lowered:
+        name = _find_tool(tools, "slider")
+        return Reply("Happy to help with your loan!", name, _slider_args(tools[name]) if name else {})
+
+    return Reply(filler_text(reply_tokens))
@@ -0,0 +1,398 @@
+"""
+Storage/background-work benchmark for the example backends.
+
+--target feedback: drives an example's feedback.py at a fixed event rate (default 10,000 events/s) from
+the event loop, exactly as the WebSocket handlers call it. It reports what submit() costs the loop, the
+worst loop stall, submit -> committed latency, and the write throughput the sink sustained.
+
+--target mail: drives an example's mail.py (spool + SMTP worker pool) against an in-process aiosmtpd
+server that can be made slow (--smtp-delay-ms) and flaky (--smtp-fail-rate, answered with 451). It
+reports enqueue latency, queue latency (enqueue -> accepted), SMTP time per message, retries, connection
+reuse and delivered messages per second.
+
+--target transcripts: streams chat traffic (a user message, DELTAS assistant deltas, a FinalMessage,
+round-robin over many sessions) through an example's transcripts.py recorder. It reports the recording
+cost per streamed message on the event loop, fsyncs and bytes written per second, and then reads every
+segment back to check that no record is missing.
+
+--target search: writes --messages synthetic transcript records (Zipf-distributed vocabulary, 50,000
+users, widget choices) as segments, backfills an example's search.py index from them, then times a
+query mix: a phrase (first page, and following next_before to the end), a common word, a user, user +
+word, a widget choice, a time window, a deep page and two rare words. It also times one incremental
+run over fresh live traffic.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import itertools
+import logging
+import sqlite3
+import argparse
+import random
+import socket
+import platform
+import tempfile
+import importlib.util
+from datetime import datetime, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_APP_DIR = os.path.normpath(os.path.join(HERE, "..", "..", "..", "agents", "python", "langchain"))
+
+
+def load_module(app_dir: str, filename: str):
+    spec = importlib.util.spec_from_file_location(f"bench_{filename[:-3]}_module", os.path.join(app_dir, filename))
+    module = importlib.util.module_from_spec(spec)  # type: ignore
+    spec.loader.exec_module(module)  # type: ignore
+    return module
+
+
+def pct(values: list, q: float):
+    if not values: return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def drive(rate: float, seconds: float, tick_ms: float, emit) -> dict:
+    """Calls emit(i) `rate` times per second for `seconds`, in bursts every tick_ms. Returns loop-side costs."""
+    loop = asyncio.get_running_loop()
+    per_tick = rate * tick_ms / 1000
+    start = loop.time()
+    emitted, owed, max_lag, emit_cpu = 0, 0.0, 0.0, 0.0
+    ticks = int(seconds * 1000 / tick_ms)
+    for tick in range(ticks):
+        due = start + tick * tick_ms / 1000
+        now = loop.time()
+        if now < due:
+            await asyncio.sleep(due - now)
+        max_lag = max(max_lag, loop.time() - due)
+        owed += per_tick
+        cpu = time.process_time()
+        while owed >= 1:
+            emit(emitted)
+            emitted += 1
+            owed -= 1
+        emit_cpu += time.process_time() - cpu
+    return {"emitted": emitted, "wall_s": loop.time() - start, "max_loop_lag_ms": max_lag * 1000, "emit_cpu_s": emit_cpu}
+
+
+async def bench_feedback(app_dir: str, rate: float, seconds: float, tick_ms: float, db_path: str) -> dict:
+    os.environ["ZIJUS_FEEDBACK_DB"] = db_path
+    feedback = load_module(app_dir, "feedback.py")
+    sink = feedback.FeedbackSink()
+    payload = {"type": "feedback", "m_id": "bench-message", "feedback": "positive"}
+
+    loop_side = await drive(rate, seconds, tick_ms, lambda i: sink.submit(payload, f"bench-{i % 1000}"))
+    backlog_at_end = len(sink.pending)
+    t_close = time.perf_counter()
+    await sink.close()
+    drain_s = time.perf_counter() - t_close
+
+    rows = sqlite3.connect(db_path).execute("SELECT COUNT(*) FROM feedback").fetchone()[0] if os.path.exists(db_path) else None
+    lag = list(sink.write_lag_s)
+    return {
+        "target": "feedback", "rate": rate, "seconds": seconds, "submitted": loop_side["emitted"],
+        "achieved_rate": round(loop_side["emitted"] / loop_side["wall_s"]),
+        "submit_us": round(loop_side["emit_cpu_s"] / max(1, loop_side["emitted"]) * 1e6, 2),
+        "max_loop_lag_ms": round(loop_side["max_loop_lag_ms"], 2),
+        "write_lag_ms": {"p50": round(pct(lag, 0.5) * 1000, 1), "p95": round(pct(lag, 0.95) * 1000, 1), "p99": round(pct(lag, 0.99) * 1000, 1)} if lag else None,
+        "backlog_at_end": backlog_at_end, "shutdown_drain_ms": round(drain_s * 1000, 1),
+        "rows": rows, "batches": sink.stats["batches"], "dropped": sink.stats["dropped"],
+        "written_per_s": round(sink.stats["written"] / (loop_side["wall_s"] + drain_s)),
+    }
+
+
+async def bench_transcripts(app_dir: str, rate: float, seconds: float, tick_ms: float, directory: str, sessions: int, deltas: int) -> dict:
+    os.environ["ZIJUS_TRANSCRIPT_DIR"] = directory
+    transcripts = load_module(app_dir, "transcripts.py")
+    log = transcripts.TranscriptLog()
+
+    async def delivered(msg: dict): pass
+    recorders = [log.session(f"bench-{n}", "bench") for n in range(sessions)]
+    sends = [recorder.tap(delivered) for recorder in recorders]
+    delta = {"source": "assistant", "type": "TextMessage", "content": "Sure, here is the next part of the answer. ", "stream_mode": "messages"}
+
+    def finish(coro):
+        """Runs a tapped send to completion inline (the stand-in socket never blocks), so drive() can time it."""
+        try: coro.send(None)
+        except StopIteration: pass
+
+    def emit(i: int):
+        # Message i belongs to session i % sessions; each session runs turns of 1 user message + deltas + final,
+        # with sessions out of phase so turns start and end all the time
+        n = i % len(recorders)
+        position = i // len(recorders) + n
+        step, m_id = position % (deltas + 2), f"a-{position // (deltas + 2)}"
+        if step == 0:
+            recorders[n].inbound({"type": "TextMessage", "content": "What would my monthly payment be over five years?", "m_id": f"u-{m_id}"})
+        elif step <= deltas:
+            finish(sends[n]({**delta, "m_id": m_id}))
+        else:
+            finish(sends[n]({"source": "assistant", "type": "FinalMessage", "m_id": m_id}))
+
+    loop_side = await drive(rate, seconds, tick_ms, emit)
+    for recorder in recorders: recorder.close()
+    t_close = time.perf_counter()
+    await log.close()
+    drain_s = time.perf_counter() - t_close
+    wall_s = loop_side["wall_s"] + drain_s
+
+    t_read = time.perf_counter()
+    read_back = sum(1 for name in sorted(os.listdir(directory)) for _ in transcripts.read_segment(os.path.join(directory, name)))
+    read_s = time.perf_counter() - t_read
+    return {
+        "target": "transcripts", "rate": rate, "seconds": seconds, "sessions": sessions, "messages": loop_side["emitted"],
+        "record_us": round(loop_side["emit_cpu_s"] / max(1, loop_side["emitted"]) * 1e6, 2),
+        "max_loop_lag_ms": round(loop_side["max_loop_lag_ms"], 2),
+        "records": log.stats["records"], "read_back": read_back, "segments": log.stats["segments"], "dropped": log.stats["dropped"],
+        "fsyncs_per_s": round(log.stats["fsyncs"] / wall_s, 1), "mb_per_s": round(log.stats["bytes"] / wall_s / 1e6, 2),
+        "bytes_per_record": round(log.stats["bytes"] / max(1, log.stats["records"])),
+        "read_records_per_s": round(read_back / max(read_s, 1e-9)),
+    }
+
+
+WIDGET_FIELDS = {"term": ["3 years", "5 years", "10 years"], "officer": ["Maria Lopez", "James Chen", "Aisha Khan"], "contact": ["email", "phone", "video call"]}
+DOMAIN_WORDS = "loan payment monthly rate interest term years officer appointment mortgage estimate balance deposit account card fee refund transfer credit score approval".split()
+
+
+def synthetic_transcripts(directory: str, messages: int, seed: int = 7, start_ms: int = 1_750_000_000_000, prefix: str = "transcript-bench") -> int:
+    """Writes ~`messages` searchable records (plus start records) as transcript segments. Returns records written."""
+    rng = random.Random(seed)
+    vocabulary = DOMAIN_WORDS + [f"w{n}" for n in range(30000)]
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))  # Zipf: a few words everywhere, most rare
+    os.makedirs(directory, exist_ok=True)
+    written, ts, segment, f = 0, start_ms, 0, None
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    while written < messages:
+        if f is None or f.tell() > 256 * 1024 * 1024:
+            if f: f.close()
+            f = open(os.path.join(directory, f"{prefix}-{segment:04d}.jsonl"), "w")
+            segment += 1
+        session, user = f"sess-{written}", f"user-{rng.randrange(50000)}"
+        lines = [dumps({"ts": ts, "s": session, "k": "start", "user": user})]
+        for turn in range(rng.randint(2, 6)):
+            ts += rng.randint(200, 5000)
+            words = rng.choices(vocabulary, cum_weights=cum_weights, k=rng.randint(5, 20) + rng.randint(20, 80))
+            split = rng.randint(5, 20)
+            lines.append(dumps({"ts": ts, "s": session, "k": "user", "m": f"u{turn}", "text": " ".join(words[:split])}))
+            lines.append(dumps({"ts": ts + 900, "s": session, "k": "assistant", "m": f"a{turn}", "text": " ".join(words[split:]), "status": "final", "ttft_ms": 400, "ms": 900}))
+            written += 2
+            if rng.random() < 0.3:
+                field = rng.choice(list(WIDGET_FIELDS))
+                lines.append(dumps({"ts": ts + 1500, "s": session, "k": "widget_event", "m": f"w{turn}", "payload": {field: rng.choice(WIDGET_FIELDS[field])}}))
+                written += 1
+        f.write("\n".join(lines) + "\n")
+    f.close()  # type: ignore
+    return written
+
+
+def bench_search(app_dir: str, messages: int, directory: str, db_path: str, queries: int) -> dict:
+    os.environ.update({"ZIJUS_TRANSCRIPT_DIR": directory, "ZIJUS_SEARCH_DB": db_path})
+    sys.path.insert(0, app_dir)  # search.py imports transcripts.py from its own directory
+    search = load_module(app_dir, "search.py")
+    index = search.TranscriptIndex(db_path, directory)
+
+    t_gen = time.perf_counter()
+    generated = synthetic_transcripts(directory, messages)
+    gen_s = time.perf_counter() - t_gen
+    t_ingest = time.perf_counter()
+    indexed = index.ingest()
+    ingest_s = time.perf_counter() - t_ingest
+
+    # Live traffic: a couple of seconds' worth of new records, indexed incrementally
+    live = synthetic_transcripts(directory, 10000, seed=99, start_ms=1_900_000_000_000, prefix="transcript-live")
+    t_live = time.perf_counter()
+    live_indexed = index.ingest()
+    live_s = time.perf_counter() - t_live
+
+    rng = random.Random(1)
+    db = sqlite3.connect(db_path)
+    max_id = db.execute("SELECT MAX(id) FROM messages").fetchone()[0]
+    def sample_text() -> str:  # Conversation text (a widget choice phrase matches a third of all sessions)
+        row = None
+        while row is None:
+            row = db.execute("SELECT text FROM messages WHERE id = ? AND kind IN ('user', 'assistant')", (rng.randrange(1, max_id),)).fetchone()
+        return row[0]
+    def phrase() -> str:
+        words = sample_text().split()
+        i = rng.randrange(max(1, len(words) - 2))
+        return '"' + " ".join(words[i:i + 3]) + '"'
+    page_20 = None
+    for _ in range(19):  # Cursor of the 20th page of a common word
+        page_20 = index._search("payment", "", "", "", None, None, page_20, 50)["next_before"]
+    def every_page() -> None:
+        query, before = phrase(), None
+        while True:
+            before = index._search(query, "", "", "", None, None, before, 50)["next_before"]
+            if before is None: return
+    span = db.execute("SELECT MIN(ts), MAX(ts) FROM messages").fetchone()
+    mix = {
+        "phrase": lambda: index._search(phrase(), "", "", "", None, None, None, 50),
+        "phrase, all pages": every_page,
+        "common word": lambda: index._search(rng.choice(["loan", "payment", "rate"]), "", "", "", None, None, None, 50),
+        "user": lambda: index._search("", f"user-{rng.randrange(50000)}", "", "", None, None, None, 50),
+        "user + word": lambda: index._search(rng.choice(["loan", "payment", "w50"]), f"user-{rng.randrange(50000)}", "", "", None, None, None, 50),
+        "widget choice": lambda: index._search('"10 years"', "", "widget_event", "", None, None, None, 50),
+        "time window": lambda: index._search("interest", "", "", "", (t := rng.randrange(span[0], span[1])), t + 3_600_000, None, 50),
+        "page 20": lambda: index._search("payment", "", "", "", None, None, page_20, 50),
+        "rare pair": lambda: index._search(f"w{rng.randrange(20000, 30000)} AND w{rng.randrange(20000, 30000)}", "", "", "", None, None, None, 50),
+    }
+    latency = {}
+    for name, run in mix.items():
+        took = []
+        for _ in range(queries):
+            t = time.perf_counter()
+            run()
+            took.append(time.perf_counter() - t)
+        latency[name] = {"p50": round(pct(took, 0.5) * 1000, 1), "p95": round(pct(took, 0.95) * 1000, 1), "max": round(max(took) * 1000, 1)}
+    db.close()
+    return {
+        "target": "search", "messages": indexed + live_indexed, "generated": generated + live,
+        "ingest_per_s": round(indexed / ingest_s), "ingest_s": round(ingest_s, 1), "generate_s": round(gen_s, 1),
+        "live_batch": live_indexed, "live_ms": round(live_s * 1000), "db_mb": round(os.path.getsize(db_path) / 1e6),
+        "segments_mb": round(sum(os.path.getsize(os.path.join(directory, n)) for n in os.listdir(directory)) / 1e6),
+        "query_ms": latency,
+    }
+
+
+class SMTPStandIn:
+    """aiosmtpd handler: accepts everything after delay_s, except a fail_rate share answered with a 451."""
+    def __init__(self, delay_s: float, fail_rate: float):
+        self.delay_s = delay_s
+        self.fail_rate = fail_rate
+        self.accepted = 0
+        self.refused = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.delay_s: await asyncio.sleep(self.delay_s)
+        if random.random() < self.fail_rate:
+            self.refused += 1
+            return "451 Try again later"
+        self.accepted += 1
+        return "250 OK"
+
+
+async def bench_mail(app_dir: str, rate: float, seconds: float, tick_ms: float, spool_dir: str, workers: int, smtp_delay_ms: float, smtp_fail_rate: float) -> dict:
+    from aiosmtpd.controller import Controller
+    server = SMTPStandIn(smtp_delay_ms / 1000, smtp_fail_rate)
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    controller = Controller(server, hostname="127.0.0.1", port=port)  # Own thread and event loop, like a real server
+    controller.start()
+    os.environ.update({
+        "ZIJUS_SMTP_HOST": "127.0.0.1", "ZIJUS_SMTP_PORT": str(port),
+        "ZIJUS_MAIL_SPOOL": spool_dir, "ZIJUS_MAIL_WORKERS": str(workers), "ZIJUS_MAIL_BACKOFF_S": os.getenv("ZIJUS_MAIL_BACKOFF_S", "0.1"),
+    })
+    mail = load_module(app_dir, "mail.py")
+    logging.getLogger(mail.__name__).setLevel(logging.ERROR)  # Retries are counted; don't log each one
+    queue = mail.MailQueue()
+    await queue.start()
+    enqueue_s: list = []
+    tasks: set = set()
+
+    async def send(i: int):
+        t = time.perf_counter()
+        await queue.enqueue({"content": "Hello!\n" * 20}, f"bench-{i}", f"user{i}@example.com")
+        enqueue_s.append(time.perf_counter() - t)
+
+    def emit(i: int):
+        task = asyncio.create_task(send(i))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    loop_side = await drive(rate, seconds, tick_ms, emit)
+    await asyncio.gather(*tasks)
+    t_drain = time.perf_counter()
+    while queue.stats["sent"] + queue.stats["failed"] < loop_side["emitted"] and time.perf_counter() - t_drain < 120:
+        await asyncio.sleep(0.05)
+    total_s = loop_side["wall_s"] + time.perf_counter() - t_drain
+    summary = queue.summary()
+    await queue.close()
+    controller.stop()
+    return {
+        "target": "mail", "rate": rate, "seconds": seconds, "workers": workers, "smtp_delay_ms": smtp_delay_ms, "smtp_fail_rate": smtp_fail_rate,
+        "enqueued": loop_side["emitted"], "max_loop_lag_ms": round(loop_side["max_loop_lag_ms"], 2),
+        "enqueue_ms": {"p50": round(pct(enqueue_s, 0.5) * 1000, 2), "p95": round(pct(enqueue_s, 0.95) * 1000, 2)} if enqueue_s else None,
+        "queue_latency_ms": summary["queue_latency_ms"], "smtp_ms": summary["smtp_ms"],
+        "sent": summary["sent"], "failed": summary["failed"], "retried": summary["retried"], "server_accepted": server.accepted,
+        "connections": summary["connections"], "sent_per_s": round(summary["sent"] / total_s, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of the examples' background storage paths.")
+    parser.add_argument("--target", choices=["feedback", "mail", "transcripts", "search"], default="feedback")
+    parser.add_argument("--app-dir", default=DEFAULT_APP_DIR, help="Example directory containing the module under test")
+    parser.add_argument("--rate", type=float, help="Events per second (default: 10000 feedback and transcripts, 200 mail)")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--tick-ms", type=float, default=1.0, help="Events are issued in bursts this far apart")
+    parser.add_argument("--db", help="SQLite file to write (default: a temporary file)")
+    parser.add_argument("--messages", type=int, default=1_000_000, help="Transcript messages to index (--target search)")
+    parser.add_argument("--queries", type=int, default=20, help="Runs per query type (--target search)")
+    parser.add_argument("--workers", type=int, default=4, help="Mail delivery workers (--target mail)")
+    parser.add_argument("--smtp-delay-ms", type=float, default=20, help="Time the SMTP stand-in takes per message (--target mail)")
+    parser.add_argument("--smtp-fail-rate", type=float, default=0.05, help="Share of messages answered with a 451 (--target mail)")
+    parser.add_argument("--sessions", type=int, default=500, help="Concurrent chat sessions (--target transcripts)")
+    parser.add_argument("--deltas", type=int, default=30, help="Streamed deltas per answer (--target transcripts)")
+    parser.add_argument("--dir", help="Transcript directory to write (--target transcripts, default: a temporary directory)")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+    rate = args.rate or (200 if args.target == "mail" else 10000)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.target == "search":
+            result = bench_search(args.app_dir, args.messages, args.dir or os.path.join(tmp, "transcripts"), args.db or os.path.join(tmp, "search.db"), args.queries)
+        elif args.target == "transcripts":
+            result = asyncio.run(bench_transcripts(args.app_dir, rate, args.seconds, args.tick_ms, args.dir or os.path.join(tmp, "transcripts"), args.sessions, args.deltas))
+        elif args.target == "mail":
+            result = asyncio.run(bench_mail(args.app_dir, rate, args.seconds, args.tick_ms, os.path.join(tmp, "spool"), args.workers, args.smtp_delay_ms, args.smtp_fail_rate))
+        else:
+            result = asyncio.run(bench_feedback(args.app_dir, rate, args.seconds, args.tick_ms, args.db or os.path.join(tmp, "bench.db")))
+
+    if args.target == "search":
+        print(f"\nsearch over {result['messages']} messages ({result['segments_mb']} MB of segments, index {result['db_mb']} MB)")
+        print(f"  backfill               {result['ingest_s']}s, {result['ingest_per_s']} messages/s")
+        print(f"  live increment         {result['live_batch']} messages in {result['live_ms']} ms")
+        print(f"  {'query':<22} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+        for name, took in result["query_ms"].items():
+            print(f"  {name:<22} {took['p50']:>8} {took['p95']:>8} {took['max']:>8}")
+    elif args.target == "transcripts":
+        print(f"\ntranscripts @ {rate:.0f} messages/s for {args.seconds:.0f}s ({result['messages']} messages, {args.sessions} sessions, {args.deltas} deltas per answer)")
+        print(f"  recording cost         {result['record_us']} us/message on the event loop")
+        print(f"  worst loop stall       {result['max_loop_lag_ms']} ms")
+        print(f"  written                {result['records']} records ({result['bytes_per_record']} B each) in {result['segments']} segment(s), {result['dropped']} dropped")
+        print(f"  disk                   {result['fsyncs_per_s']} fsyncs/s, {result['mb_per_s']} MB/s")
+        print(f"  read back              {result['read_back']} records, {result['read_records_per_s']}/s")
+    elif args.target == "mail":
+        print(f"\nmail @ {rate:.0f}/s for {args.seconds:.0f}s ({result['enqueued']} messages, {args.workers} workers, server {args.smtp_delay_ms:.0f}ms/msg, {args.smtp_fail_rate:.0%} 451s)")
+        print(f"  enqueue (spool write)  {result['enqueue_ms']} ms")
+        print(f"  worst loop stall       {result['max_loop_lag_ms']} ms")
+        print(f"  queue latency          {result['queue_latency_ms']} ms")
+        print(f"  SMTP per message       {result['smtp_ms']} ms")
+        print(f"  delivered              {result['sent']} ({result['server_accepted']} accepted by the server), {result['retried']} retries, {result['failed']} failed")
+        print(f"  connections opened     {result['connections']}")
+        print(f"  throughput             {result['sent_per_s']} messages/s")
+    else:
+        print(f"\nfeedback @ {rate:.0f}/s for {args.seconds:.0f}s ({result['submitted']} events)")
+        print(f"  achieved submit rate   {result['achieved_rate']}/s")
+        print(f"  submit() cost          {result['submit_us']} us/event on the event loop")
+        print(f"  worst loop stall       {result['max_loop_lag_ms']} ms")
+        print(f"  submit -> committed    {result['write_lag_ms']} ms")
+        print(f"  written                {result['rows']} rows in {result['batches']} batches, {result['written_per_s']}/s sustained")
+        print(f"  backlog at end         {result['backlog_at_end']} (drained in {result['shutdown_drain_ms']} ms on close), {result['dropped']} dropped")
+
+    if args.json:
+        report = {
+            "ts": datetime.now(timezone.utc).isoformat(),
+            "host": {"python": sys.version.split()[0], "machine": platform.machine(), "cpus": os.cpu_count()},
+            "results": [result],
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()